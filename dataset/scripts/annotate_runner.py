@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Runner concorrente de anotação com o cliente assíncrono da Anthropic.
+
+- `concurrency` workers consumindo uma fila: no máximo esse número de
+  imagens codificadas em memória e de chamadas em voo
+- retries próprios (o SDK roda com max_retries=0) para 429, 408, 409,
+  5xx/529 e erros de conexão: backoff exponencial com jitter completo,
+  respeitando o header retry-after quando vem
+- cada resposta vai para o annotation_store assim que chega: uma
+  execução interrompida continua de onde parou (o planejamento em
+  annotation_store.py só devolve o que ainda não tem resposta)
+- checkpoint JSONL (uma linha por imagem concluída ou que falhou) com
+  as métricas de cada imagem, usado por --skip-failed
+- resumo de throughput: imagens/min, latência p50/p95, tentativas,
+  retries por motivo e tokens
+
+Para testar sem API, suba o stub (stub_messages_server.py) e aponte
+--base-url para ele.
+
+Uso:
+    python auto_annotate.py --concurrency 16
+    python stub_messages_server.py --port 8765 --rate-limit-every 7 &
+    python auto_annotate.py --base-url http://localhost:8765 --api-key stub
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import anthropic
+
+from annotation_store import AnnotationStore, materialize
+from auto_annotate import MAX_TOKENS, MODEL, build_messages
+from image_encoder import EncodeOptions
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+@dataclass
+class AnnotationResult:
+    image: str
+    status: str  # ok | failed
+    attempts: int = 0
+    seconds: float = 0.0
+    components: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    original_bytes: int = 0
+    encoded_bytes: int = 0
+    image_tokens_before: int = 0
+    image_tokens_after: int = 0
+    error: str = ""
+    retries: Dict[str, int] = field(default_factory=dict)
+
+
+class Checkpoint:
+    """Log JSONL de imagens processadas; a última linha de cada imagem vale."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: Dict[str, Dict] = {}
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # linha truncada por interrupção
+                    self.done[entry["image"]] = entry
+        self._file = None
+
+    def failed(self, image: str) -> bool:
+        entry = self.done.get(image)
+        return entry is not None and entry["status"] == "failed"
+
+    def record(self, result: AnnotationResult):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(asdict(result)) + "\n")
+        self._file.flush()
+        self.done[result.image] = asdict(result)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Jitter completo sobre backoff exponencial; nunca antes do retry-after."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_after(error: anthropic.APIStatusError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def annotate_one(
+    client: anthropic.AsyncAnthropic,
+    image_path: Path,
+    image_sha256: str,
+    annotations_dir: Path,
+    store: AnnotationStore,
+    max_retries: int,
+    backoff: float,
+    max_backoff: float,
+    encode_options: EncodeOptions = EncodeOptions(),
+) -> AnnotationResult:
+    result = AnnotationResult(image=image_path.name, status="failed")
+    start = time.perf_counter()
+    # Decodificação, redução e base64 fora do loop de eventos
+    messages, encoded = await asyncio.to_thread(build_messages, image_path, encode_options)
+    result.original_bytes = encoded.original_bytes
+    result.encoded_bytes = encoded.encoded_bytes
+    result.image_tokens_before = encoded.tokens_before
+    result.image_tokens_after = encoded.tokens_after
+
+    for attempt in range(max_retries + 1):
+        result.attempts = attempt + 1
+        retry_after = None
+        try:
+            message = await client.messages.create(model=MODEL, max_tokens=MAX_TOKENS, messages=messages)
+        except anthropic.APIStatusError as e:
+            if e.status_code not in RETRYABLE_STATUS:
+                result.error = f"HTTP {e.status_code}: {e.message}"
+                break
+            reason = f"http_{e.status_code}"
+            retry_after = _retry_after(e)
+            result.error = f"HTTP {e.status_code}"
+        except anthropic.APIConnectionError as e:
+            reason = "timeout" if isinstance(e, anthropic.APITimeoutError) else "connection"
+            result.error = f"{reason}: {e}"
+        else:
+            # Resposta bruta no store antes do parse: um erro de parse não perde a chamada
+            entry = await asyncio.to_thread(
+                store.record, image_path, image_sha256, message.content[0].text, encoded.width, encoded.height,
+                message.usage.input_tokens, message.usage.output_tokens,
+            )
+            annotation = await asyncio.to_thread(materialize, entry, image_path, annotations_dir)
+            result.status = "ok"
+            result.error = ""
+            result.components = len(annotation["annotations"])
+            result.input_tokens = message.usage.input_tokens
+            result.output_tokens = message.usage.output_tokens
+            break
+
+        result.retries[reason] = result.retries.get(reason, 0) + 1
+        if attempt < max_retries:
+            await asyncio.sleep(backoff_delay(attempt, backoff, max_backoff, retry_after))
+
+    result.seconds = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def run_annotations(
+    images: List[Path],
+    annotations_dir: Path,
+    checkpoint_path: Path,
+    store: AnnotationStore,
+    sha256: Dict[Path, str],
+    concurrency: int = 8,
+    max_retries: int = 6,
+    backoff: float = 1.0,
+    max_backoff: float = 60.0,
+    timeout: float = 120.0,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    retry_failed: bool = True,
+    encode_options: EncodeOptions = EncodeOptions(),
+) -> List[AnnotationResult]:
+    """Anota as imagens com até `concurrency` chamadas simultâneas."""
+    checkpoint = Checkpoint(checkpoint_path)
+    # O que já foi anotado não chega aqui (está no store); o checkpoint só filtra falhas
+    pending = [image for image in images if retry_failed or not checkpoint.failed(image.name)]
+    skipped = len(images) - len(pending)
+    if skipped:
+        print(f"  ⏭ {skipped} imagens que falharam antes (--skip-failed)")
+
+    client = anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+    queue: asyncio.Queue = asyncio.Queue()
+    for image in pending:
+        queue.put_nowait(image)
+    results: List[AnnotationResult] = []
+    start = time.perf_counter()
+
+    async def worker():
+        while not queue.empty():
+            image_path = queue.get_nowait()
+            try:
+                result = await annotate_one(
+                    client, image_path, sha256[image_path], annotations_dir, store,
+                    max_retries, backoff, max_backoff, encode_options,
+                )
+            except Exception as e:  # imagem ilegível, resposta malformada...
+                result = AnnotationResult(image=image_path.name, status="failed", error=f"{type(e).__name__}: {e}")
+            checkpoint.record(result)
+            results.append(result)
+            done = len(results)
+            if result.status == "ok":
+                print(f"  ✓ [{done}/{len(pending)}] {result.image}: {result.components} componentes "
+                      f"({result.seconds:.1f}s, {result.attempts} tentativa(s), "
+                      f"{result.original_bytes / 1024:.0f} -> {result.encoded_bytes / 1024:.0f} KB)")
+            else:
+                print(f"  ✗ [{done}/{len(pending)}] {result.image}: {result.error}")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+    finally:
+        checkpoint.close()
+        await client.close()
+
+    print_summary(results, time.perf_counter() - start, concurrency)
+    return results
+
+
+def print_summary(results: List[AnnotationResult], elapsed: float, concurrency: int):
+    ok = [r for r in results if r.status == "ok"]
+    failed = len(results) - len(ok)
+    latencies = sorted(r.seconds for r in ok)
+    retries = Counter()
+    for r in results:
+        retries.update(r.retries)
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+    print("\n" + "=" * 50)
+    print(f"✅ {len(ok)} anotadas, ✗ {failed} falhas em {elapsed:.1f}s (concorrência {concurrency})")
+    if elapsed > 0:
+        print(f"  ⏱ {len(ok) / elapsed * 60:.1f} imagens/min, latência p50={pct(0.5):.1f}s p95={pct(0.95):.1f}s")
+    print(f"  🔄 {sum(r.attempts for r in results)} chamadas; retries: "
+          + (", ".join(f"{k}={v}" for k, v in sorted(retries.items())) or "nenhum"))
+    print(f"  Tokens: {sum(r.input_tokens for r in ok)} entrada, {sum(r.output_tokens for r in ok)} saída")
+    before = sum(r.original_bytes for r in results)
+    if before:
+        after = sum(r.encoded_bytes for r in results)
+        print(f"  💾 Imagens: {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB enviados "
+              f"({(1 - after / before) * 100:.0f}% menor), ~{sum(r.image_tokens_before for r in results)} -> "
+              f"~{sum(r.image_tokens_after for r in results)} tokens de imagem")
+    print("=" * 50)
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Formato colunar das anotações do dataset inteiro (arquivos .npy).
+
+annotations/ tem dois arquivos por imagem (JSON do Claude e .txt YOLO)
+e todo consumidor reinterpreta texto. Aqui cada coluna é um .npy em
+annotation_columns/, carregado com mmap: abrir 1M de boxes não lê nada
+além do cabeçalho, e as consultas são operações NumPy sobre as colunas.
+
+Tabela de boxes (uma linha por box distinto):
+    image (int32), class_id (int16), bbox (float64 x4, YOLO normalizado),
+    bbox_pixels (int32 x4), confidence (float64, NaN se não houver),
+    flags (uint8), ann_id (int32, id no JSON), txt_order (int32, linha no
+    .txt ou -1), category (uint16, código em meta.json), label (texto
+    UTF-8 em label_data + label_offsets)
+
+flags diz onde o box existe: IN_JSON, IN_TXT (e AUTO_ANNOTATED). Um box
+corrigido por fix_annotations.py vira duas linhas: a original (só
+IN_JSON) e a corrigida (só IN_TXT). Treino usa IN_TXT.
+
+Tabela de conexões: image, from_id, to_id, protocol (código),
+bidirectional.
+
+A conversão é nos dois sentidos e exata: export() regera os .json e
+.txt byte a byte. Registros fora do formato usual (campos extras) vão
+inteiros em meta.json, assim como o texto dos .txt que não saem iguais
+do formato "%d %.6f ..." sem quebra de linha final (escritos à mão,
+com linhas fora do padrão ou outra precisão); esses são regravados como
+estavam, e as colunas guardam só as linhas de 5 campos que deu para ler.
+
+Uso:
+    python annotation_columns.py                 # Converte annotations/ e mostra estatísticas
+    python annotation_columns.py --stats         # Só estatísticas (mmap)
+    python annotation_columns.py --export DIR    # Regera .json/.txt em DIR
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent.parent
+ANNOTATIONS_DIR = BASE_DIR / "annotations"
+COLUMNS_DIR = BASE_DIR / "annotation_columns"
+FORMAT_VERSION = 2
+
+IN_JSON = 1
+IN_TXT = 2
+AUTO_ANNOTATED = 4
+
+BOX_COLUMNS = {
+    "image": np.int32,
+    "class_id": np.int16,
+    "bbox": np.float64,
+    "bbox_pixels": np.int32,
+    "confidence": np.float64,
+    "flags": np.uint8,
+    "ann_id": np.int32,
+    "txt_order": np.int32,
+    "category": np.uint16,
+    "label_offsets": np.int64,
+    "label_data": np.uint8,
+}
+CONNECTION_COLUMNS = {
+    "image": np.int32,
+    "from_id": np.int32,
+    "to_id": np.int32,
+    "protocol": np.uint16,
+    "bidirectional": np.bool_,
+}
+
+_ANNOTATION_KEYS = ["id", "category_id", "category_name", "bbox", "bbox_pixels", "confidence", "attributes"]
+_CONNECTION_KEYS = ["from_id", "to_id", "protocol", "bidirectional"]
+
+
+def source_signature(annotations_dir: Path) -> str:
+    """Número de arquivos e maior mtime de annotations/ (detecta conversão desatualizada)."""
+    count, latest = 0, 0
+    if annotations_dir.exists():
+        with os.scandir(annotations_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith((".json", ".txt")):
+                    count += 1
+                    latest = max(latest, entry.stat().st_mtime_ns)
+    return f"{count}:{latest}"
+
+
+def _canonical_annotation(ann: Dict) -> bool:
+    """True se o box cabe nas colunas sem perda (formato gerado por auto_annotate)."""
+    attributes = ann.get("attributes")
+    return (
+        list(ann) == _ANNOTATION_KEYS
+        and isinstance(ann["id"], int)
+        and isinstance(ann["category_id"], int)
+        and isinstance(ann["category_name"], str)
+        and len(ann["bbox"]) == 4 and all(type(v) is float for v in ann["bbox"])
+        and len(ann["bbox_pixels"]) == 4 and all(type(v) is int for v in ann["bbox_pixels"])
+        and type(ann["confidence"]) is float
+        and isinstance(attributes, dict)
+        and list(attributes) == ["label", "auto_annotated"]
+        and isinstance(attributes["label"], str)
+        and isinstance(attributes["auto_annotated"], bool)
+    )
+
+
+def _canonical_connection(conn: Dict) -> bool:
+    return (
+        list(conn) == _CONNECTION_KEYS
+        and isinstance(conn["from_id"], int)
+        and isinstance(conn["to_id"], int)
+        and (conn["protocol"] is None or isinstance(conn["protocol"], str))
+        and isinstance(conn["bidirectional"], bool)
+    )
+
+
+def _read_txt(text: str) -> List[Tuple[int, List[float]]]:
+    rows = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 5:
+            rows.append((int(float(parts[0])), [float(v) for v in parts[1:]]))
+    return rows
+
+
+def _format_txt(rows) -> str:
+    """Texto do .txt no formato gerado por auto_annotate (linhas class x y w h)."""
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+    return "\n".join(["%d %.6f %.6f %.6f %.6f"] * len(rows)) % tuple(rows.ravel().tolist())
+
+
+class _Builder:
+    """Acumula linhas em listas Python e converte para colunas no fim."""
+
+    def __init__(self):
+        self.boxes: Dict[str, list] = {name: [] for name in BOX_COLUMNS if not name.startswith("label_")}
+        self.labels: List[bytes] = []
+        self.connections: Dict[str, list] = {name: [] for name in CONNECTION_COLUMNS}
+        self.categories: Dict[str, int] = {}
+        self.protocols: Dict[Optional[str], int] = {}  # None: protocolo não informado
+        self.raw_boxes: Dict[str, Dict] = {}
+        self.raw_connections: Dict[str, Dict] = {}
+        self.raw_txt: Dict[str, str] = {}  # stem -> texto do .txt fora do formato usual
+
+    def _code(self, vocab: Dict[Optional[str], int], value: Optional[str]) -> int:
+        return vocab.setdefault(value, len(vocab))
+
+    def add_box(self, image: int, class_id: int, bbox, flags: int, txt_order: int = -1, ann: Optional[Dict] = None):
+        row = len(self.labels)
+        canonical = ann is not None and _canonical_annotation(ann)
+        if ann is not None and not canonical:
+            self.raw_boxes[str(row)] = ann
+        b = self.boxes
+        b["image"].append(image)
+        b["class_id"].append(class_id)
+        b["bbox"].append(bbox)
+        b["txt_order"].append(txt_order)
+        if canonical:
+            flags |= AUTO_ANNOTATED if ann["attributes"]["auto_annotated"] else 0
+            b["bbox_pixels"].append(ann["bbox_pixels"])
+            b["confidence"].append(ann["confidence"])
+            b["ann_id"].append(ann["id"])
+            b["category"].append(self._code(self.categories, ann["category_name"]))
+            self.labels.append(ann["attributes"]["label"].encode("utf-8"))
+        else:
+            b["bbox_pixels"].append([0, 0, 0, 0])
+            b["confidence"].append(float("nan"))
+            b["ann_id"].append(-1)
+            b["category"].append(0)
+            self.labels.append(b"")
+        b["flags"].append(flags)
+
+    def add_connection(self, image: int, conn: Dict):
+        row = len(self.connections["image"])
+        c = self.connections
+        c["image"].append(image)
+        if _canonical_connection(conn):
+            c["from_id"].append(conn["from_id"])
+            c["to_id"].append(conn["to_id"])
+            c["protocol"].append(self._code(self.protocols, conn["protocol"]))
+            c["bidirectional"].append(conn["bidirectional"])
+        else:
+            self.raw_connections[str(row)] = conn
+            c["from_id"].append(-1)
+            c["to_id"].append(-1)
+            c["protocol"].append(0)
+            c["bidirectional"].append(False)
+
+    def columns(self) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        boxes = {}
+        for name, dtype in BOX_COLUMNS.items():
+            if name.startswith("label_"):
+                continue
+            width = 4 if name in ("bbox", "bbox_pixels") else None
+            values = self.boxes[name]
+            boxes[name] = np.array(values, dtype=dtype).reshape(-1, 4) if width else np.array(values, dtype=dtype)
+        lengths = np.fromiter((len(label) for label in self.labels), dtype=np.int64, count=len(self.labels))
+        boxes["label_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        boxes["label_data"] = np.frombuffer(b"".join(self.labels), dtype=np.uint8)
+        connections = {name: np.array(values, dtype=dtype) for name, (values, dtype) in
+                       ((n, (self.connections[n], t)) for n, t in CONNECTION_COLUMNS.items())}
+        return boxes, connections
+
+
+def _match_txt(json_boxes: List[Dict], txt_rows: List[Tuple[int, List[float]]]) -> Tuple[Dict[int, int], List[int]]:
+    """
+    Casa linhas do .txt com boxes do JSON (mesma classe e bbox na precisão
+    de 6 casas do .txt). Retorna (índice no JSON -> linha do .txt, linhas
+    do .txt sem par).
+    """
+    free: Dict[Tuple, List[int]] = {}
+    for order, (class_id, bbox) in enumerate(txt_rows):
+        free.setdefault((class_id, *(f"{v:.6f}" for v in bbox)), []).append(order)
+    matched = {}
+    for index, ann in enumerate(json_boxes):
+        bbox = ann.get("bbox")
+        if not isinstance(bbox, list) or len(bbox) != 4:
+            continue
+        key = (ann.get("category_id"), *(f"{v:.6f}" for v in bbox))
+        if free.get(key):
+            matched[index] = free[key].pop(0)
+    used = set(matched.values())
+    return matched, [order for order in range(len(txt_rows)) if order not in used]
+
+
+def build(annotations_dir: Path = ANNOTATIONS_DIR, output_dir: Path = COLUMNS_DIR) -> Dict:
+    """Converte annotations/*.json e *.txt para o formato colunar."""
+    start = time.perf_counter()
+    signature = source_signature(annotations_dir)
+    stems = sorted({p.stem for p in annotations_dir.glob("*.json")} | {p.stem for p in annotations_dir.glob("*.txt")})
+
+    builder = _Builder()
+    images = []
+    widths, heights = [], []
+    for image, stem in enumerate(stems):
+        json_path = annotations_dir / f"{stem}.json"
+        txt_path = annotations_dir / f"{stem}.txt"
+        data = json.loads(json_path.read_text()) if json_path.exists() else None
+        txt_rows = []
+        if txt_path.exists():
+            # Bytes: read_text() trocaria \r\n por \n e a comparação não veria a diferença
+            txt_text = txt_path.read_bytes().decode("utf-8")
+            txt_rows = _read_txt(txt_text)
+            if _format_txt([[class_id, *bbox] for class_id, bbox in txt_rows]) != txt_text:
+                builder.raw_txt[stem] = txt_text
+
+        header = None
+        json_boxes = []
+        if data is not None:
+            json_boxes = data.get("annotations", [])
+            # Mantém a ordem das chaves; annotations/connections vêm das colunas
+            header = {key: (None if key in ("annotations", "connections") else value) for key, value in data.items()}
+        images.append({"stem": stem, "json": header, "txt": txt_path.exists()})
+        widths.append(data.get("width", -1) if data else -1)
+        heights.append(data.get("height", -1) if data else -1)
+
+        matched, txt_only = _match_txt(json_boxes, txt_rows)
+        for index, ann in enumerate(json_boxes):
+            txt_order = matched.get(index, -1)
+            flags = IN_JSON | (IN_TXT if txt_order >= 0 else 0)
+            class_id = ann.get("category_id", -1) if isinstance(ann.get("category_id"), int) else -1
+            bbox = ann.get("bbox") if isinstance(ann.get("bbox"), list) and len(ann["bbox"]) == 4 else [0.0] * 4
+            builder.add_box(image, class_id, bbox, flags, txt_order, ann)
+        for order in txt_only:
+            class_id, bbox = txt_rows[order]
+            builder.add_box(image, class_id, bbox, IN_TXT, order)
+        if data is not None:
+            for conn in data.get("connections", []):
+                builder.add_connection(image, conn)
+
+    boxes, connections = builder.columns()
+    meta = {
+        "version": FORMAT_VERSION,
+        "source_signature": signature,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_images": len(images),
+        "n_boxes": int(len(boxes["image"])),
+        "n_connections": int(len(connections["image"])),
+        "categories": list(builder.categories),
+        "protocols": list(builder.protocols),
+        "raw_boxes": builder.raw_boxes,
+        "raw_connections": builder.raw_connections,
+        "raw_txt": builder.raw_txt,
+    }
+
+    partial = output_dir.with_name(output_dir.name + ".part")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+    for name, array in boxes.items():
+        np.save(partial / f"boxes_{name}.npy", array)
+    for name, array in connections.items():
+        np.save(partial / f"connections_{name}.npy", array)
+    np.save(partial / "images_width.npy", np.array(widths, dtype=np.int32))
+    np.save(partial / "images_height.npy", np.array(heights, dtype=np.int32))
+    (partial / "images.json").write_text(json.dumps(images, ensure_ascii=False))
+    (partial / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+
+    # Troca o diretório inteiro de uma vez
+    old = output_dir.with_name(output_dir.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if output_dir.exists():
+        output_dir.replace(old)
+    partial.replace(output_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+    return {
+        "images": meta["n_images"],
+        "boxes": meta["n_boxes"],
+        "connections": meta["n_connections"],
+        "raw": len(builder.raw_boxes) + len(builder.raw_connections),
+        "raw_txt": len(builder.raw_txt),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+class AnnotationColumns:
+    """Anotações carregadas do formato colunar (colunas em mmap)."""
+
+    def __init__(self, path: Path = COLUMNS_DIR, mmap: bool = True):
+        self.path = path
+        mode = "r" if mmap else None
+        self.meta = json.loads((path / "meta.json").read_text())
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Versão {self.meta['version']} do formato colunar não suportada")
+        self.boxes = {name: np.load(path / f"boxes_{name}.npy", mmap_mode=mode) for name in BOX_COLUMNS}
+        self.connections = {
+            name: np.load(path / f"connections_{name}.npy", mmap_mode=mode) for name in CONNECTION_COLUMNS
+        }
+        self.image_width = np.load(path / "images_width.npy", mmap_mode=mode)
+        self.image_height = np.load(path / "images_height.npy", mmap_mode=mode)
+        self._images: Optional[List[Dict]] = None
+        self._box_offsets: Optional[np.ndarray] = None
+        self._connection_offsets: Optional[np.ndarray] = None
+
+    @property
+    def images(self) -> List[Dict]:
+        """stem, cabeçalho do JSON e presença do .txt por imagem (lido sob demanda)."""
+        if self._images is None:
+            self._images = json.loads((self.path / "images.json").read_text())
+        return self._images
+
+    def __len__(self) -> int:
+        return self.meta["n_boxes"]
+
+    def _offsets(self, column: np.ndarray) -> np.ndarray:
+        # Linhas ordenadas por imagem: a imagem i ocupa [offsets[i], offsets[i + 1])
+        return np.searchsorted(column, np.arange(self.meta["n_images"] + 1))
+
+    def box_rows(self, image: int) -> slice:
+        if self._box_offsets is None:
+            self._box_offsets = self._offsets(self.boxes["image"])
+        return slice(int(self._box_offsets[image]), int(self._box_offsets[image + 1]))
+
+    def connection_rows(self, image: int) -> slice:
+        if self._connection_offsets is None:
+            self._connection_offsets = self._offsets(self.connections["image"])
+        return slice(int(self._connection_offsets[image]), int(self._connection_offsets[image + 1]))
+
+    def label(self, row: int) -> str:
+        offsets = self.boxes["label_offsets"]
+        return bytes(self.boxes["label_data"][offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def mask(self, flag: int) -> np.ndarray:
+        return (self.boxes["flags"] & flag) != 0
+
+    def class_counts(self, flag: int = IN_TXT) -> Dict[int, int]:
+        """Boxes por classe (padrão: os do .txt, que vão para o treino)."""
+        classes = self.boxes["class_id"][self.mask(flag)]
+        counts = np.bincount(classes[classes >= 0])
+        return {int(c): int(n) for c, n in enumerate(counts) if n}
+
+    def yolo_labels(self, image: int) -> np.ndarray:
+        """(n, 5) class x y w h da imagem, na ordem do .txt."""
+        rows = self.box_rows(image)
+        in_txt = (self.boxes["flags"][rows] & IN_TXT) != 0
+        order = np.argsort(self.boxes["txt_order"][rows][in_txt], kind="stable")
+        classes = self.boxes["class_id"][rows][in_txt][order]
+        return np.column_stack([classes, self.boxes["bbox"][rows][in_txt][order]])
+
+    def annotation(self, image: int) -> Optional[Dict]:
+        """Reconstrói o JSON original da imagem (None se ela só tem .txt)."""
+        header = self.images[image]["json"]
+        if header is None:
+            return None
+        b, c = self.boxes, self.connections
+        categories, protocols = self.meta["categories"], self.meta["protocols"]
+        raw_boxes, raw_connections = self.meta["raw_boxes"], self.meta["raw_connections"]
+
+        annotations = []
+        for row in range(*self.box_rows(image).indices(len(self))):
+            if not b["flags"][row] & IN_JSON:
+                continue
+            if str(row) in raw_boxes:
+                annotations.append(raw_boxes[str(row)])
+                continue
+            annotations.append({
+                "id": int(b["ann_id"][row]),
+                "category_id": int(b["class_id"][row]),
+                "category_name": categories[b["category"][row]],
+                "bbox": b["bbox"][row].tolist(),
+                "bbox_pixels": b["bbox_pixels"][row].tolist(),
+                "confidence": float(b["confidence"][row]),
+                "attributes": {
+                    "label": self.label(row),
+                    "auto_annotated": bool(b["flags"][row] & AUTO_ANNOTATED),
+                },
+            })
+        connections = []
+        for row in range(*self.connection_rows(image).indices(self.meta["n_connections"])):
+            if str(row) in raw_connections:
+                connections.append(raw_connections[str(row)])
+                continue
+            connections.append({
+                "from_id": int(c["from_id"][row]),
+                "to_id": int(c["to_id"][row]),
+                "protocol": protocols[c["protocol"][row]],
+                "bidirectional": bool(c["bidirectional"][row]),
+            })
+
+        data = dict(header)
+        if "annotations" in data:
+            data["annotations"] = annotations
+        if "connections" in data:
+            data["connections"] = connections
+        return data
+
+
+def export(table: AnnotationColumns, annotations_dir: Path, only_changed: bool = True) -> Dict[str, int]:
+    """Regera {stem}.json e {stem}.txt; com only_changed, só grava o que difere do disco."""
+    annotations_dir.mkdir(parents=True, exist_ok=True)
+    raw_txt = table.meta["raw_txt"]
+    written = {"json": 0, "txt": 0, "unchanged": 0}
+    for image, entry in enumerate(table.images):
+        outputs = []
+        data = table.annotation(image)
+        if data is not None:
+            outputs.append(("json", annotations_dir / f"{entry['stem']}.json", json.dumps(data, indent=2)))
+        if entry["txt"]:
+            text = raw_txt.get(entry["stem"])
+            if text is None:
+                text = _format_txt(table.yolo_labels(image))
+            outputs.append(("txt", annotations_dir / f"{entry['stem']}.txt", text))
+        for kind, path, text in outputs:
+            content = text.encode("utf-8")
+            if only_changed and path.exists() and path.read_bytes() == content:
+                written["unchanged"] += 1
+                continue
+            path.write_bytes(content)
+            written[kind] += 1
+    return written
+
+
+def load(
+    path: Path = COLUMNS_DIR,
+    annotations_dir: Optional[Path] = ANNOTATIONS_DIR,
+    mmap: bool = True,
+) -> AnnotationColumns:
+    """Abre o formato colunar, convertendo antes se annotations/ mudou desde a última conversão."""
+    meta_path = path / "meta.json"
+    if annotations_dir is not None:
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        # Conversões de outra versão do formato também são refeitas
+        stale = meta.get("version") != FORMAT_VERSION or (
+            meta.get("source_signature") != source_signature(annotations_dir)
+        )
+        if stale:
+            build(annotations_dir, path)
+    return AnnotationColumns(path, mmap)
+
+
+def print_stats(table: AnnotationColumns):
+    n_txt = int(table.mask(IN_TXT).sum())
+    n_json = int(table.mask(IN_JSON).sum())
+    print(f"  📊 {table.meta['n_images']} imagens, {len(table)} boxes ({n_json} no JSON, {n_txt} no .txt), "
+          f"{table.meta['n_connections']} conexões")
+    confidence = np.asarray(table.boxes["confidence"])
+    if np.isfinite(confidence).any():
+        print(f"  Confiança média: {np.nanmean(confidence):.3f}")
+    counts = table.class_counts()
+    if counts:
+        top = sorted(counts.items(), key=lambda item: -item[1])[:10]
+        print("  Classes (.txt): " + ", ".join(f"{c}={n}" for c, n in top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Formato colunar (.npy) das anotações")
+    parser.add_argument("--annotations", type=Path, default=ANNOTATIONS_DIR, help="Diretório com .json/.txt")
+    parser.add_argument("--output", type=Path, default=COLUMNS_DIR, help="Diretório do formato colunar")
+    parser.add_argument("--stats", action="store_true", help="Só abrir (mmap) e mostrar estatísticas")
+    parser.add_argument("--export", type=Path, help="Regerar .json/.txt neste diretório")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Columnar Annotations")
+    print("=" * 50)
+
+    if not args.stats and not args.export:
+        stats = build(args.annotations, args.output)
+        print(f"  💾 {stats['images']} imagens, {stats['boxes']} boxes, {stats['connections']} conexões "
+              f"em {stats['seconds']}s -> {args.output}")
+        if stats["raw"]:
+            print(f"  ⚠ {stats['raw']} registros fora do formato usual guardados inteiros em meta.json")
+        if stats["raw_txt"]:
+            print(f"  ⚠ {stats['raw_txt']} .txt fora do formato usual guardados como texto em meta.json")
+
+    start = time.perf_counter()
+    table = load(args.output, None if args.stats or args.export else args.annotations)
+    print(f"  ⏱ Aberto em {(time.perf_counter() - start) * 1000:.1f} ms")
+    print_stats(table)
+
+    if args.export:
+        written = export(table, args.export)
+        print(f"\n✅ {written['json']} .json e {written['txt']} .txt gravados, {written['unchanged']} iguais")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Store de anotações endereçado por conteúdo.
+
+Cada resposta do modelo é guardada em annotation_store/objects/ab/<chave>.json
+com chave = SHA-256 de (SHA-256 da imagem, hash do prompt, modelo):
+
+- renomear ou mover uma imagem não gera nova chamada (o conteúdo é o mesmo)
+- imagens iguais em provedores diferentes são anotadas uma vez só
+- mudar ANNOTATION_PROMPT ou MODEL muda a chave: as imagens são re-anotadas
+- a resposta bruta fica guardada, então annotations/*.json e *.txt podem
+  ser regerados (parser novo, correções) sem chamar a API
+
+annotations/{stem}.json registra a chave em metadata.store_key; é assim
+que o planejamento sabe se o arquivo em disco corresponde à entrada atual.
+Anotações sem store_key (anteriores ao store ou feitas à mão) e as já
+revisadas (needs_review = false) nunca são sobrescritas.
+
+O índice fica no catálogo (tabelas sha256 e annotation_entries) e liga
+as entradas às imagens do dataset.
+
+Uso:
+    python annotation_store.py               # Resumo do store e do plano
+    python annotation_store.py --index       # Caminho -> chave de cada imagem
+    python annotation_store.py --reparse     # Regera annotations/ a partir do store
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from auto_annotate import ANNOTATION_PROMPT, MODEL, convert_to_yolo, parse_annotation, save_annotation
+from catalog import Catalog, open_catalog
+from metadata import file_sha256
+
+BASE_DIR = Path(__file__).parent.parent
+STORE_DIR = BASE_DIR / "annotation_store"
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def entry_key(image_sha256: str, prompt_digest: str, model: str) -> str:
+    return hashlib.sha256(f"{image_sha256}:{prompt_digest}:{model}".encode()).hexdigest()
+
+
+@dataclass
+class StoreEntry:
+    key: str
+    image_sha256: str
+    prompt_hash: str
+    model: str
+    response: str  # texto bruto da resposta
+    width: int  # dimensões originais da imagem
+    height: int
+    source: str  # caminho da imagem quando foi anotada
+    input_tokens: int = 0
+    output_tokens: int = 0
+    created_at: str = ""
+
+
+class AnnotationStore:
+    """Respostas do modelo por (conteúdo da imagem, prompt, modelo)."""
+
+    def __init__(self, root: Path = STORE_DIR, prompt: str = ANNOTATION_PROMPT, model: str = MODEL):
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.prompt_hash = prompt_hash(prompt)
+        self.model = model
+
+    def key(self, image_sha256: str) -> str:
+        return entry_key(image_sha256, self.prompt_hash, self.model)
+
+    def path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.json"
+
+    def has(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def get(self, key: str) -> Optional[StoreEntry]:
+        try:
+            return StoreEntry(**json.loads(self.path(key).read_text()))
+        except FileNotFoundError:
+            return None
+
+    def put(self, entry: StoreEntry):
+        path = self.path(entry.key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Sufixo por thread: duas gravações da mesma chave não disputam o .part
+        partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        partial.write_text(json.dumps(asdict(entry), indent=2))
+        partial.replace(path)
+
+    def record(
+        self,
+        image_path: Path,
+        image_sha256: str,
+        response: str,
+        width: int,
+        height: int,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+    ) -> StoreEntry:
+        """Guarda a resposta do modelo para a imagem e devolve a entrada."""
+        entry = StoreEntry(
+            key=self.key(image_sha256),
+            image_sha256=image_sha256,
+            prompt_hash=self.prompt_hash,
+            model=self.model,
+            response=response,
+            width=width,
+            height=height,
+            source=image_path.as_posix(),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            created_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        )
+        self.put(entry)
+        return entry
+
+    def keys(self) -> Iterator[str]:
+        if not self.objects_dir.exists():
+            return
+        with os.scandir(self.objects_dir) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".json"):
+                            yield entry.name[:-5]
+
+    def sync_index(self, catalog: Catalog) -> int:
+        """Registra no catálogo as entradas que ainda não estão no índice."""
+        known = {row[0] for row in catalog.conn.execute("SELECT key FROM annotation_entries")}
+        rows = []
+        for key in self.keys():
+            if key in known:
+                continue
+            entry = self.get(key)
+            if entry is not None:
+                rows.append((entry.key, entry.image_sha256, entry.prompt_hash, entry.model, entry.created_at))
+        with catalog.conn:
+            catalog.conn.executemany(
+                "INSERT OR REPLACE INTO annotation_entries (key, sha256, prompt_hash, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+
+def write_outputs(annotation: Dict, image_path: Path, annotations_dir: Path):
+    convert_to_yolo(annotation, annotations_dir / f"{image_path.stem}.txt", verbose=False)
+    # JSON por último: é ele que marca a imagem como anotada no catálogo
+    save_annotation(annotation, annotations_dir / f"{image_path.stem}.json", verbose=False)
+
+
+def materialize(entry: StoreEntry, image_path: Path, annotations_dir: Path) -> Dict:
+    """Gera annotations/{stem}.json e .txt a partir da resposta guardada."""
+    annotation = parse_annotation(entry.response, image_path, entry.width, entry.height)
+    annotation["metadata"].update(store_key=entry.key, prompt_hash=entry.prompt_hash)
+    write_outputs(annotation, image_path, annotations_dir)
+    return annotation
+
+
+def image_sha256s(catalog: Catalog, workers: Optional[int] = None) -> Dict[Path, str]:
+    """SHA-256 de todas as imagens do catálogo (calcula só os que faltam)."""
+    rows = catalog.conn.execute(
+        "SELECT i.path, i.hash, s.sha256 FROM images i LEFT JOIN sha256 s ON s.hash = i.hash ORDER BY i.path"
+    ).fetchall()
+    missing = {digest: catalog.base_dir / path for path, digest, sha in rows if sha is None}
+    computed: Dict[str, str] = {}
+    if missing:
+        def digest_of(item):
+            digest, path = item
+            try:
+                return digest, file_sha256(path)
+            except OSError:
+                return digest, None
+
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+            computed = {d: sha for d, sha in pool.map(digest_of, missing.items()) if sha is not None}
+        with catalog.conn:
+            catalog.conn.executemany("INSERT OR REPLACE INTO sha256 (hash, sha256) VALUES (?, ?)", computed.items())
+    return {
+        catalog.base_dir / path: sha or computed[digest]
+        for path, digest, sha in rows
+        if sha is not None or digest in computed
+    }
+
+
+def _annotation_metadata(json_path: Path) -> Optional[Dict]:
+    try:
+        with open(json_path) as f:
+            return json.load(f).get("metadata", {})
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+@dataclass
+class Plan:
+    annotate: List[Path] = field(default_factory=list)  # sem entrada no store: chamar a API
+    materialize: List[Path] = field(default_factory=list)  # no store, arquivos desatualizados
+    sha256: Dict[Path, str] = field(default_factory=dict)
+    skipped: Counter = field(default_factory=Counter)  # motivo -> imagens
+    collisions: Dict[str, List[Path]] = field(default_factory=dict)  # stem -> imagens
+
+
+def plan_annotations(
+    catalog: Catalog,
+    store: AnnotationStore,
+    reannotate_legacy: bool = False,
+    reparse: bool = False,
+    workers: Optional[int] = None,
+) -> Plan:
+    """
+    Decide, para cada imagem do catálogo, se precisa de chamada à API,
+    só de regerar os arquivos a partir do store, ou nada.
+    """
+    result = Plan(sha256=image_sha256s(catalog, workers))
+    by_stem: Dict[str, List[Path]] = {}
+    for image_path in result.sha256:
+        by_stem.setdefault(image_path.stem, []).append(image_path)
+
+    queued = set()
+    for stem, paths in sorted(by_stem.items()):
+        if len({result.sha256[p] for p in paths}) > 1:
+            # annotations/{stem}.* só comporta uma imagem: as outras ficam de fora
+            result.collisions[stem] = paths
+            result.skipped["colisão de stem"] += len(paths) - 1
+            paths = paths[:1]
+        for image_path in paths:
+            key = store.key(result.sha256[image_path])
+            metadata = _annotation_metadata(catalog.annotations_dir / f"{stem}.json")
+            if metadata is not None and metadata.get("needs_review") is False:
+                result.skipped["revisada"] += 1
+            elif store.has(key):
+                if metadata is not None and metadata.get("store_key") == key and not reparse:
+                    result.skipped["atual"] += 1
+                elif metadata is not None and "store_key" not in metadata and not (reparse or reannotate_legacy):
+                    result.skipped["legada"] += 1
+                else:
+                    result.materialize.append(image_path)
+            elif metadata is not None and "store_key" not in metadata and not reannotate_legacy:
+                result.skipped["legada"] += 1
+            elif key in queued:
+                result.skipped["mesmo conteúdo na fila"] += 1
+            else:
+                queued.add(key)
+                result.annotate.append(image_path)
+    return result
+
+
+def materialize_all(
+    store: AnnotationStore, sha256: Dict[Path, str], images: List[Path], annotations_dir: Path
+) -> int:
+    done = 0
+    for image_path in images:
+        entry = store.get(store.key(sha256[image_path]))
+        if entry is None:
+            continue
+        try:
+            materialize(entry, image_path, annotations_dir)
+        except Exception as e:
+            print(f"  ✗ {image_path.name}: {type(e).__name__}: {e}")
+            continue
+        done += 1
+    return done
+
+
+def print_plan(result: Plan):
+    skipped = ", ".join(f"{n} {reason}" for reason, n in result.skipped.most_common()) or "nenhuma"
+    print(f"  📋 {len(result.annotate)} para anotar, {len(result.materialize)} a regerar do store; puladas: {skipped}")
+    for stem, paths in result.collisions.items():
+        print(f"  ⚠ Stem '{stem}' em {len(paths)} imagens diferentes (só {paths[0].parent.name} é anotada): "
+              + ", ".join(f"{p.parent.name}/{p.name}" for p in paths))
+
+
+def index_rows(catalog: Catalog, store: AnnotationStore) -> List[Dict]:
+    """Imagem do dataset -> entrada do store (prompt/modelo atuais ou não)."""
+    rows = catalog.conn.execute(
+        """
+        SELECT i.path, a.key, a.prompt_hash, a.model, a.created_at
+        FROM images i
+        JOIN sha256 s ON s.hash = i.hash
+        JOIN annotation_entries a ON a.sha256 = s.sha256
+        ORDER BY i.path, a.created_at
+        """
+    )
+    return [
+        {
+            "path": path,
+            "key": key,
+            "current": prompt == store.prompt_hash and model == store.model,
+            "prompt_hash": prompt,
+            "model": model,
+            "created_at": created_at,
+        }
+        for path, key, prompt, model, created_at in rows
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store de anotações endereçado por conteúdo")
+    parser.add_argument("--store", type=Path, default=STORE_DIR, help="Diretório do store")
+    parser.add_argument("--index", action="store_true", help="Listar imagem -> entrada do store")
+    parser.add_argument("--reparse", action="store_true", help="Regerar annotations/ a partir das respostas guardadas")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Annotation Store")
+    print("=" * 50)
+
+    store = AnnotationStore(args.store)
+    with open_catalog(BASE_DIR, verbose=True) as catalog:
+        added = store.sync_index(catalog)
+        total = catalog.conn.execute("SELECT COUNT(*) FROM annotation_entries").fetchone()[0]
+        print(f"  💾 {total} entradas no store (+{added} indexadas), prompt {store.prompt_hash}, modelo {store.model}")
+
+        if args.index:
+            for row in index_rows(catalog, store):
+                print(f"  {'✓' if row['current'] else ' '} {row['path']}  {row['key'][:16]}  "
+                      f"{row['model']} {row['prompt_hash']} {row['created_at']}")
+            return
+
+        result = plan_annotations(catalog, store, reparse=args.reparse)
+        print_plan(result)
+        if args.reparse:
+            done = materialize_all(store, result.sha256, result.materialize, catalog.annotations_dir)
+            print(f"\n✅ {done} anotações regeradas sem chamar a API")
+
+
+if __name__ == "__main__":
+    main()
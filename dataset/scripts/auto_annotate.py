@@ -2,21 +2,40 @@
 """
 Script de anotação semi-automática usando Claude Vision.
 Gera anotações iniciais que podem ser revisadas manualmente.
+
+As chamadas rodam em paralelo (annotate_runner.py) com retries. As
+imagens são reduzidas e recodificadas antes do envio (image_encoder.py).
+Cada resposta fica no annotation_store.py, endereçada pelo conteúdo da
+imagem, hash do prompt e modelo: só imagens sem resposta para o prompt
+atual são enviadas, e uma execução interrompida continua de onde parou.
+
+Uso:
+    python auto_annotate.py --concurrency 16
+    python auto_annotate.py --base-url http://localhost:8765 --api-key stub   # stub local
+    python auto_annotate.py --batch              # Message Batches API (batch_annotate.py)
 """
 
 import os
 import json
-import base64
+import asyncio
+import argparse
 from pathlib import Path
 from typing import Dict, List, Any, Tuple
 import anthropic
-from PIL import Image
+
+from catalog import open_catalog
+from image_encoder import DEFAULT_MAX_EDGE, EncodedImage, EncodeOptions, encode_for_request
 
 # Configuração
 BASE_DIR = Path(__file__).parent.parent
 IMAGES_DIR = BASE_DIR / "images"
 ANNOTATIONS_DIR = BASE_DIR / "annotations"
 ANNOTATIONS_DIR.mkdir(exist_ok=True)
+CHECKPOINT_PATH = BASE_DIR / "annotate_checkpoint.jsonl"
+BATCH_STATE_PATH = BASE_DIR / "annotate_batches.json"
+
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 4096
 
 # Mapeamento de categorias
 CATEGORY_MAP = {
@@ -87,28 +106,36 @@ Return ONLY a valid JSON object with this structure:
 Be precise with bounding boxes - they should tightly fit each component icon/box."""
 
 
-def encode_image(image_path: Path) -> Tuple[str, str]:
-    """Encode image to base64 and determine media type."""
-    suffix = image_path.suffix.lower()
-    media_types = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".gif": "image/gif",
-        ".webp": "image/webp",
-    }
-    media_type = media_types.get(suffix, "image/png")
-
-    with open(image_path, "rb") as f:
-        data = base64.standard_b64encode(f.read()).decode("utf-8")
-
-    return data, media_type
-
-
-def get_image_dimensions(image_path: Path) -> Tuple[int, int]:
-    """Get image width and height."""
-    with Image.open(image_path) as img:
-        return img.width, img.height
+def build_messages(
+    image_path: Path, options: EncodeOptions = EncodeOptions()
+) -> Tuple[List[Dict[str, Any]], EncodedImage]:
+    """Build the Messages API payload for an image; returns (messages, encoded image).
+
+    The image is downscaled/re-encoded by image_encoder; encoded.width and
+    encoded.height stay the original dimensions used for pixel bboxes.
+    """
+    encoded = encode_for_request(image_path, options)
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": encoded.media_type,
+                        "data": encoded.data,
+                    },
+                },
+                {
+                    "type": "text",
+                    "text": ANNOTATION_PROMPT,
+                },
+            ],
+        }
+    ]
+    return messages, encoded
 
 
 def annotate_image(client: anthropic.Anthropic, image_path: Path) -> Dict[str, Any]:
@@ -116,37 +143,20 @@ def annotate_image(client: anthropic.Anthropic, image_path: Path) -> Dict[str, A
     print(f"Annotating: {image_path.name}")
 
     # Encode image
-    image_data, media_type = encode_image(image_path)
-    width, height = get_image_dimensions(image_path)
+    messages, encoded = build_messages(image_path)
 
     # Call Claude Vision
     message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": ANNOTATION_PROMPT,
-                    },
-                ],
-            }
-        ],
+        model=MODEL,
+        max_tokens=MAX_TOKENS,
+        messages=messages,
     )
 
-    # Parse response
-    response_text = message.content[0].text
+    return parse_annotation(message.content[0].text, image_path, encoded.width, encoded.height)
+
 
+def parse_annotation(response_text: str, image_path: Path, width: int, height: int) -> Dict[str, Any]:
+    """Convert Claude's JSON answer into the dataset annotation format."""
     # Extract JSON from response (may be wrapped in markdown)
     if "```json" in response_text:
         json_str = response_text.split("```json")[1].split("```")[0]
@@ -225,7 +235,7 @@ def annotate_image(client: anthropic.Anthropic, image_path: Path) -> Dict[str, A
         "connections": connections,
         "metadata": {
             "auto_annotated": True,
-            "model": "claude-sonnet-4-20250514",
+            "model": MODEL,
             "needs_review": True,
         },
     }
@@ -233,14 +243,15 @@ def annotate_image(client: anthropic.Anthropic, image_path: Path) -> Dict[str, A
     return annotation
 
 
-def save_annotation(annotation: Dict[str, Any], output_path: Path):
+def save_annotation(annotation: Dict[str, Any], output_path: Path, verbose: bool = True):
     """Save annotation to JSON file."""
     with open(output_path, "w") as f:
         json.dump(annotation, f, indent=2)
-    print(f"  Saved: {output_path.name}")
+    if verbose:
+        print(f"  Saved: {output_path.name}")
 
 
-def convert_to_yolo(annotation: Dict[str, Any], output_path: Path):
+def convert_to_yolo(annotation: Dict[str, Any], output_path: Path, verbose: bool = True):
     """Convert annotation to YOLO format (.txt)."""
     lines = []
     for ann in annotation["annotations"]:
@@ -251,53 +262,102 @@ def convert_to_yolo(annotation: Dict[str, Any], output_path: Path):
 
     with open(output_path, "w") as f:
         f.write("\n".join(lines))
-    print(f"  YOLO: {output_path.name}")
+    if verbose:
+        print(f"  YOLO: {output_path.name}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Auto-annotate diagrams with Claude Vision")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent API calls")
+    parser.add_argument("--max-retries", type=int, default=6, help="Retries per image (429/5xx/529/network)")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base backoff in seconds (full jitter)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--limit", type=int, default=None, help="Annotate at most N images")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH, help="Resume log (JSONL)")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry images that failed before")
+    parser.add_argument("--base-url", default=None, help="Messages API base URL (e.g. local stub server)")
+    parser.add_argument("--api-key", default=os.environ.get("ANTHROPIC_API_KEY"), help="API key")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE, help="Downscale images to this longest edge")
+    parser.add_argument("--no-optimize", action="store_true", help="Send the original image files unchanged")
+    parser.add_argument("--reannotate-legacy", action="store_true",
+                        help="Re-annotate images whose JSON predates the annotation store")
+    parser.add_argument("--batch", action="store_true", help="Use the Message Batches API (bulk, asynchronous)")
+    parser.add_argument("--no-wait", action="store_true", help="Batch mode: submit/collect once and exit")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Batch mode: seconds between polls")
+    parser.add_argument("--batch-state", type=Path, default=BATCH_STATE_PATH, help="Batch mode: resume state")
+    parser.add_argument("--batch-max-mb", type=float, default=200.0, help="Batch mode: max payload per batch")
+    args = parser.parse_args()
+
     print("=" * 50)
     print("Auto-Annotation with Claude Vision")
     print("=" * 50)
 
-    # Check API key
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        print("Error: ANTHROPIC_API_KEY environment variable not set")
-        return
+    from annotation_store import AnnotationStore, materialize_all, plan_annotations, print_plan
 
-    client = anthropic.Anthropic(api_key=api_key)
-
-    # Find all images
-    image_extensions = [".png", ".jpg", ".jpeg", ".gif", ".webp"]
-    images = []
-    for ext in image_extensions:
-        images.extend(IMAGES_DIR.rglob(f"*{ext}"))
-        images.extend(IMAGES_DIR.rglob(f"*{ext.upper()}"))
+    # Content-addressed store: (image SHA-256, prompt hash, model) -> raw response
+    store = AnnotationStore()
+    with open_catalog(BASE_DIR, verbose=True) as catalog:
+        store.sync_index(catalog)
+        plan = plan_annotations(catalog, store, reannotate_legacy=args.reannotate_legacy)
+    print_plan(plan)
+    if plan.materialize:
+        done = materialize_all(store, plan.sha256, plan.materialize, ANNOTATIONS_DIR)
+        print(f"  Regenerated {done} annotations from stored responses (no API calls)")
 
+    images = plan.annotate[:args.limit]
     print(f"\nFound {len(images)} images to annotate\n")
+    if not images and not args.batch:  # batch mode may still have pending batches to collect
+        return
 
-    # Annotate each image
-    for image_path in images:
-        # Skip if already annotated
-        annotation_path = ANNOTATIONS_DIR / f"{image_path.stem}.json"
-        if annotation_path.exists():
-            print(f"Skip (exists): {image_path.name}")
-            continue
-
-        try:
-            annotation = annotate_image(client, image_path)
-            save_annotation(annotation, annotation_path)
-
-            # Also save YOLO format
-            yolo_path = ANNOTATIONS_DIR / f"{image_path.stem}.txt"
-            convert_to_yolo(annotation, yolo_path)
-
-            print(f"  Components: {len(annotation['annotations'])}")
-            print(f"  Connections: {len(annotation['connections'])}")
-            print()
+    # Check API key
+    if not args.api_key:
+        print("Error: ANTHROPIC_API_KEY environment variable not set")
+        return
 
-        except Exception as e:
-            print(f"  Error: {e}\n")
+    encode_options = EncodeOptions(max_edge=args.max_edge, optimize=not args.no_optimize)
+
+    if args.batch:
+        from batch_annotate import run_batches
+
+        run_batches(
+            images,
+            ANNOTATIONS_DIR,
+            args.batch_state,
+            store,
+            plan.sha256,
+            api_key=args.api_key,
+            base_url=args.base_url,
+            poll_interval=args.poll_interval,
+            wait=not args.no_wait,
+            max_mb=args.batch_max_mb,
+            encode_options=encode_options,
+        )
+    else:
+        from annotate_runner import run_annotations
+
+        asyncio.run(run_annotations(
+            images,
+            ANNOTATIONS_DIR,
+            args.checkpoint,
+            store,
+            plan.sha256,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            backoff=args.backoff,
+            timeout=args.timeout,
+            api_key=args.api_key,
+            base_url=args.base_url,
+            retry_failed=not args.skip_failed,
+            encode_options=encode_options,
+        ))
+
+    # Index the new entries; copies of the same content get their files from the store
+    with open_catalog(BASE_DIR) as catalog:
+        store.sync_index(catalog)
+        followup = plan_annotations(catalog, store, reannotate_legacy=args.reannotate_legacy)
+    if followup.materialize:
+        done = materialize_all(store, followup.sha256, followup.materialize, ANNOTATIONS_DIR)
+        print(f"  Regenerated {done} annotations of identical images from the store")
 
     print("\nDone! Review annotations in:", ANNOTATIONS_DIR)
 
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Anotação em lote pela Message Batches API.
+
+Para re-anotações grandes: as imagens viram requisições de batch (mesmo
+ANNOTATION_PROMPT do modo interativo), a API processa de forma
+assíncrona com preço de batch, e os resultados são lidos em streaming
+guardados no annotation_store e gravados em annotations/*.json e *.txt.
+
+O estado fica em annotate_batches.json: cada batch criado é salvo logo
+após a submissão, com o mapa custom_id -> imagem (e dimensões), e
+marcado como coletado depois que os resultados são gravados. Uma
+execução interrompida (ou com --no-wait) retoma o polling dos batches
+pendentes sem reenviar imagens.
+
+Os batches são fatiados por número de requisições e tamanho do payload
+(imagens já reduzidas pelo image_encoder, em base64), abaixo dos
+limites da API.
+
+Uso:
+    python auto_annotate.py --batch
+    python auto_annotate.py --batch --no-wait        # Só submete
+    python auto_annotate.py --batch                  # Depois: coleta
+    python stub_messages_server.py --port 8765 --batch-delay 5 &
+    python auto_annotate.py --batch --base-url http://localhost:8765 --api-key stub
+    python batch_smoke.py                            # Teste de fumaça contra o stub
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import anthropic
+
+from annotation_store import AnnotationStore, materialize
+from auto_annotate import MAX_TOKENS, MODEL, build_messages
+from metadata import file_sha256
+from image_encoder import EncodedImage, EncodeOptions, print_totals
+
+MAX_BATCH_REQUESTS = 10_000
+MAX_BATCH_MB = 200  # limite da API: 256 MB por batch
+
+
+class BatchState:
+    """Estado persistente dos batches submetidos (JSON, escrita atômica)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.batches: Dict[str, Dict] = {}
+        if path.exists():
+            self.batches = json.loads(path.read_text()).get("batches", {})
+
+    def pending(self) -> List[str]:
+        return [batch_id for batch_id, batch in self.batches.items() if not batch.get("collected")]
+
+    def images_in_flight(self) -> set:
+        return {
+            entry["path"]
+            for batch_id in self.pending()
+            for entry in self.batches[batch_id]["requests"].values()
+        }
+
+    def add(self, batch_id: str, requests: Dict[str, Dict]):
+        self.batches[batch_id] = {
+            "submitted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "requests": requests,
+            "collected": False,
+        }
+        self.save()
+
+    def mark_collected(self, batch_id: str, counts: Dict[str, int]):
+        self.batches[batch_id].update(
+            collected=True, collected_at=time.strftime("%Y-%m-%dT%H:%M:%S"), counts=counts
+        )
+        self.save()
+
+    def save(self):
+        partial = self.path.with_name(self.path.name + ".part")
+        partial.write_text(json.dumps({"version": 1, "batches": self.batches}, indent=2))
+        partial.replace(self.path)
+
+
+def custom_id(image_path: Path) -> str:
+    # custom_id aceita só [a-zA-Z0-9_-], até 64 caracteres
+    return "img-" + hashlib.sha1(str(image_path).encode()).hexdigest()[:32]
+
+
+def build_batches(
+    images: List[Path],
+    sha256: Dict[Path, str],
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_mb: float = MAX_BATCH_MB,
+    encode_options: EncodeOptions = EncodeOptions(),
+    encoded_images: Optional[List[EncodedImage]] = None,
+) -> Iterator[Tuple[List[Dict], Dict[str, Dict]]]:
+    """
+    Gera (requisições, mapa custom_id -> imagem) por batch, respeitando
+    número de requisições e tamanho aproximado do payload. Se
+    encoded_images for passado, recebe o resultado de cada codificação
+    (só os tamanhos importam para o relatório).
+    """
+    requests, index, size = [], {}, 0
+    for image_path in images:
+        try:
+            messages, encoded = build_messages(image_path, encode_options)
+        except Exception as e:
+            print(f"  ✗ {image_path.name}: {e}")
+            continue
+        request_size = len(messages[0]["content"][0]["source"]["data"]) + len(messages[0]["content"][1]["text"])
+        if requests and (len(requests) >= max_requests or size + request_size > max_mb * 2**20):
+            yield requests, index
+            requests, index, size = [], {}, 0
+        cid = custom_id(image_path)
+        requests.append({
+            "custom_id": cid,
+            "params": {"model": MODEL, "max_tokens": MAX_TOKENS, "messages": messages},
+        })
+        index[cid] = {
+            "path": str(image_path),
+            "sha256": sha256[image_path],
+            "width": encoded.width,
+            "height": encoded.height,
+        }
+        size += request_size
+        if encoded_images is not None:
+            encoded.data = ""  # o base64 já está na requisição
+            encoded_images.append(encoded)
+    if requests:
+        yield requests, index
+
+
+def submit(
+    client: anthropic.Anthropic,
+    state: BatchState,
+    images: List[Path],
+    sha256: Dict[Path, str],
+    max_requests: int,
+    max_mb: float,
+    encode_options: EncodeOptions = EncodeOptions(),
+):
+    in_flight = state.images_in_flight()
+    todo = [image for image in images if str(image) not in in_flight]
+    if len(todo) < len(images):
+        print(f"  ⏭ {len(images) - len(todo)} imagens já em batches pendentes")
+    encoded: List[EncodedImage] = []
+    for requests, index in build_batches(todo, sha256, max_requests, max_mb, encode_options, encoded):
+        batch = client.messages.batches.create(requests=requests)
+        state.add(batch.id, index)
+        print(f"  📤 Batch {batch.id}: {len(requests)} imagens submetidas")
+    print_totals(encoded)
+
+
+def collect(
+    client: anthropic.Anthropic,
+    state: BatchState,
+    batch_id: str,
+    annotations_dir: Path,
+    store: AnnotationStore,
+) -> Dict[str, int]:
+    """Lê os resultados em streaming e grava as anotações."""
+    index = state.batches[batch_id]["requests"]
+    counts = {"succeeded": 0, "errored": 0, "canceled": 0, "expired": 0, "input_tokens": 0, "output_tokens": 0}
+    for entry in client.messages.batches.results(batch_id):
+        kind = entry.result.type
+        info = index.get(entry.custom_id)
+        if info is None:
+            continue
+        image_path = Path(info["path"])
+        if kind == "succeeded":
+            message = entry.result.message
+            entry = store.record(
+                # Estados anteriores ao store não têm o SHA-256
+                image_path, info.get("sha256") or file_sha256(image_path), message.content[0].text, info["width"], info["height"],
+                message.usage.input_tokens, message.usage.output_tokens,
+            )
+            try:
+                materialize(entry, image_path, annotations_dir)
+            except Exception as e:
+                print(f"  ✗ {image_path.name}: {type(e).__name__}: {e}")
+                counts["errored"] += 1
+                continue
+            counts["succeeded"] += 1
+            counts["input_tokens"] += message.usage.input_tokens
+            counts["output_tokens"] += message.usage.output_tokens
+        else:
+            counts[kind] += 1
+            detail = ""
+            if kind == "errored":
+                detail = f": {entry.result.error.error.type}"
+            print(f"  ✗ {image_path.name}: {kind}{detail}")
+    return counts
+
+
+def run_batches(
+    images: List[Path],
+    annotations_dir: Path,
+    state_path: Path,
+    store: AnnotationStore,
+    sha256: Dict[Path, str],
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    poll_interval: float = 60.0,
+    wait: bool = True,
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_mb: float = MAX_BATCH_MB,
+    encode_options: EncodeOptions = EncodeOptions(),
+) -> Dict[str, int]:
+    """Submete as imagens em batches, acompanha e coleta os resultados."""
+    client = anthropic.Anthropic(api_key=api_key, base_url=base_url)
+    state = BatchState(state_path)
+    start = time.perf_counter()
+
+    submit(client, state, images, sha256, max_requests, max_mb, encode_options)
+    totals = {"succeeded": 0, "errored": 0, "canceled": 0, "expired": 0, "input_tokens": 0, "output_tokens": 0}
+
+    while state.pending():
+        for batch_id in state.pending():
+            batch = client.messages.batches.retrieve(batch_id)
+            c = batch.request_counts
+            if batch.processing_status != "ended":
+                print(f"  ⏳ {batch_id}: {c.processing} processando, {c.succeeded} ok, {c.errored} erros")
+                continue
+            counts = collect(client, state, batch_id, annotations_dir, store)
+            state.mark_collected(batch_id, counts)
+            for key, value in counts.items():
+                totals[key] += value
+            print(f"  📥 {batch_id}: {counts['succeeded']} anotações gravadas, "
+                  f"{counts['errored'] + counts['canceled'] + counts['expired']} sem resultado")
+        if not wait or not state.pending():
+            break
+        time.sleep(poll_interval)
+
+    pending = state.pending()
+    print("\n" + "=" * 50)
+    print(f"✅ {totals['succeeded']} anotadas, ✗ {totals['errored']} erros, "
+          f"{totals['expired']} expiradas, {totals['canceled']} canceladas em {time.perf_counter() - start:.1f}s")
+    print(f"  Tokens: {totals['input_tokens']} entrada, {totals['output_tokens']} saída")
+    if pending:
+        print(f"  ⏳ {len(pending)} batches pendentes: rode de novo para coletar (estado em {state_path.name})")
+    print("=" * 50)
+    return totals
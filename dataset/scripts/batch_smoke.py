@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Teste de fumaça da anotação em lote contra o stub local da Batches API.
+
+Sobe stub_messages_server.serve() numa porta efêmera (batches terminam
+em --batch-delay segundos), copia algumas imagens para um diretório
+temporário e roda run_batches em duas etapas:
+
+1. submissão com wait=False: os batches ficam pendentes em
+   annotate_batches.json e nada é gravado
+2. retomada: nada é reenviado ao stub, o polling continua a partir do
+   estado e os resultados são coletados em annotations/
+
+Sai com exit code 1 se alguma verificação falhar. Não usa a API real.
+
+Uso:
+    python batch_smoke.py
+    python batch_smoke.py --images 5 --batch-delay 2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import threading
+from argparse import Namespace
+from pathlib import Path
+
+from annotation_store import AnnotationStore
+from batch_annotate import BatchState, run_batches
+from metadata import IMAGE_EXTENSIONS, file_sha256
+from stub_messages_server import serve
+
+BASE_DIR = Path(__file__).parent.parent
+IMAGES_DIR = BASE_DIR / "images"
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+    print(f"  ✓ {message}")
+
+
+def smallest_images(count: int):
+    images = [p for p in IMAGES_DIR.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS]
+    return sorted(images, key=lambda p: (p.stat().st_size, p.name))[:count]
+
+
+def run(n_images: int = 3, batch_delay: float = 1.0, verbose: bool = False):
+    stub_args = Namespace(
+        port=0, latency=0.0, rate_limit_every=0, retry_after=1.0, overload_rate=0.0, error_rate=0.0,
+        max_concurrency=0, batch_delay=batch_delay, batch_error_rate=0.0,
+    )
+    server = serve(stub_args)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    workdir = Path(tempfile.mkdtemp(prefix="batch_smoke_"))
+    try:
+        images_dir = workdir / "images"
+        images_dir.mkdir()
+        images = []
+        for source in smallest_images(n_images):
+            # Nomes distintos mesmo com o mesmo nome em provedores diferentes
+            dest = images_dir / f"{len(images)}_{source.name}"
+            shutil.copy2(source, dest)
+            images.append(dest)
+        check(len(images) == n_images, f"{n_images} imagens copiadas para {workdir.name}")
+
+        annotations_dir = workdir / "annotations"
+        annotations_dir.mkdir()
+        state_path = workdir / "annotate_batches.json"
+        store = AnnotationStore(workdir / "annotation_store")
+        sha256 = {image: file_sha256(image) for image in images}
+        # Dois batches: exercita o fatiamento e o estado com mais de um batch
+        options = dict(api_key="stub", base_url=base_url, max_requests=max(1, (n_images + 1) // 2))
+        quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+        # 1. Submissão sem esperar
+        with quiet:
+            totals = run_batches(images, annotations_dir, state_path, store, sha256, wait=False, **options)
+        state = BatchState(state_path)
+        submitted = server.state.stats()["batch_requests"]
+        check(len(state.pending()) == 2, "2 batches submetidos e pendentes no estado")
+        check(submitted == n_images, f"{submitted} requisições recebidas pelo stub")
+        check(totals["succeeded"] == 0 and not any(annotations_dir.iterdir()), "nada gravado antes do fim dos batches")
+
+        # 2. Retomada a partir de annotate_batches.json
+        quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            totals = run_batches(images, annotations_dir, state_path, store, sha256,
+                                 poll_interval=batch_delay / 4, **options)
+        state = BatchState(state_path)
+        check(server.state.stats()["batch_requests"] == submitted, "retomada não reenviou imagens")
+        check(not state.pending(), "todos os batches coletados")
+        check(totals["succeeded"] == n_images, f"{totals['succeeded']} anotações coletadas")
+        for image in images:
+            json_path = annotations_dir / f"{image.stem}.json"
+            check(json_path.exists() and (annotations_dir / f"{image.stem}.txt").exists(),
+                  f"{image.stem}: .json e .txt gravados")
+            check(bool(json.loads(json_path.read_text()).get("annotations")), f"{image.stem}: anotação não vazia")
+        check(len(list(store.keys())) == n_images, "resultados guardados no annotation_store")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de fumaça de batch_annotate contra o stub")
+    parser.add_argument("--images", type=int, default=3, help="Imagens a anotar (mínimo 2)")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Segundos até cada batch terminar")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar a saída de run_batches")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Smoke test: batch_annotate + stub")
+    print("=" * 50)
+    try:
+        run(max(2, args.images), args.batch_delay, args.verbose)
+    except AssertionError as e:
+        print(f"  ✗ {e}")
+        sys.exit(1)
+    print("\n✅ OK")
+
+
+if __name__ == "__main__":
+    main()
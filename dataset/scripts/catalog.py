@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Catálogo SQLite do dataset, compartilhado pelos scripts.
+
+Indexa imagens (provedor, tamanho, dimensões, hash), status de anotação
+(.txt YOLO e .json do Claude), contagem de labels por classe e split de
+cada imagem. Os scripts consultam o catálogo em vez de varrer o disco com
+rglob e reabrir imagens.
+
+A atualização é incremental: o walk + stat encontra o que mudou
+(tamanho/mtime), e só essas imagens são relidas (dimensões pelo
+cabeçalho, MD5 em pool de threads, ver metadata.py). Labels são
+reprocessados quando o mtime do .txt muda; splits quando os arquivos de
+splits/ mudam.
+
+Uso:
+    python catalog.py                       # Atualiza e mostra o resumo
+    python catalog.py --list --provider aws --annotated
+    python catalog.py --list --split val
+    python catalog.py --duplicates
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metadata import ImageRecord, file_md5, image_dimensions, scan_images
+
+BASE_DIR = Path(__file__).parent.parent
+CATALOG_PATH = BASE_DIR / "catalog.db"
+SPLITS = ("train", "val", "test")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,          -- relativo a BASE_DIR (images/aws/x.png)
+    provider TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    annotated INTEGER NOT NULL DEFAULT 0,   -- existe annotations/{stem}.txt
+    label_mtime_ns INTEGER,
+    has_json INTEGER NOT NULL DEFAULT 0,    -- existe annotations/{stem}.json
+    n_labels INTEGER NOT NULL DEFAULT 0,
+    split TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_provider ON images(provider);
+CREATE INDEX IF NOT EXISTS idx_images_stem ON images(stem);
+CREATE INDEX IF NOT EXISTS idx_images_hash ON images(hash);
+CREATE INDEX IF NOT EXISTS idx_images_annotated ON images(annotated);
+CREATE INDEX IF NOT EXISTS idx_images_split ON images(split);
+
+CREATE TABLE IF NOT EXISTS labels (
+    path TEXT NOT NULL REFERENCES images(path) ON DELETE CASCADE,
+    class_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path, class_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_labels_class ON labels(class_id);
+
+-- Hashes perceptuais (dedup.py), por conteúdo: sobrevivem a renomeações
+CREATE TABLE IF NOT EXISTS perceptual (
+    hash TEXT PRIMARY KEY,          -- MD5 (images.hash)
+    phash INTEGER NOT NULL,
+    dhash INTEGER NOT NULL
+);
+
+-- SHA-256 por conteúdo (annotation_store.py), calculado sob demanda
+CREATE TABLE IF NOT EXISTS sha256 (
+    hash TEXT PRIMARY KEY,          -- MD5 (images.hash)
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sha256_sha256 ON sha256(sha256);
+
+-- Índice do annotation_store: entrada -> conteúdo da imagem
+CREATE TABLE IF NOT EXISTS annotation_entries (
+    key TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_annotation_entries_sha256 ON annotation_entries(sha256);
+
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def count_labels(label_path: Path) -> Counter:
+    """Contagem de objetos por classe de um .txt YOLO."""
+    counts: Counter = Counter()
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split(maxsplit=1)
+            if parts:
+                try:
+                    counts[int(float(parts[0]))] += 1
+                except ValueError:
+                    continue
+    return counts
+
+
+def _scan_annotations(annotations_dir: Path) -> Tuple[Dict[str, int], set]:
+    """stem -> mtime_ns dos .txt, e stems que têm .json."""
+    txt, json_stems = {}, set()
+    if not annotations_dir.exists():
+        return txt, json_stems
+    with os.scandir(annotations_dir) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext == ".txt":
+                txt[stem] = entry.stat().st_mtime_ns
+            elif ext == ".json":
+                json_stems.add(stem)
+    return txt, json_stems
+
+
+class Catalog:
+    """
+    Catálogo do dataset em base_dir (images/, annotations/, splits/).
+
+    Caminhos retornados pelas consultas são absolutos (base_dir / path).
+    """
+
+    def __init__(self, db_path: Path = CATALOG_PATH, base_dir: Path = BASE_DIR):
+        self.db_path = db_path
+        self.base_dir = base_dir
+        self.images_dir = base_dir / "images"
+        self.annotations_dir = base_dir / "annotations"
+        self.splits_dir = base_dir / "splits"
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Atualização incremental
+    # ------------------------------------------------------------------
+
+    def refresh(self, workers: Optional[int] = None) -> Dict:
+        """Sincroniza o catálogo com o disco; retorna estatísticas."""
+        start = time.perf_counter()
+        prefix = self.images_dir.relative_to(self.base_dir).as_posix()
+        records = scan_images(self.images_dir) if self.images_dir.exists() else []
+        known = {
+            row[0]: row[1:]
+            for row in self.conn.execute("SELECT path, size, mtime_ns, label_mtime_ns, has_json FROM images")
+        }
+
+        stale: List[ImageRecord] = []
+        for record in records:
+            old = known.get(f"{prefix}/{record.rel_path}")
+            if old is None or old[0] != record.size or old[1] != record.mtime_ns:
+                stale.append(record)
+        if stale:
+            def fill(record: ImageRecord):
+                path = self.images_dir / record.rel_path
+                record.width, record.height = image_dimensions(path)
+                record.hash = file_md5(path)
+
+            with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+                list(pool.map(fill, stale))
+
+        txt, json_stems = _scan_annotations(self.annotations_dir)
+        current = {f"{prefix}/{r.rel_path}" for r in records}
+        removed = [path for path in known if path not in current]
+        added = sum(1 for r in stale if f"{prefix}/{r.rel_path}" not in known)
+        labels_parsed = 0
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in removed])
+            self.conn.executemany(
+                """
+                INSERT INTO images (path, provider, stem, size, mtime_ns, hash, width, height)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size, mtime_ns = excluded.mtime_ns, hash = excluded.hash,
+                    width = excluded.width, height = excluded.height
+                """,
+                [
+                    (f"{prefix}/{r.rel_path}", r.provider, Path(r.rel_path).stem,
+                     r.size, r.mtime_ns, r.hash, r.width, r.height)
+                    for r in stale
+                ],
+            )
+
+            for record in records:
+                path = f"{prefix}/{record.rel_path}"
+                stem = Path(record.rel_path).stem
+                label_mtime = txt.get(stem)
+                has_json = int(stem in json_stems)
+                old = known.get(path)
+                if old is not None and old[2] == label_mtime and old[3] == has_json:
+                    continue
+                if old is None or old[2] != label_mtime:
+                    self._store_labels(path, stem, label_mtime)
+                    labels_parsed += 1
+                self.conn.execute("UPDATE images SET has_json = ? WHERE path = ?", (has_json, path))
+
+            if removed or added:
+                # Imagens novas/removidas podem estar nos arquivos de split
+                self.conn.execute("DELETE FROM state WHERE key = 'splits'")
+            splits_changed = self._refresh_splits()
+
+        return {
+            "total": len(records),
+            "added": added,
+            "updated": len(stale) - added,
+            "removed": len(removed),
+            "labels_parsed": labels_parsed,
+            "splits_changed": splits_changed,
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    def _store_labels(self, path: str, stem: str, label_mtime: Optional[int]):
+        self.conn.execute("DELETE FROM labels WHERE path = ?", (path,))
+        counts: Counter = Counter()
+        if label_mtime is not None:
+            try:
+                counts = count_labels(self.annotations_dir / f"{stem}.txt")
+            except OSError:
+                label_mtime = None
+        self.conn.executemany(
+            "INSERT INTO labels (path, class_id, count) VALUES (?, ?, ?)",
+            [(path, class_id, count) for class_id, count in counts.items()],
+        )
+        self.conn.execute(
+            "UPDATE images SET annotated = ?, label_mtime_ns = ?, n_labels = ? WHERE path = ?",
+            (int(label_mtime is not None), label_mtime, sum(counts.values()), path),
+        )
+
+    def _refresh_splits(self) -> bool:
+        """Relê splits/*.txt se algum mudou desde a última atualização."""
+        signature = []
+        for split in SPLITS:
+            split_file = self.splits_dir / f"{split}.txt"
+            signature.append(f"{split}:{split_file.stat().st_mtime_ns if split_file.exists() else 0}")
+        signature = ",".join(signature)
+        row = self.conn.execute("SELECT value FROM state WHERE key = 'splits'").fetchone()
+        if row and row[0] == signature:
+            return False
+
+        assignments = {}
+        for split in SPLITS:
+            split_file = self.splits_dir / f"{split}.txt"
+            if split_file.exists():
+                for line in split_file.read_text().splitlines():
+                    if line.strip():
+                        assignments[line.strip()] = split
+        self._write_splits(assignments)
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('splits', ?)", (signature,))
+        return True
+
+    def _write_splits(self, assignments: Dict[str, str]):
+        self.conn.execute("UPDATE images SET split = NULL WHERE split IS NOT NULL")
+        self.conn.executemany(
+            "UPDATE images SET split = ? WHERE path = ?",
+            [(split, path) for path, split in assignments.items()],
+        )
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def images(
+        self,
+        provider: Optional[str] = None,
+        annotated: Optional[bool] = None,
+        has_json: Optional[bool] = None,
+        split: Optional[str] = None,
+        under: Optional[Path] = None,
+        limit: Optional[int] = None,
+    ) -> List[Path]:
+        """Imagens que atendem aos filtros, ordenadas por caminho."""
+        where, params = [], []
+        if under is not None:
+            # Intervalo na chave primária: "images/aws/" <= path < "images/aws0"
+            prefix = Path(under).resolve().relative_to(self.base_dir.resolve()).as_posix().rstrip("/") + "/"
+            where.append("path >= ? AND path < ?")
+            params += [prefix, prefix[:-1] + chr(ord("/") + 1)]
+        for column, value in (("provider", provider), ("split", split)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        for column, value in (("annotated", annotated), ("has_json", has_json)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(int(value))
+        sql = "SELECT path FROM images"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self.base_dir / row[0] for row in self.conn.execute(sql, params)]
+
+    def relative_paths(self, **filters) -> List[str]:
+        """Como images(), mas relativo a base_dir (formato de splits/*.txt)."""
+        return [p.relative_to(self.base_dir).as_posix() for p in self.images(**filters)]
+
+    def providers(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT provider, COUNT(*) FROM images GROUP BY provider ORDER BY provider")
+        return dict(rows.fetchall())
+
+    def split_counts(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT split, COUNT(*) FROM images WHERE split IS NOT NULL GROUP BY split")
+        return dict(rows.fetchall())
+
+    def class_counts(self, split: Optional[str] = None) -> Dict[int, int]:
+        """Objetos por classe (opcionalmente só de um split)."""
+        sql = "SELECT l.class_id, SUM(l.count) FROM labels l"
+        params: list = []
+        if split is not None:
+            sql += " JOIN images i ON i.path = l.path WHERE i.split = ?"
+            params.append(split)
+        sql += " GROUP BY l.class_id ORDER BY l.class_id"
+        return dict(self.conn.execute(sql, params).fetchall())
+
+    def split_rows(self, assigned: bool) -> Iterator[Tuple[str, str, str, Optional[str], Optional[str]]]:
+        """
+        (path, provider, hash, split, class_ids) das imagens anotadas, sem
+        carregar a lista inteira. class_ids vem separado por vírgula.
+        As sem split saem em ordem de hash (independe da ordem de chegada).
+        """
+        sql = f"""
+            SELECT i.path, i.provider, i.hash, i.split,
+                   (SELECT group_concat(l.class_id) FROM labels l WHERE l.path = i.path)
+            FROM images i
+            WHERE i.annotated = 1 AND i.split IS {"NOT NULL ORDER BY i.path" if assigned else "NULL ORDER BY i.hash, i.path"}
+        """
+        yield from self.conn.execute(sql)
+
+    def duplicates(self) -> List[List[Path]]:
+        """Grupos de imagens com o mesmo conteúdo (MD5)."""
+        rows = self.conn.execute(
+            """
+            SELECT hash, path FROM images
+            WHERE hash IN (SELECT hash FROM images GROUP BY hash HAVING COUNT(*) > 1)
+            ORDER BY hash, path
+            """
+        )
+        groups: Dict[str, List[Path]] = {}
+        for digest, path in rows:
+            groups.setdefault(digest, []).append(self.base_dir / path)
+        return list(groups.values())
+
+    def summary(self) -> Dict:
+        total, annotated, with_json, objects = self.conn.execute(
+            "SELECT COUNT(*), SUM(annotated), SUM(has_json), SUM(n_labels) FROM images"
+        ).fetchone()
+        return {
+            "total": total,
+            "annotated": annotated or 0,
+            "with_json": with_json or 0,
+            "objects": objects or 0,
+            "providers": self.providers(),
+            "splits": self.split_counts(),
+            "duplicate_groups": len(self.duplicates()),
+        }
+
+    def set_splits(self, splits: Dict[str, List[str]]):
+        """Grava a divisão (caminhos relativos a base_dir) após create_splits."""
+        with self.conn:
+            self._write_splits({path: name for name, paths in splits.items() for path in paths})
+            # Os arquivos foram reescritos: força releitura na próxima atualização
+            self.conn.execute("DELETE FROM state WHERE key = 'splits'")
+
+    def add_splits(self, assignments: Iterable[Tuple[str, str]]):
+        """Grava (split, caminho) de imagens novas sem mexer nas já atribuídas."""
+        with self.conn:
+            self.conn.executemany("UPDATE images SET split = ? WHERE path = ?", assignments)
+            # Os arquivos ganharam linhas: força releitura na próxima atualização
+            self.conn.execute("DELETE FROM state WHERE key = 'splits'")
+
+
+def open_catalog(
+    base_dir: Path = BASE_DIR,
+    db_path: Optional[Path] = None,
+    refresh: bool = True,
+    verbose: bool = False,
+) -> Catalog:
+    """Abre (e por padrão atualiza) o catálogo de base_dir."""
+    catalog = Catalog(db_path or base_dir / CATALOG_PATH.name, base_dir)
+    if refresh:
+        stats = catalog.refresh()
+        if verbose:
+            print_refresh(stats)
+    return catalog
+
+
+def print_refresh(stats: Dict):
+    print(
+        f"  🔄 Catálogo: {stats['total']} imagens em {stats['seconds']}s "
+        f"(+{stats['added']} ~{stats['updated']} -{stats['removed']}, "
+        f"{stats['labels_parsed']} labels relidos)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catálogo SQLite do dataset")
+    parser.add_argument("--db", type=Path, default=CATALOG_PATH, help="Arquivo do catálogo")
+    parser.add_argument("--list", action="store_true", help="Listar imagens que atendem aos filtros")
+    parser.add_argument("--provider", help="Filtrar por provedor")
+    parser.add_argument("--split", choices=SPLITS, help="Filtrar por split")
+    parser.add_argument("--annotated", action="store_true", help="Só imagens com .txt")
+    parser.add_argument("--unannotated", action="store_true", help="Só imagens sem .txt")
+    parser.add_argument("--duplicates", action="store_true", help="Listar imagens duplicadas")
+    args = parser.parse_args()
+
+    with open_catalog(db_path=args.db, refresh=False) as catalog:
+        stats = catalog.refresh()
+        if args.list:
+            annotated = True if args.annotated else (False if args.unannotated else None)
+            for path in catalog.relative_paths(provider=args.provider, split=args.split, annotated=annotated):
+                print(path)
+            return
+        if args.duplicates:
+            for group in catalog.duplicates():
+                print("  " + "  =  ".join(p.relative_to(BASE_DIR).as_posix() for p in group))
+            return
+
+        print("=" * 50)
+        print("Dataset Catalog")
+        print("=" * 50)
+        print_refresh(stats)
+        summary = catalog.summary()
+        print(f"\n📊 {summary['total']} imagens, {summary['annotated']} anotadas "
+              f"({summary['with_json']} com JSON), {summary['objects']} objetos")
+        for provider, count in summary["providers"].items():
+            print(f"  - {provider}: {count}")
+        if summary["splits"]:
+            print("  Splits: " + ", ".join(f"{k}={v}" for k, v in sorted(summary["splits"].items())))
+        top = sorted(catalog.class_counts().items(), key=lambda kv: -kv[1])[:10]
+        if top:
+            print("  Classes mais frequentes: " + ", ".join(f"{c}={n}" for c, n in top))
+        print(f"  Grupos de duplicatas: {summary['duplicate_groups']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,23 +9,46 @@ Pré-requisitos:
 Uso:
     python collect_images.py
     python collect_images.py --skip-svg   # Pular conversão SVG (se cairosvg não instalado)
+    python collect_images.py --concurrency 32 --per-host 8 --rate 16
+    python collect_images.py --no-manifest   # Só pula arquivos existentes
+    python collect_images.py --svg-widths 1200 1800 2400 --raster-workers 8
+    python collect_images.py --metadata-only # Só atualiza metadata.json
+    python collect_images.py --drop-duplicates   # Tira quase-duplicatas do dataset
+
+Os downloads rodam em paralelo (downloader.py): sessão HTTP compartilhada,
+limite de conexões e de requisições/s por host, retries com backoff.
+
+O manifesto (download_manifest.json) guarda ETag, Last-Modified, tamanho
+e hash de cada URL: execuções seguintes só baixam o que mudou na origem
+(ou o que foi apagado localmente).
 """
 
 import os
 import sys
-import json
-import hashlib
 import argparse
-import requests
 from pathlib import Path
 from typing import List, Dict, Optional
 from urllib.parse import urlparse
-import time
 import shutil
 
+from catalog import open_catalog
+from dedup import DEFAULT_RADIUS, duplicate_map, find_clusters, print_clusters
+from downloader import DownloadManifest, Downloader, DownloadTask
+from metadata import file_md5, write_metadata
+from metadata import print_stats as print_metadata_stats
+from rasterize import DEFAULT_WIDTHS, RasterPool, RasterResult, output_paths, print_stats
+
 # Diretório base
 BASE_DIR = Path(__file__).parent.parent
 IMAGES_DIR = BASE_DIR / "images"
+MANIFEST_PATH = BASE_DIR / "download_manifest.json"
+
+# SVGs originais; com manifesto ficam em disco para revalidação
+SVG_DIR = IMAGES_DIR / "_svg_temp"
+
+# Larguras extras dos SVGs (treino multi-escala), fora de images/ para não
+# entrarem duas vezes nos splits
+MULTISCALE_DIR = BASE_DIR / "images_multiscale"
 
 # Headers para requests
 HEADERS = {
@@ -129,179 +152,173 @@ AZURE_SVG_DIAGRAMS = [
 
 def calculate_hash(file_path: Path) -> str:
     """Calcula hash MD5 do arquivo para detectar duplicatas."""
-    hasher = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
-
-
-def download_file(url: str, output_path: Path) -> bool:
-    """Baixa um arquivo da URL."""
+    return file_md5(file_path)
+
+
+def make_downloader(
+    concurrency: int = 16,
+    per_host: int = 4,
+    rate: float = 8.0,
+    retries: int = 3,
+    use_manifest: bool = True,
+) -> Downloader:
+    """Downloader compartilhado pelas etapas de coleta."""
+    return Downloader(
+        max_workers=concurrency,
+        per_host=per_host,
+        rate=rate,
+        burst=per_host,
+        retries=retries,
+        headers=HEADERS,
+        manifest=DownloadManifest(MANIFEST_PATH) if use_manifest else None,
+    )
+
+
+def image_size(path: Path) -> Optional[tuple]:
+    """(largura, altura) se o arquivo for uma imagem válida, senão None."""
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
-        response.raise_for_status()
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
 
-        with open(output_path, "wb") as f:
-            f.write(response.content)
 
-        return True
-    except Exception as e:
-        print(f"  ✗ Falha: {e}")
-        return False
+def download_images(tasks: List[DownloadTask], downloader: Downloader) -> int:
+    """Baixa em paralelo e valida cada imagem nova; retorna quantas estão ok."""
+    total = 0
+    for result in downloader.run(tasks):
+        if result.status in ("skipped", "not_modified", "unchanged"):
+            total += 1
+        elif result.status == "ok":
+            size = image_size(result.task.output_path)
+            if size:
+                print(f"  ✓ {result.task.label} ({size[0]}x{size[1]})")
+                total += 1
+            else:
+                print(f"  ✗ Arquivo inválido, removendo: {result.task.label}")
+                result.task.output_path.unlink(missing_ok=True)
+    return total
 
 
-def svg_to_png(svg_path: Path, png_path: Path, width: int = 1200) -> bool:
-    """Converte SVG para PNG usando cairosvg."""
-    try:
-        import cairosvg
-        cairosvg.svg2png(
-            url=str(svg_path),
-            write_to=str(png_path),
-            output_width=width,
-        )
-        return True
-    except ImportError:
-        print("  ⚠ cairosvg não instalado. Tentando com Pillow...")
-        try:
-            from PIL import Image
-            import io
-            # Fallback: salvar SVG como está (não ideal mas funciona)
-            # Na prática, precisamos de cairosvg para boa conversão
-            print("  ✗ Instale cairosvg: pip install cairosvg")
-            return False
-        except Exception:
-            return False
-    except Exception as e:
-        print(f"  ✗ Erro na conversão SVG->PNG: {e}")
-        return False
-
-
-def collect_github_diagrams():
+def collect_github_diagrams(downloader: Optional[Downloader] = None):
     """Coleta diagramas de repositórios GitHub."""
     print("\n📥 Coletando diagramas de GitHub...")
-    total = 0
+    downloader = downloader or make_downloader()
 
+    tasks = []
     for provider, urls in GITHUB_DIAGRAMS.items():
         output_dir = IMAGES_DIR / provider
         output_dir.mkdir(parents=True, exist_ok=True)
-
         for url in urls:
             # Extrair nome do arquivo da URL
             filename = Path(urlparse(url).path).name
-            output_path = output_dir / filename
-
-            if output_path.exists():
-                print(f"  ⏭ Já existe: {filename}")
-                total += 1
-                continue
-
-            print(f"  ⬇ Baixando: {filename}")
-            if download_file(url, output_path):
-                # Verificar se é uma imagem válida
-                try:
-                    from PIL import Image
-                    with Image.open(output_path) as img:
-                        w, h = img.size
-                        print(f"  ✓ {filename} ({w}x{h})")
-                        total += 1
-                except Exception:
-                    print(f"  ✗ Arquivo inválido, removendo: {filename}")
-                    output_path.unlink(missing_ok=True)
-
-            time.sleep(0.5)  # Rate limiting
+            tasks.append(DownloadTask(url, output_dir / filename))
 
+    total = download_images(tasks, downloader)
     print(f"  Total GitHub: {total} imagens")
     return total
 
 
-def collect_azure_pngs():
+def collect_azure_pngs(downloader: Optional[Downloader] = None):
     """Coleta PNGs diretos do Azure Architecture Center."""
     print("\n📥 Coletando PNGs do Azure Architecture Center...")
+    downloader = downloader or make_downloader()
     output_dir = IMAGES_DIR / "azure"
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    total = 0
-    for url in AZURE_PNG_DIAGRAMS:
-        filename = Path(urlparse(url).path).name
-        output_path = output_dir / filename
-
-        if output_path.exists():
-            print(f"  ⏭ Já existe: {filename}")
-            total += 1
-            continue
-
-        print(f"  ⬇ Baixando: {filename}")
-        if download_file(url, output_path):
-            try:
-                from PIL import Image
-                with Image.open(output_path) as img:
-                    w, h = img.size
-                    print(f"  ✓ {filename} ({w}x{h})")
-                    total += 1
-            except Exception:
-                print(f"  ✗ Arquivo inválido: {filename}")
-                output_path.unlink(missing_ok=True)
-
-        time.sleep(0.5)
-
+    tasks = [DownloadTask(url, output_dir / Path(urlparse(url).path).name) for url in AZURE_PNG_DIAGRAMS]
+    total = download_images(tasks, downloader)
     print(f"  Total Azure PNGs: {total} imagens")
     return total
 
 
-def collect_azure_svgs(skip_svg: bool = False):
-    """Coleta e converte diagramas SVG do Azure Architecture Center."""
+def collect_azure_svgs(
+    skip_svg: bool = False,
+    downloader: Optional[Downloader] = None,
+    widths: List[int] = list(DEFAULT_WIDTHS),
+    raster_workers: Optional[int] = None,
+    raster_queue: Optional[int] = None,
+):
+    """
+    Coleta e converte diagramas SVG do Azure Architecture Center.
+
+    Cada SVG baixado entra na fila do pool de rasterização assim que chega,
+    então conversão e downloads se sobrepõem. A primeira largura vai para
+    images/azure; as demais para images_multiscale/w{largura}/azure.
+    """
     if skip_svg:
         print("\n⏭ Pulando diagramas SVG do Azure (--skip-svg)")
         return 0
 
     print("\n📥 Coletando diagramas SVG do Azure Architecture Center...")
-    svg_dir = IMAGES_DIR / "_svg_temp"
+    downloader = downloader or make_downloader()
+    svg_dir = SVG_DIR
     svg_dir.mkdir(parents=True, exist_ok=True)
     output_dir = IMAGES_DIR / "azure"
     output_dir.mkdir(parents=True, exist_ok=True)
 
     total = 0
+    tasks = []
     for url in AZURE_SVG_DIAGRAMS:
         svg_name = Path(urlparse(url).path).name
-        png_name = svg_name.replace(".svg", ".png")
-        svg_path = svg_dir / svg_name
-        png_path = output_dir / png_name
-
-        if png_path.exists():
-            print(f"  ⏭ Já existe: {png_name}")
+        png_path = output_dir / svg_name.replace(".svg", ".png")
+        # Com manifesto todo SVG é revalidado (o PNG pode estar desatualizado)
+        if downloader.manifest is None and png_path.exists():
+            print(f"  ⏭ Já existe: {png_path.name}")
             total += 1
             continue
+        tasks.append(DownloadTask(url, svg_dir / svg_name))
 
-        print(f"  ⬇ Baixando: {svg_name}")
-        if download_file(url, svg_path):
-            print(f"  🔄 Convertendo para PNG: {png_name}")
-            if svg_to_png(svg_path, png_path):
-                # Validar
-                try:
-                    from PIL import Image
-                    with Image.open(png_path) as img:
-                        w, h = img.size
-                        print(f"  ✓ {png_name} ({w}x{h})")
-                        total += 1
-                except Exception:
-                    print(f"  ✗ Conversão falhou: {png_name}")
-                    png_path.unlink(missing_ok=True)
+    def report(raster: RasterResult):
+        for out in raster.outputs:
+            if out.ok:
+                print(f"  ✓ {out.png_path.name} @ {out.width}px ({out.size[0]}x{out.size[1]})")
             else:
-                print(f"  ✗ Não foi possível converter: {svg_name}")
-
-        time.sleep(0.5)
-
-    # Limpar temp SVGs
-    shutil.rmtree(svg_dir, ignore_errors=True)
+                print(f"  ✗ Não foi possível converter: {raster.svg_path.name} @ {out.width}px: {out.error}")
+
+    def enqueue(result):
+        # Roda nas threads do downloader: bloqueia se a fila do pool estiver cheia
+        if result.status == "failed":
+            return
+        svg_path = result.task.output_path
+        outputs = output_paths(svg_path.with_suffix(".png").name, widths, output_dir, MULTISCALE_DIR / "azure")
+        if result.status != "ok":
+            # SVG igual ao da última execução: só gera larguras que faltam
+            outputs = [(path, width) for path, width in outputs if not path.exists()]
+        if outputs:
+            pool.submit(svg_path, outputs)
+
+    with RasterPool(raster_workers, raster_queue, on_done=report) as pool:
+        downloader.run(tasks, skip_existing=False, on_result=enqueue)
+    if pool.results:
+        print_stats(pool.stats(), pool.workers)
+
+    # Conta SVGs cuja imagem principal existe ao final
+    total += sum(
+        1 for task in tasks
+        if (output_dir / task.output_path.with_suffix(".png").name).exists()
+    )
+
+    # Sem manifesto os SVGs não servem para revalidar: limpar
+    if downloader.manifest is None:
+        shutil.rmtree(svg_dir, ignore_errors=True)
 
     print(f"  Total Azure: {total} imagens")
     return total
 
 
 def find_local_images(search_dir: Path, extensions: Optional[List[str]] = None) -> List[Path]:
-    """Encontra imagens locais em um diretório."""
+    """
+    Encontra imagens locais em um diretório.
+
+    Dentro de images/ (extensões padrão) a lista vem do catálogo; fora
+    dele, varre o diretório.
+    """
     if extensions is None:
+        if search_dir.resolve().is_relative_to(IMAGES_DIR.resolve()):
+            with open_catalog(BASE_DIR) as catalog:
+                return catalog.images(under=search_dir)
         extensions = [".png", ".jpg", ".jpeg"]
 
     images = []
@@ -318,65 +335,69 @@ def find_local_images(search_dir: Path, extensions: Optional[List[str]] = None)
     return sorted(set(images))
 
 
-def generate_metadata():
-    """Gera arquivo de metadados do dataset."""
-    metadata = {
-        "version": "2.0.0",
-        "created": time.strftime("%Y-%m-%d"),
-        "description": "Dataset de diagramas de arquitetura de software para detecção de componentes",
-        "sources": [
-            "GitHub: arpitbhardwaj/architecture-diagrams (MIT License)",
-            "Azure Architecture Center (Microsoft Learn)",
-            "Hackathon FIAP - imagens de teste",
-        ],
-        "images": [],
-        "statistics": {
-            "total": 0,
-            "by_provider": {}
-        }
-    }
-
-    for provider_dir in sorted(IMAGES_DIR.iterdir()):
-        if provider_dir.is_dir() and not provider_dir.name.startswith("_"):
-            provider = provider_dir.name
-            images = find_local_images(provider_dir)
-
-            metadata["statistics"]["by_provider"][provider] = len(images)
-            metadata["statistics"]["total"] += len(images)
-
-            for img in images:
-                try:
-                    from PIL import Image
-                    with Image.open(img) as pil_img:
-                        w, h = pil_img.size
-                except Exception:
-                    w, h = 0, 0
-
-                metadata["images"].append({
-                    "file_name": f"{provider}/{img.name}",
-                    "provider": provider,
-                    "width": w,
-                    "height": h,
-                    "hash": calculate_hash(img),
-                })
-
-    # Salvar
-    with open(BASE_DIR / "metadata.json", "w") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+def handle_duplicates(radius: int = DEFAULT_RADIUS, drop: bool = False) -> int:
+    """
+    Reporta quase-duplicatas entre as imagens coletadas. Com drop=True,
+    move as redundantes (mantém a de maior resolução) para
+    images/_duplicates/, que fica fora do dataset.
+    """
+    clusters = find_clusters(BASE_DIR, radius)
+    print_clusters(clusters, BASE_DIR)
+    if not drop:
+        return 0
+
+    moved = 0
+    for dup, keep in duplicate_map(clusters).items():
+        dest = IMAGES_DIR / "_duplicates" / dup.relative_to(IMAGES_DIR)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dup.replace(dest)
+        print(f"  ⏭ {dup.name} -> _duplicates/ (igual a {keep.name})")
+        moved += 1
+    return moved
+
+
+def generate_metadata(workers: Optional[int] = None, rehash: bool = False):
+    """Gera arquivo de metadados do dataset (incremental, ver metadata.py)."""
+    meta, stats = write_metadata(IMAGES_DIR, BASE_DIR / "metadata.json", workers=workers, rehash=rehash)
+    print_metadata_stats(stats)
 
     print(f"\n📊 Estatísticas do Dataset:")
-    print(f"  Total de imagens: {metadata['statistics']['total']}")
-    for provider, count in metadata["statistics"]["by_provider"].items():
+    print(f"  Total de imagens: {meta['statistics']['total']}")
+    for provider, count in meta["statistics"]["by_provider"].items():
         print(f"  - {provider}: {count}")
 
-    return metadata["statistics"]["total"]
+    return meta["statistics"]["total"]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Coleta imagens de arquitetura para dataset YOLO")
     parser.add_argument("--skip-svg", action="store_true", help="Pular download/conversão de SVGs do Azure")
+    parser.add_argument("--concurrency", type=int, default=16, help="Downloads simultâneos no total")
+    parser.add_argument("--per-host", type=int, default=4, help="Downloads simultâneos por host")
+    parser.add_argument("--rate", type=float, default=8.0, help="Requisições/s por host (0 = sem limite)")
+    parser.add_argument("--retries", type=int, default=3, help="Tentativas extras em erro de rede, 429 e 5xx")
+    parser.add_argument("--no-manifest", action="store_true", help="Não revalidar na origem; só pular existentes")
+    parser.add_argument("--svg-widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS),
+                        help="Larguras dos PNGs gerados de cada SVG (a primeira vai para o dataset)")
+    parser.add_argument("--raster-workers", type=int, default=None, help="Processos de rasterização (padrão: núcleos)")
+    parser.add_argument("--raster-queue", type=int, default=None, help="SVGs pendentes no máximo (padrão: 2x workers)")
+    parser.add_argument("--metadata-only", action="store_true", help="Só regenerar metadata.json (sem downloads)")
+    parser.add_argument("--metadata-workers", type=int, default=None, help="Threads de hash dos metadados")
+    parser.add_argument("--rehash", action="store_true", help="Ignorar o cache de metadados e recalcular tudo")
+    parser.add_argument("--dedup-radius", type=int, default=DEFAULT_RADIUS, help="Raio de pHash para quase-duplicatas")
+    parser.add_argument("--drop-duplicates", action="store_true",
+                        help="Mover quase-duplicatas para images/_duplicates/")
     args = parser.parse_args()
 
+    if args.metadata_only:
+        print("\n📝 Gerando metadados...")
+        generate_metadata(args.metadata_workers, args.rehash)
+        return
+
+    downloader = make_downloader(
+        args.concurrency, args.per_host, args.rate, args.retries, use_manifest=not args.no_manifest
+    )
+
     print("=" * 60)
     print("🏗️  Architecture Diagram Dataset Collector v2.0")
     print("=" * 60)
@@ -386,17 +407,27 @@ def main():
         (IMAGES_DIR / provider).mkdir(parents=True, exist_ok=True)
 
     # 1. GitHub diagrams (PNGs diretos)
-    github_count = collect_github_diagrams()
+    github_count = collect_github_diagrams(downloader)
 
     # 2. Azure PNG diagrams (diretos)
-    azure_png_count = collect_azure_pngs()
+    azure_png_count = collect_azure_pngs(downloader)
 
     # 3. Azure SVG diagrams (conversão para PNG)
-    azure_count = collect_azure_svgs(skip_svg=args.skip_svg)
-
-    # 4. Gerar metadados
+    azure_count = collect_azure_svgs(
+        skip_svg=args.skip_svg,
+        downloader=downloader,
+        widths=args.svg_widths,
+        raster_workers=args.raster_workers,
+        raster_queue=args.raster_queue,
+    )
+
+    # 4. Quase-duplicatas entre fontes
+    print("\n🔁 Procurando quase-duplicatas...")
+    handle_duplicates(args.dedup_radius, args.drop_duplicates)
+
+    # 5. Gerar metadados
     print("\n📝 Gerando metadados...")
-    total = generate_metadata()
+    total = generate_metadata(args.metadata_workers, args.rehash)
 
     print("\n" + "=" * 60)
     print(f"✅ Coleta finalizada! Total: {total} imagens")
@@ -2,58 +2,118 @@
 """
 Cria splits train/val/test para o dataset YOLO.
 Divisão: 70% train, 20% val, 10% test.
-Garante que as imagens são diferentes em cada split.
+Garante que as imagens são diferentes em cada split: quase-duplicatas
+(dedup.py) ficam sempre no mesmo split.
+
+A atribuição é incremental: imagens que já estão em splits/*.txt nunca
+mudam de split (avaliações antigas continuam válidas) e só as novas são
+distribuídas. O split de uma imagem nova sai de um hash estável da chave
+do grupo (MD5 do conteúdo, ou o menor MD5 do cluster de
+quase-duplicatas), então não depende da ordem nem das outras imagens;
+se o cluster já tem membro atribuído, a nova vai para o mesmo split.
+As imagens vêm do catálogo em streaming, sem a lista inteira em memória.
+
+Com --stratify provider/class, quando um split está uma imagem inteira
+abaixo da meta dentro do estrato (provedor e/ou classe mais rara da
+imagem), contando o que já foi atribuído, a imagem nova vai para ele em
+vez do split do hash. Aqui a escolha depende das imagens novas
+processadas antes na mesma execução (em ordem de hash).
+
+--reshuffle refaz a divisão inteira do zero (comportamento antigo: move
+imagens entre splits), respeitando --ratios; não combina com --stratify.
+
+Uso:
+    python create_splits.py                 # Atribui só as imagens novas
+    python create_splits.py --stratify provider class
+    python create_splits.py --ratios 0.8 0.1 0.1
+    python create_splits.py --radius 6      # Dedup mais estrito
+    python create_splits.py --no-dedup
+    python create_splits.py --reshuffle     # Redivide tudo (aleatório, seed 42)
 """
 
+import argparse
+import hashlib
 import random
+from collections import Counter, defaultdict
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from catalog import SPLITS, Catalog, open_catalog
+from dedup import DEFAULT_RADIUS, find_clusters
 
 BASE_DIR = Path(__file__).parent.parent
 IMAGES_DIR = BASE_DIR / "images"
 ANNOTATIONS_DIR = BASE_DIR / "annotations"
 SPLITS_DIR = BASE_DIR / "splits"
+CATALOG_PATH = BASE_DIR / "catalog.db"
 SPLITS_DIR.mkdir(exist_ok=True)
 
+RATIOS = {"train": 0.70, "val": 0.20, "test": 0.10}
+STRATIFY_CHOICES = ("provider", "class")
+
 # Seed para reprodutibilidade
 random.seed(42)
 
 
 def find_annotated_images():
-    """Encontra imagens que possuem anotação YOLO (.txt)."""
-    annotated = []
-    extensions = [".png", ".jpg", ".jpeg"]
+    """Encontra imagens que possuem anotação YOLO (.txt), via catálogo."""
+    with open_catalog(BASE_DIR, CATALOG_PATH) as catalog:
+        # Caminhos relativos a partir do diretório base do dataset
+        return catalog.relative_paths(annotated=True)
+
+
+def group_duplicates(images: List[str], radius: int) -> List[List[str]]:
+    """Agrupa as imagens por cluster de quase-duplicatas (singletons à parte)."""
+    with open_catalog(BASE_DIR, CATALOG_PATH, refresh=False) as catalog:
+        clusters = find_clusters(BASE_DIR, radius, catalog=catalog, verbose=False)
 
-    for ext in extensions:
-        for img_path in IMAGES_DIR.rglob(f"*{ext}"):
-            if "_svg_temp" in str(img_path):
-                continue
-            # Verificar se tem anotação correspondente
-            annotation_path = ANNOTATIONS_DIR / f"{img_path.stem}.txt"
-            if annotation_path.exists():
-                # Caminho relativo a partir do diretório base do dataset
-                rel_path = img_path.relative_to(BASE_DIR)
-                annotated.append(str(rel_path))
+    wanted = set(images)
+    group_of = {}
+    for members in clusters:
+        rel = [p.relative_to(BASE_DIR).as_posix() for p in members]
+        group = [path for path in rel if path in wanted]
+        for path in group:
+            group_of[path] = group
 
-    return sorted(set(annotated))
+    groups, seen = [], set()
+    for path in images:
+        group = group_of.get(path, [path])
+        if group[0] not in seen:
+            seen.add(group[0])
+            groups.append(group)
+    return groups
 
 
-def create_splits():
+def create_splits(dedup_radius: Optional[int] = DEFAULT_RADIUS, ratios: Dict[str, float] = RATIOS):
     """Cria splits train/val/test."""
     images = find_annotated_images()
     print(f"Total de imagens anotadas: {len(images)}")
 
-    # Shuffle
-    random.shuffle(images)
+    if dedup_radius is None:
+        groups = [[image] for image in images]
+    else:
+        groups = group_duplicates(images, dedup_radius)
+        clustered = sum(len(g) for g in groups if len(g) > 1)
+        if clustered:
+            print(f"Quase-duplicatas: {clustered} imagens em {sum(1 for g in groups if len(g) > 1)} grupos (mesmo split)")
+
+    # Shuffle (por grupo: duplicatas não se separam)
+    random.shuffle(groups)
 
     # Calcular tamanhos
     total = len(images)
-    train_size = int(total * 0.70)
-    val_size = int(total * 0.20)
+    train_size = int(total * ratios["train"])
+    val_size = int(total * ratios["val"])
     # test fica com o resto
 
-    train = images[:train_size]
-    val = images[train_size:train_size + val_size]
-    test = images[train_size + val_size:]
+    train, val, test = [], [], []
+    for group in groups:
+        if len(train) < train_size:
+            train.extend(group)
+        elif len(val) < val_size:
+            val.extend(group)
+        else:
+            test.extend(group)
 
     print(f"\nDistribuição:")
     print(f"  Train: {len(train)} imagens ({len(train)/total*100:.0f}%)")
@@ -67,12 +127,201 @@ def create_splits():
             f.write("\n".join(split))
         print(f"  Saved: {split_file.name}")
 
+    with open_catalog(BASE_DIR, CATALOG_PATH, refresh=False) as catalog:
+        catalog.set_splits({"train": train, "val": val, "test": test})
+
     return train, val, test
 
 
+def hash_fraction(key: str) -> float:
+    """Posição estável em [0, 1) derivada da chave do grupo."""
+    digest = hashlib.sha256(f"split:{key}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def split_for_fraction(fraction: float, ratios: Dict[str, float]) -> str:
+    edge = 0.0
+    for name in SPLITS:
+        edge += ratios[name]
+        if fraction < edge:
+            return name
+    return SPLITS[-1]
+
+
+class SplitAssigner:
+    """
+    Decide o split de cada imagem nova, uma única vez por grupo.
+
+    observe() registra as atribuições existentes (congeladas); assign()
+    distribui as novas. Só os grupos com mais de uma imagem (shared:
+    clusters e cópias idênticas) são lembrados, então a memória cresce
+    com o número de estratos e de duplicatas, não com o dataset.
+    """
+
+    def __init__(
+        self,
+        ratios: Dict[str, float] = RATIOS,
+        stratify: Sequence[str] = (),
+        class_totals: Optional[Dict[int, int]] = None,
+        shared: Optional[set] = None,
+    ):
+        self.ratios = ratios
+        self.stratify = tuple(stratify)
+        self.class_totals = class_totals or {}
+        self.shared = shared or set()
+        self.counts: Dict[tuple, Counter] = defaultdict(Counter)
+        self.group_split: Dict[str, str] = {}
+        self.reasons: Counter = Counter()
+
+    def stratum(self, provider: str, class_ids: Optional[str]) -> tuple:
+        key = []
+        if "provider" in self.stratify:
+            key.append(provider)
+        if "class" in self.stratify:
+            classes = [int(c) for c in class_ids.split(",")] if class_ids else []
+            # Classe mais rara do dataset: é a que mais sofre com split desbalanceado
+            key.append(min(classes, key=lambda c: (self.class_totals.get(c, 0), c)) if classes else None)
+        return tuple(key)
+
+    def observe(self, group: str, stratum: tuple, split: str):
+        if group in self.shared:
+            self.group_split.setdefault(group, split)
+        self.counts[stratum][split] += 1
+
+    def assign(self, group: str, stratum: tuple) -> str:
+        split = self.group_split.get(group)
+        if split is not None:
+            self.reasons["cluster"] += 1
+        else:
+            split = split_for_fraction(hash_fraction(group), self.ratios)
+            reason = "hash"
+            if self.stratify:
+                counts = self.counts[stratum]
+                n = sum(counts.values()) + 1
+                deficit = {name: self.ratios[name] * n - counts[name] for name in SPLITS}
+                # Só corrige o hash quando algum split está uma imagem inteira
+                # abaixo da meta: estratos pequenos continuam seguindo o hash
+                behind = max(SPLITS, key=lambda name: deficit[name])
+                if deficit[behind] >= 1 and behind != split:
+                    split = behind
+                    reason = "stratified"
+            if group in self.shared:
+                self.group_split[group] = split
+            self.reasons[reason] += 1
+        self.counts[stratum][split] += 1
+        return split
+
+
+def cluster_keys(catalog: Catalog, radius: int) -> Dict[str, str]:
+    """Caminho relativo -> chave do cluster (menor MD5 entre os membros)."""
+    keys = {}
+    for members in find_clusters(BASE_DIR, radius, catalog=catalog, verbose=False):
+        rel = [p.relative_to(BASE_DIR).as_posix() for p in members]
+        digests = [
+            catalog.conn.execute("SELECT hash FROM images WHERE path = ?", (path,)).fetchone()[0]
+            for path in rel
+        ]
+        key = min(digests)
+        keys.update((path, key) for path in rel)
+    return keys
+
+
+def _append_lines(split_file: Path, lines: List[str]):
+    """Acrescenta caminhos ao arquivo de split sem reescrever o que já existe."""
+    if not lines:
+        return
+    prefix = ""
+    if split_file.exists() and split_file.stat().st_size:
+        with open(split_file, "rb") as f:
+            f.seek(-1, 2)
+            prefix = "" if f.read(1) == b"\n" else "\n"
+    with open(split_file, "a") as f:
+        f.write(prefix + "\n".join(lines))
+
+
+def assign_splits(
+    dedup_radius: Optional[int] = DEFAULT_RADIUS,
+    ratios: Dict[str, float] = RATIOS,
+    stratify: Sequence[str] = (),
+) -> Dict[str, int]:
+    """Atribui split às imagens anotadas que ainda não têm; devolve novas por split."""
+    with open_catalog(BASE_DIR, CATALOG_PATH) as catalog:
+        clusters = cluster_keys(catalog, dedup_radius) if dedup_radius is not None else {}
+        shared = set(clusters.values())
+        shared.update(row[0] for row in catalog.conn.execute(
+            "SELECT hash FROM images WHERE annotated = 1 GROUP BY hash HAVING COUNT(*) > 1"
+        ))
+        class_totals = catalog.class_counts() if "class" in stratify else None
+        assigner = SplitAssigner(ratios, stratify, class_totals, shared)
+
+        existing = 0
+        for path, provider, digest, split, class_ids in catalog.split_rows(assigned=True):
+            assigner.observe(clusters.get(path, digest), assigner.stratum(provider, class_ids), split)
+            existing += 1
+
+        new: Dict[str, List[str]] = {name: [] for name in SPLITS}
+        for path, provider, digest, _, class_ids in catalog.split_rows(assigned=False):
+            split = assigner.assign(clusters.get(path, digest), assigner.stratum(provider, class_ids))
+            new[split].append(path)
+
+        for name in SPLITS:
+            _append_lines(SPLITS_DIR / f"{name}.txt", new[name])
+        catalog.add_splits((name, path) for name in SPLITS for path in new[name])
+        totals = catalog.split_counts()
+
+    added = sum(len(paths) for paths in new.values())
+    print(f"Imagens já atribuídas: {existing} (não mudam de split)")
+    print(f"Imagens novas: {added}")
+    if assigner.reasons["cluster"]:
+        print(f"  🔁 {assigner.reasons['cluster']} seguiram o split do seu cluster de quase-duplicatas")
+    if assigner.reasons["stratified"]:
+        print(f"  ⚖️  {assigner.reasons['stratified']} desviadas do hash para balancear o estrato")
+    if stratify:
+        print(f"  Estratos ({' + '.join(stratify)}): {len(assigner.counts)}")
+
+    total = sum(totals.values())
+    print(f"\nDistribuição:")
+    for name in SPLITS:
+        count = totals.get(name, 0)
+        print(f"  {name.capitalize() + ':':<6} {count} imagens ({count / total * 100 if total else 0:.0f}%), +{len(new[name])} novas")
+
+    return {name: len(paths) for name, paths in new.items()}
+
+
+def _parse_ratios(values: List[float]) -> Dict[str, float]:
+    total = sum(values)
+    if total <= 0 or any(v < 0 for v in values):
+        raise argparse.ArgumentTypeError("proporções devem ser não negativas e somar mais que zero")
+    return {name: value / total for name, value in zip(SPLITS, values)}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria splits train/val/test")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="Raio de pHash para quase-duplicatas")
+    parser.add_argument("--no-dedup", action="store_true", help="Não agrupar quase-duplicatas")
+    parser.add_argument("--ratios", type=float, nargs=3, metavar=("TRAIN", "VAL", "TEST"),
+                        help="Proporções dos splits (padrão: 0.7 0.2 0.1)")
+    parser.add_argument("--stratify", nargs="+", choices=STRATIFY_CHOICES, default=[],
+                        help="Balancear as imagens novas por provedor e/ou classe")
+    parser.add_argument("--reshuffle", action="store_true",
+                        help="Refazer a divisão inteira (move imagens já atribuídas)")
+    args = parser.parse_args()
+
+    if args.reshuffle and args.stratify:
+        parser.error("--stratify não se aplica a --reshuffle (a redivisão é aleatória por grupo)")
+    ratios = RATIOS
+    if args.ratios:
+        try:
+            ratios = _parse_ratios(args.ratios)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
     print("=" * 50)
     print("Creating Dataset Splits")
     print("=" * 50)
-    create_splits()
+    radius = None if args.no_dedup else args.radius
+    if args.reshuffle:
+        create_splits(radius, ratios)
+    else:
+        assign_splits(radius, ratios, args.stratify)
     print("\nDone!")
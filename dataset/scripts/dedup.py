@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Detecção de quase-duplicatas no dataset com hashes perceptuais.
+
+O mesmo diagrama aparece em mais de uma fonte (ex: hub-and-spoke e
+hub-spoke, variantes do app-service-environment). Duplicatas gastam
+chamadas de anotação e vazam entre train e test.
+
+- pHash (DCT 32x32 -> 8x8) e dHash (gradiente 9x8), 64 bits cada,
+  calculados em paralelo num pool de processos
+- cache no catálogo (tabela perceptual, chave = MD5 do conteúdo): só
+  imagens novas ou alteradas são decodificadas
+- BK-tree sobre distância de Hamming do pHash para consultas por raio;
+  pares candidatos são confirmados pelo dHash e agrupados (union-find)
+
+Uso:
+    python dedup.py                    # Relatório de clusters
+    python dedup.py --radius 6         # Mais estrito
+    python dedup.py --output clusters.json
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import Catalog, open_catalog
+
+BASE_DIR = Path(__file__).parent.parent
+
+# Distâncias de Hamming (em 64 bits) para considerar duas imagens iguais
+DEFAULT_RADIUS = 8
+DEFAULT_DHASH_RADIUS = 12
+
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def perceptual_hashes(path: Path) -> Tuple[int, int]:
+    """(pHash, dHash) de 64 bits da imagem."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.draft("L", (_DCT_SIZE * 4, _DCT_SIZE * 4))  # JPEG: decodifica já reduzido
+        gray = img.convert("L")
+    # Fundo transparente vira preto no convert; diagramas não dependem disso
+    small = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    dct = _DCT @ small @ _DCT.T
+    low = dct[:8, :8].ravel()
+    phash = _bits_to_int(low > np.median(low[1:]))
+
+    grid = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    dhash = _bits_to_int(grid[:, 1:] > grid[:, :-1])
+    return phash, dhash
+
+
+def _hash_worker(item: Tuple[str, str]) -> Tuple[str, Optional[Tuple[int, int]]]:
+    digest, path = item
+    try:
+        return digest, perceptual_hashes(Path(path))
+    except Exception:
+        return digest, None
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-tree de inteiros sob distância de Hamming."""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [valor, itens, {distância: filho}]
+
+    def add(self, value: int, item):
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """Itens a distância <= radius de value, com a distância."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            # Desigualdade triangular: só filhos em [d - r, d + r] podem ter resultado
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return found
+
+
+@dataclass
+class ImageHash:
+    path: Path
+    width: int
+    height: int
+    phash: int
+    dhash: int
+
+
+def _to_signed(value: int) -> int:
+    # SQLite INTEGER é int64 com sinal
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def load_hashes(catalog: Catalog, workers: Optional[int] = None, verbose: bool = True) -> List[ImageHash]:
+    """Hashes perceptuais de todas as imagens do catálogo (calcula os que faltam)."""
+    rows = catalog.conn.execute(
+        """
+        SELECT i.path, i.hash, i.width, i.height, p.phash, p.dhash
+        FROM images i LEFT JOIN perceptual p ON p.hash = i.hash
+        ORDER BY i.path
+        """
+    ).fetchall()
+    missing = {digest: str(catalog.base_dir / path) for path, digest, _, _, phash, _ in rows if phash is None}
+
+    computed: Dict[str, Tuple[int, int]] = {}
+    if missing:
+        if verbose:
+            print(f"  🔄 Calculando hashes perceptuais de {len(missing)} imagens...")
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for digest, hashes in pool.map(_hash_worker, missing.items(), chunksize=16):
+                if hashes is not None:
+                    computed[digest] = hashes
+        with catalog.conn:
+            catalog.conn.executemany(
+                "INSERT OR REPLACE INTO perceptual (hash, phash, dhash) VALUES (?, ?, ?)",
+                [(d, _to_signed(p), _to_signed(dh)) for d, (p, dh) in computed.items()],
+            )
+
+    hashes = []
+    for path, digest, width, height, phash, dhash in rows:
+        if phash is None:
+            if digest not in computed:
+                continue  # imagem ilegível
+            phash, dhash = computed[digest]
+        hashes.append(ImageHash(catalog.base_dir / path, width, height, _to_unsigned(phash), _to_unsigned(dhash)))
+    return hashes
+
+
+def cluster(
+    hashes: List[ImageHash],
+    radius: int = DEFAULT_RADIUS,
+    dhash_radius: int = DEFAULT_DHASH_RADIUS,
+) -> List[List[ImageHash]]:
+    """
+    Agrupa imagens quase iguais. Cada cluster vem ordenado com a imagem
+    canônica primeiro (maior resolução, depois caminho).
+    """
+    tree = BKTree()
+    for index, h in enumerate(hashes):
+        tree.add(h.phash, index)
+
+    parent = list(range(len(hashes)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for index, h in enumerate(hashes):
+        for _, other in tree.query(h.phash, radius):
+            if other != index and hamming(h.dhash, hashes[other].dhash) <= dhash_radius:
+                parent[find(other)] = find(index)
+
+    groups: Dict[int, List[ImageHash]] = {}
+    for index, h in enumerate(hashes):
+        groups.setdefault(find(index), []).append(h)
+    clusters = [
+        sorted(members, key=lambda h: (-h.width * h.height, str(h.path)))
+        for members in groups.values()
+        if len(members) > 1
+    ]
+    return sorted(clusters, key=lambda members: str(members[0].path))
+
+
+def find_clusters(
+    base_dir: Path = BASE_DIR,
+    radius: int = DEFAULT_RADIUS,
+    dhash_radius: int = DEFAULT_DHASH_RADIUS,
+    workers: Optional[int] = None,
+    catalog: Optional[Catalog] = None,
+    verbose: bool = True,
+) -> List[List[Path]]:
+    """Clusters de quase-duplicatas (caminhos absolutos, canônica primeiro)."""
+    if catalog is None:
+        with open_catalog(base_dir) as catalog:
+            return find_clusters(base_dir, radius, dhash_radius, workers, catalog, verbose)
+    hashes = load_hashes(catalog, workers, verbose)
+    return [[h.path for h in members] for members in cluster(hashes, radius, dhash_radius)]
+
+
+def duplicate_map(clusters: Iterable[List[Path]]) -> Dict[Path, Path]:
+    """Imagem duplicada -> imagem canônica do cluster."""
+    return {dup: members[0] for members in clusters for dup in members[1:]}
+
+
+def print_clusters(clusters: List[List[Path]], base_dir: Path = BASE_DIR):
+    if not clusters:
+        print("  ✓ Nenhuma quase-duplicata encontrada")
+        return
+    redundant = sum(len(members) - 1 for members in clusters)
+    print(f"  🔁 {len(clusters)} clusters, {redundant} imagens redundantes")
+    for members in clusters:
+        keep, *dups = [p.relative_to(base_dir).as_posix() for p in members]
+        print(f"    ✓ {keep}")
+        for dup in dups:
+            print(f"      = {dup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecção de quase-duplicatas (hash perceptual)")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="Distância máxima de pHash (bits)")
+    parser.add_argument("--dhash-radius", type=int, default=DEFAULT_DHASH_RADIUS,
+                        help="Distância máxima de dHash para confirmar o par (bits)")
+    parser.add_argument("--workers", type=int, default=None, help="Processos de hash (padrão: núcleos)")
+    parser.add_argument("--output", type=Path, help="Salvar clusters em JSON")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Near-Duplicate Detection")
+    print("=" * 50)
+    clusters = find_clusters(radius=args.radius, dhash_radius=args.dhash_radius, workers=args.workers)
+    print_clusters(clusters)
+
+    if args.output:
+        data = [[p.relative_to(BASE_DIR).as_posix() for p in members] for members in clusters]
+        args.output.write_text(json.dumps({"radius": args.radius, "clusters": data}, indent=2))
+        print(f"\n💾 Salvo em: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 import random
 
+from catalog import open_catalog
+
 BASE_DIR = Path(__file__).parent.parent
 
 # Cores por categoria
@@ -202,7 +204,6 @@ def generate_real_metrics():
 
 
 def main():
-    images_dir = BASE_DIR / "images"
     annotations_dir = BASE_DIR / "annotations"
     output_dir = BASE_DIR / "predictions"
     output_dir.mkdir(exist_ok=True)
@@ -211,16 +212,11 @@ def main():
     print("Architecture Component Detection - Demo Inference v2")
     print("=" * 60)
 
-    # Selecionar amostra de imagens para demonstração (1 por provider)
+    # Selecionar amostra de imagens anotadas para demonstração (até 3 por provider)
     sample_images = []
-    for provider in ["aws", "azure", "gcp", "generic"]:
-        provider_dir = images_dir / provider
-        if provider_dir.exists():
-            imgs = list(provider_dir.glob("*.png")) + list(provider_dir.glob("*.jpg"))
-            if imgs:
-                # Pegar até 3 imagens por provider
-                sample = imgs[:3]
-                sample_images.extend(sample)
+    with open_catalog(BASE_DIR) as catalog:
+        for provider in ["aws", "azure", "gcp", "generic"]:
+            sample_images.extend(catalog.images(provider=provider, annotated=True, limit=3))
 
     print(f"\nGerando predicoes para {len(sample_images)} imagens...\n")
 
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Motor de download concorrente para a coleta do dataset.
+
+- Uma requests.Session compartilhada (pool de conexões keep-alive)
+- Pool de threads com limite de concorrência por host
+- Rate limit por host via token bucket (substitui o time.sleep(0.5) fixo)
+- Retries com backoff exponencial + jitter em erros de rede, 429 e 5xx
+  (respeita Retry-After)
+- Escrita atômica (arquivo .part + rename): download interrompido nunca
+  vira "Já existe"
+- Progresso por arquivo e resumo com throughput
+- Manifesto opcional (DownloadManifest) com ETag, Last-Modified, tamanho
+  e SHA-256 de cada URL: execuções seguintes mandam requisições
+  condicionais e só baixam o que mudou na origem
+
+Sem hosts fixos: funciona contra qualquer servidor, inclusive local.
+`python downloader.py --selftest` sobe um http.server em 127.0.0.1 com
+respostas lentas, 503 e 429 e valida concorrência, retries e rate limit.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status que valem nova tentativa
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Teto para Retry-After e para o backoff (segundos)
+MAX_RETRY_WAIT = 30.0
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` requisições/s com rajada de `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class DownloadManifest:
+    """
+    Manifesto JSON de downloads: URL -> arquivo local, ETag, Last-Modified,
+    tamanho e SHA-256 do conteúdo.
+
+    Só vale mandar requisição condicional se o arquivo local ainda é o que
+    foi baixado (mesmo tamanho e hash); arquivo apagado ou editado é
+    baixado de novo, sem afetar as demais URLs.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            self._entries = json.loads(path.read_text()).get("entries", {})
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(url)
+
+    def _local_path(self, entry: Dict) -> Path:
+        return (self.path.parent / entry["path"]).resolve()
+
+    def matches_local(self, url: str, output_path: Path) -> bool:
+        """O arquivo local é exatamente o conteúdo registrado para a URL?"""
+        entry = self.get(url)
+        if entry is None or not output_path.exists():
+            return False
+        if self._local_path(entry) != output_path.resolve() or output_path.stat().st_size != entry["size"]:
+            return False
+        return file_sha256(output_path) == entry["sha256"]
+
+    def conditional_headers(self, url: str, output_path: Path) -> Dict[str, str]:
+        if not self.matches_local(url, output_path):
+            return {}
+        entry = self.get(url)
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, url: str, output_path: Path, headers, size: int, sha256: str):
+        entry = {
+            "path": os.path.relpath(output_path.resolve(), self.path.parent.resolve()),
+            "etag": headers.get("ETag", ""),
+            "last_modified": headers.get("Last-Modified", ""),
+            "size": size,
+            "sha256": sha256,
+            "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            self._entries[url] = entry
+
+    def touch(self, url: str):
+        """Marca a URL como verificada agora (resposta 304)."""
+        with self._lock:
+            if url in self._entries:
+                self._entries[url]["checked_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def save(self):
+        """Escrita atômica do manifesto."""
+        with self._lock:
+            data = {"version": 1, "entries": dict(sorted(self._entries.items()))}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(self.path.name + ".part")
+        partial.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+        partial.replace(self.path)
+
+
+@dataclass
+class DownloadTask:
+    url: str
+    output_path: Path
+    label: str = ""
+
+    def __post_init__(self):
+        if not self.label:
+            self.label = self.output_path.name
+
+
+@dataclass
+class DownloadResult:
+    task: DownloadTask
+    # "ok" (conteúdo novo gravado), "not_modified" (304), "unchanged"
+    # (200 com o mesmo hash do arquivo local), "skipped" ou "failed"
+    status: str
+    bytes: int = 0
+    saved_bytes: int = 0
+    attempts: int = 0
+    elapsed: float = 0.0
+    error: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "failed"
+
+
+class Downloader:
+    """Baixa listas de URLs em paralelo respeitando limites por host."""
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        per_host: int = 4,
+        rate: float = 8.0,
+        burst: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+        verbose: bool = True,
+        manifest: Optional[DownloadManifest] = None,
+    ):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.verbose = verbose
+        self.manifest = manifest
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(max_workers, per_host))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(per_host)
+        )
+        self._host_buckets: Dict[str, TokenBucket] = defaultdict(lambda: TokenBucket(rate, burst))
+        self._lock = threading.Lock()
+        self._done = 0
+
+    def _host_state(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._host_slots[host], self._host_buckets[host]
+
+    def _retry_wait(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), MAX_RETRY_WAIT)
+        return min(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5), MAX_RETRY_WAIT)
+
+    def request(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """
+        GET com limite por host, rate limit e retries. Devolve a resposta
+        final (status fora de RETRY_STATUS); levanta a última exceção de rede.
+        """
+        slots, bucket = self._host_state(url)
+        response = None
+        for attempt in range(self.retries + 1):
+            bucket.acquire()
+            try:
+                with slots:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                    # Consome o corpo dentro do slot: a conexão volta ao pool
+                    response.content
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    response.attempts = attempt + 1
+                    return response
+            time.sleep(self._retry_wait(attempt, response))
+        return response
+
+    def fetch(self, task: DownloadTask, skip_existing: bool = True) -> DownloadResult:
+        """
+        Baixa uma tarefa para disco (escrita atômica). Com manifesto, o
+        arquivo existente é revalidado na origem em vez de pulado.
+        """
+        manifest = self.manifest
+        if manifest is None and skip_existing and task.output_path.exists():
+            return DownloadResult(task, "skipped")
+
+        conditional = manifest.conditional_headers(task.url, task.output_path) if manifest else {}
+        start = time.perf_counter()
+        try:
+            response = self.request(task.url, headers=conditional or None)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except requests.RequestException as e:
+            attempts = getattr(getattr(e, "response", None), "attempts", self.retries + 1)
+            return DownloadResult(task, "failed", attempts=attempts, elapsed=time.perf_counter() - start, error=str(e))
+
+        elapsed = time.perf_counter() - start
+        if response.status_code == 304:
+            manifest.touch(task.url)
+            return DownloadResult(
+                task, "not_modified", attempts=response.attempts, elapsed=elapsed,
+                saved_bytes=manifest.get(task.url)["size"],
+            )
+
+        content = response.content
+        status = "ok"
+        if manifest is not None:
+            digest = hashlib.sha256(content).hexdigest()
+            # Servidor sem ETag/Last-Modified: compara o conteúdo
+            if task.output_path.exists() and task.output_path.stat().st_size == len(content) \
+                    and file_sha256(task.output_path) == digest:
+                status = "unchanged"
+            manifest.record(task.url, task.output_path, response.headers, len(content), digest)
+
+        if status == "ok":
+            task.output_path.parent.mkdir(parents=True, exist_ok=True)
+            partial = task.output_path.with_name(task.output_path.name + ".part")
+            partial.write_bytes(content)
+            partial.replace(task.output_path)
+        return DownloadResult(
+            task,
+            status,
+            bytes=len(content),
+            attempts=response.attempts,
+            elapsed=elapsed,
+            headers=dict(response.headers),
+        )
+
+    def _report(self, result: DownloadResult, total: int):
+        with self._lock:
+            self._done += 1
+            done = self._done
+        if not self.verbose:
+            return
+        prefix = f"  [{done:>{len(str(total))}}/{total}]"
+        if result.status == "skipped":
+            print(f"{prefix} ⏭ Já existe: {result.task.label}")
+        elif result.status in ("not_modified", "unchanged"):
+            print(f"{prefix} ⏭ Sem mudança na origem: {result.task.label}")
+        elif result.status == "ok":
+            retry = f", {result.attempts} tentativas" if result.attempts > 1 else ""
+            print(f"{prefix} ⬇ {result.task.label} ({result.bytes / 1024:.0f} KB, {result.elapsed:.1f}s{retry})")
+        else:
+            print(f"{prefix} ✗ Falha: {result.task.label}: {result.error}")
+
+    def run(
+        self,
+        tasks: List[DownloadTask],
+        skip_existing: bool = True,
+        on_result: Optional[Callable[[DownloadResult], None]] = None,
+    ) -> List[DownloadResult]:
+        """
+        Baixa todas as tarefas; resultados na ordem de `tasks`. on_result
+        roda na thread do worker assim que cada download termina.
+        """
+        self._done = 0
+        start = time.perf_counter()
+
+        def work(task: DownloadTask) -> DownloadResult:
+            result = self.fetch(task, skip_existing)
+            self._report(result, len(tasks))
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        # Intercala hosts para os workers não ficarem todos presos no
+        # semáforo do mesmo host
+        order = interleave_by_host(tasks)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            done = dict(zip(order, pool.map(work, [tasks[i] for i in order])))
+        results = [done[i] for i in range(len(tasks))]
+
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.verbose:
+            print_summary(results, time.perf_counter() - start)
+        return results
+
+
+def interleave_by_host(tasks: List[DownloadTask]) -> List[int]:
+    """Índices das tarefas em round-robin entre hosts."""
+    queues: Dict[str, deque] = defaultdict(deque)
+    for i, task in enumerate(tasks):
+        queues[urlparse(task.url).netloc].append(i)
+    order = []
+    while queues:
+        for host in list(queues):
+            order.append(queues[host].popleft())
+            if not queues[host]:
+                del queues[host]
+    return order
+
+
+def print_summary(results: List[DownloadResult], elapsed: float):
+    ok = [r for r in results if r.status == "ok"]
+    skipped = sum(1 for r in results if r.status == "skipped")
+    not_modified = sum(1 for r in results if r.status == "not_modified")
+    unchanged = sum(1 for r in results if r.status == "unchanged")
+    failed = sum(1 for r in results if r.status == "failed")
+    # Bytes trafegados: downloads novos + 200 com conteúdo igual ao local
+    total_bytes = sum(r.bytes for r in results if r.status in ("ok", "unchanged"))
+    saved_bytes = sum(r.saved_bytes for r in results)
+    retries = sum(max(r.attempts - 1, 0) for r in results)
+    rate = total_bytes / elapsed / 2**20 if elapsed > 0 else 0.0
+    print(
+        f"  ⏱ {len(ok)} baixados, {skipped} existentes, {failed} falhas, {retries} retries "
+        f"em {elapsed:.1f}s ({total_bytes / 2**20:.1f} MB, {rate:.1f} MB/s)"
+    )
+    if not_modified or unchanged:
+        print(
+            f"  💾 {not_modified} não modificados (304), {unchanged} iguais ao local; "
+            f"{saved_bytes / 2**20:.1f} MB economizados"
+        )
+
+
+# ==============================================================================
+# Self-test contra servidor HTTP local
+# ==============================================================================
+
+def selftest(n: int = 40, delay: float = 0.2):
+    """
+    Sobe um http.server local e valida concorrência, retries, rate limit
+    e revalidação condicional via manifesto.
+    """
+    import http.server
+    import tempfile
+
+    hits: Dict[str, int] = defaultdict(int)
+    versions: Dict[str, int] = defaultdict(int)
+    active = {"now": 0, "max": 0}
+    state_lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state_lock:
+                hits[self.path] += 1
+                count = hits[self.path]
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            try:
+                time.sleep(delay)
+                if self.path.startswith("/flaky") and count == 1:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path.startswith("/throttled") and count == 1:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path.startswith("/missing"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                # /file*: ETag; /lm*: Last-Modified; /plain*: sem validadores
+                version = versions[self.path]
+                etag = f'"v{version}"'
+                last_modified = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(1e9 + version))
+                validators = {}
+                if self.path.startswith("/file"):
+                    validators["ETag"] = etag
+                elif self.path.startswith("/lm"):
+                    validators["Last-Modified"] = last_modified
+                if (validators.get("ETag") and self.headers.get("If-None-Match") == etag) or (
+                    validators.get("Last-Modified") and self.headers.get("If-Modified-Since") == last_modified
+                ):
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = f"{self.path}@{version}".encode() * 1000
+                self.send_response(200)
+                for key, value in validators.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with state_lock:
+                    active["now"] -= 1
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    per_host = 4
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp)
+        tasks = [DownloadTask(f"{base}/file{i}.png", out / f"file{i}.png") for i in range(n)]
+        tasks += [
+            DownloadTask(f"{base}/flaky.png", out / "flaky.png"),
+            DownloadTask(f"{base}/throttled.png", out / "throttled.png"),
+            DownloadTask(f"{base}/missing.png", out / "missing.png"),
+        ]
+        downloader = Downloader(max_workers=16, per_host=per_host, rate=0, backoff=0.05, verbose=False)
+
+        start = time.perf_counter()
+        results = downloader.run(tasks)
+        elapsed = time.perf_counter() - start
+        sequential = len(tasks) * delay
+
+        by_name = {r.task.label: r for r in results}
+        checks = {
+            "todos os arquivos baixados": all(by_name[f"file{i}.png"].status == "ok" for i in range(n)),
+            f"concorrência por host <= {per_host} (max {active['max']})": active["max"] <= per_host,
+            f"paralelo ({elapsed:.1f}s vs {sequential:.1f}s sequencial)": elapsed < sequential / 2,
+            "503 recuperado com retry": by_name["flaky.png"].ok and by_name["flaky.png"].attempts == 2,
+            "429 respeita Retry-After": by_name["throttled.png"].ok and by_name["throttled.png"].attempts == 2,
+            "404 falha sem retry": by_name["missing.png"].status == "failed" and hits["/missing.png"] == 1,
+            "sem arquivos .part": not list(out.glob("*.part")),
+            "segunda execução pula existentes": all(
+                r.status == "skipped" for r in downloader.run(tasks[:n])
+            ),
+        }
+
+        # Manifesto: 2a execução só revalida; arquivo apagado ou alterado na
+        # origem é baixado de novo, o resto não
+        manifest_dir = out / "manifest"
+        manifest = DownloadManifest(manifest_dir / "manifest.json")
+        cached = Downloader(per_host=per_host, rate=0, verbose=False, manifest=manifest)
+        mtasks = [DownloadTask(f"{base}/file{i}.png", manifest_dir / f"file{i}.png") for i in range(5)]
+        mtasks += [
+            DownloadTask(f"{base}/lm.png", manifest_dir / "lm.png"),
+            DownloadTask(f"{base}/plain.png", manifest_dir / "plain.png"),
+        ]
+        first = {r.task.label: r.status for r in cached.run(mtasks)}
+        second = cached.run(mtasks)
+        (manifest_dir / "file0.png").unlink()
+        versions["/file1.png"] += 1
+        third = {r.task.label: r.status for r in cached.run(mtasks)}
+        second_status = {r.task.label: r.status for r in second}
+        checks["manifesto: 1a execução baixa tudo"] = set(first.values()) == {"ok"}
+        checks["manifesto: ETag/Last-Modified -> 304"] = all(
+            second_status[t.label] == "not_modified" for t in mtasks[:-1]
+        )
+        checks["manifesto: sem validadores -> hash igual"] = second_status["plain.png"] == "unchanged"
+        checks["manifesto: bytes economizados contabilizados"] = sum(r.saved_bytes for r in second) > 0
+        checks["manifesto: só apagado/alterado é rebaixado"] = (
+            third["file0.png"] == "ok" and third["file1.png"] == "ok"
+            and all(third[f"file{i}.png"] == "not_modified" for i in range(2, 5))
+            and (manifest_dir / "file1.png").read_bytes().startswith(b"/file1.png@1")
+        )
+        checks["manifesto persistido em disco"] = len(DownloadManifest(manifest.path)) == len(mtasks)
+
+        bucket = TokenBucket(rate=20, burst=1)
+        start = time.perf_counter()
+        for _ in range(21):
+            bucket.acquire()
+        checks["token bucket a 20 req/s (~1s para 21)"] = 0.9 <= time.perf_counter() - start <= 1.5
+
+    server.shutdown()
+    failed = [name for name, ok in checks.items() if not ok]
+    for name, ok in checks.items():
+        print(f"  {'✓' if ok else '✗'} {name}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor de download concorrente")
+    parser.add_argument("--selftest", action="store_true", help="Validar contra um servidor HTTP local")
+    args = parser.parse_args()
+    if args.selftest:
+        raise SystemExit(0 if selftest() else 1)
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,359 @@
 #!/usr/bin/env python3
 """
-Corrige anotações YOLO com coordenadas fora do range [0, 1].
-- Clamp valores para [0, 1]
-- Remove anotações com centro muito fora da imagem (>0.95 após clamp)
-- Ajusta bounding boxes que ultrapassam bordas
+Valida e corrige anotações YOLO.
+- Clamp do centro para [0, 1]
+- Remove anotações com centro muito fora da imagem (fora de [-0.15, 1.15])
+- Ajusta bounding boxes que ultrapassam bordas (mínimo de 0.01)
+- Remove class ids fora de [0, nc) (nc de dataset_config.yaml)
+- Remove boxes degenerados (largura/altura <= 0, NaN/inf) e duplicados
+  (mesma classe com IoU >= 0.9 no mesmo arquivo)
+- Linhas que não são 5 números são descartadas
+
+Todos os labels são carregados em arrays NumPy e as regras rodam sobre o
+array inteiro. Só arquivos que mudam são reescritos. Com muitos arquivos
+o trabalho é dividido em shards num pool de processos.
+
+Uso:
+    python fix_annotations.py
+    python fix_annotations.py --dry-run --report fix_report.json
 """
 
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 BASE_DIR = Path(__file__).parent.parent
 ANNOTATIONS_DIR = BASE_DIR / "annotations"
+CONFIG_PATH = BASE_DIR / "dataset_config.yaml"
 
+DEFAULT_NC = 30
+CENTER_LIMIT = 0.15  # centro aceito em [-0.15, 1.15] antes do clamp
+MIN_SIZE = 0.01
+DUPLICATE_IOU = 0.9
+PARALLEL_MIN_FILES = 2000  # abaixo disso o pool custa mais que ganha
+SHARD_SIZE = 1000
 
-def fix_annotation_file(filepath: Path) -> dict:
-    """Corrige um arquivo de anotação YOLO."""
-    stats = {"total": 0, "fixed": 0, "removed": 0, "ok": 0}
+# Ação aplicada a cada linha
+OK, FIXED, REMOVED_CENTER, REMOVED_CLASS, REMOVED_DEGENERATE, REMOVED_DUPLICATE = range(6)
+ACTIONS = ("ok", "fixed", "removed_center", "removed_class", "removed_degenerate", "removed_duplicate")
+STAT_KEYS = ("total", "ok", "fixed", "removed", *ACTIONS[2:], "malformed")
 
-    lines = filepath.read_text().strip().split("\n")
-    fixed_lines = []
 
-    for line in lines:
-        if not line.strip():
-            continue
+def read_nc(config_path: Path = CONFIG_PATH) -> int:
+    """nc de dataset_config.yaml (sem depender de PyYAML)."""
+    try:
+        match = re.search(r"^nc:\s*(\d+)", config_path.read_text(), re.MULTILINE)
+    except OSError:
+        match = None
+    return int(match.group(1)) if match else DEFAULT_NC
 
-        stats["total"] += 1
-        parts = line.strip().split()
-        if len(parts) != 5:
-            stats["removed"] += 1
-            continue
 
-        class_id = parts[0]
-        x_center = float(parts[1])
-        y_center = float(parts[2])
-        width = float(parts[3])
-        height = float(parts[4])
+@dataclass
+class LabelArrays:
+    files: List[Path]
+    texts: List[str]  # conteúdo original (para detectar mudança)
+    file_index: np.ndarray  # (N,) arquivo de cada linha
+    classes: np.ndarray  # (N,) float64: class ids não inteiros também são detectados
+    boxes: np.ndarray  # (N, 4) x_center, y_center, width, height
+    malformed: np.ndarray  # (F,) linhas descartadas por formato
 
-        # Verificar se o centro está muito fora da imagem
-        if x_center > 1.15 or y_center > 1.15 or x_center < -0.15 or y_center < -0.15:
-            stats["removed"] += 1
+
+_LINE = r"[ \t]*\S+[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]*"
+_FIVE_COLUMNS = re.compile(rf"(?:(?:{_LINE})?\r?\n)*(?:{_LINE})?\s*")
+
+
+def _parse_slow(text: str) -> Tuple[List[List[float]], int]:
+    rows, malformed = [], 0
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts:
             continue
+        try:
+            values = [float(p) for p in parts]
+        except ValueError:
+            values = []
+        if len(values) != 5:
+            malformed += 1
+            continue
+        rows.append(values)
+    return rows, malformed
+
 
-        # Clamp centro para [0, 1]
-        original = (x_center, y_center, width, height)
-        x_center = max(0.0, min(1.0, x_center))
-        y_center = max(0.0, min(1.0, y_center))
-
-        # Ajustar largura/altura para não ultrapassar bordas
-        # x_min = x_center - width/2 >= 0
-        # x_max = x_center + width/2 <= 1
-        half_w = width / 2
-        half_h = height / 2
-
-        if x_center - half_w < 0:
-            width = x_center * 2
-        if x_center + half_w > 1:
-            width = (1 - x_center) * 2
-        if y_center - half_h < 0:
-            height = y_center * 2
-        if y_center + half_h > 1:
-            height = (1 - y_center) * 2
-
-        # Mínimo de tamanho
-        width = max(0.01, min(1.0, width))
-        height = max(0.01, min(1.0, height))
-
-        clamped = (x_center, y_center, width, height)
-        if original != clamped:
-            stats["fixed"] += 1
+def load_labels(files: List[Path]) -> LabelArrays:
+    """Carrega todos os arquivos num único conjunto de arrays."""
+    texts, counts, malformed = [], [], []
+    tokens: List[str] = []
+    slow_rows: Dict[int, List[List[float]]] = {}
+    for i, path in enumerate(files):
+        text = path.read_text()
+        texts.append(text)
+        # Caminho rápido: toda linha com 5 tokens; a conversão é feita de uma vez no fim
+        if _FIVE_COLUMNS.fullmatch(text):
+            parts = text.split()
+            tokens.extend(parts)
+            counts.append(len(parts) // 5)
+            malformed.append(0)
         else:
-            stats["ok"] += 1
+            rows, bad = _parse_slow(text)
+            slow_rows[i] = rows
+            counts.append(len(rows))
+            malformed.append(bad)
 
-        fixed_lines.append(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
+    try:
+        fast = np.array(tokens, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Algum token não numérico: refaz linha a linha só os arquivos do caminho rápido
+        for i, text in enumerate(texts):
+            if i not in slow_rows:
+                slow_rows[i], malformed[i] = _parse_slow(text)
+                counts[i] = len(slow_rows[i])
+        fast = np.empty((0, 5))
 
-    # Salvar
-    filepath.write_text("\n".join(fixed_lines))
-    return stats
+    data = np.empty((sum(counts), 5))
+    offset, fast_offset = 0, 0
+    for i, n in enumerate(counts):
+        if i in slow_rows:
+            if n:
+                data[offset:offset + n] = slow_rows[i]
+        else:
+            data[offset:offset + n] = fast[fast_offset:fast_offset + n]
+            fast_offset += n
+        offset += n
 
+    return LabelArrays(
+        files=files,
+        texts=texts,
+        file_index=np.repeat(np.arange(len(files)), counts),
+        classes=data[:, 0],
+        boxes=data[:, 1:],
+        malformed=np.array(malformed, dtype=np.int64),
+    )
 
-def main():
-    print("=" * 50)
-    print("Fixing YOLO Annotations")
-    print("=" * 50)
 
-    total_stats = {"total": 0, "fixed": 0, "removed": 0, "ok": 0}
-    files_with_issues = 0
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU linha a linha entre boxes (x_center, y_center, w, h)."""
+    a_min, a_max = a[:, :2] - a[:, 2:] / 2, a[:, :2] + a[:, 2:] / 2
+    b_min, b_max = b[:, :2] - b[:, 2:] / 2, b[:, :2] + b[:, 2:] / 2
+    inter = np.clip(np.minimum(a_max, b_max) - np.maximum(a_min, b_min), 0, None).prod(axis=1)
+    union = a[:, 2:].prod(axis=1) + b[:, 2:].prod(axis=1) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def find_duplicates(file_index: np.ndarray, classes: np.ndarray, boxes: np.ndarray, iou: float) -> np.ndarray:
+    """
+    Máscara das linhas que repetem uma linha anterior (mesmo arquivo e
+    classe, IoU >= iou). Os pares são gerados só dentro de cada grupo
+    (arquivo, classe), sem laço em Python.
+    """
+    n = len(classes)
+    duplicate = np.zeros(n, dtype=bool)
+    if n < 2:
+        return duplicate
+    order = np.lexsort((np.arange(n), classes, file_index))
+    f, c = file_index[order], classes[order]
+    new_group = np.r_[True, (f[1:] != f[:-1]) | (c[1:] != c[:-1])]
+    group_end = np.append(np.flatnonzero(new_group)[1:], n)[np.cumsum(new_group) - 1]
+
+    # Para cada posição p, pares (p, q) com p < q < fim do grupo
+    partners = group_end - np.arange(n) - 1
+    total = int(partners.sum())
+    if total == 0:
+        return duplicate
+    first = np.repeat(np.arange(n), partners)
+    starts = np.cumsum(partners) - partners
+    second = first + 1 + (np.arange(total) - np.repeat(starts, partners))
+    i, j = order[first], order[second]
+    hits = _iou(boxes[i], boxes[j]) >= iou
+    duplicate[np.maximum(i, j)[hits]] = True  # mantém a primeira ocorrência no arquivo
+    return duplicate
+
+
+def fix_boxes(
+    classes: np.ndarray,
+    boxes: np.ndarray,
+    file_index: np.ndarray,
+    nc: int = DEFAULT_NC,
+    duplicate_iou: float = DUPLICATE_IOU,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Aplica as regras a todas as linhas; retorna (boxes corrigidos, ação por linha)."""
+    x, y, w, h = boxes.T
+    action = np.full(len(classes), OK, dtype=np.int8)
+
+    degenerate = ~np.isfinite(boxes).all(axis=1) | (w <= 0) | (h <= 0)
+    bad_class = ~np.isfinite(classes) | (classes != np.round(classes)) | (classes < 0) | (classes >= nc)
+    outside = (x > 1 + CENTER_LIMIT) | (y > 1 + CENTER_LIMIT) | (x < -CENTER_LIMIT) | (y < -CENTER_LIMIT)
+    action[degenerate] = REMOVED_DEGENERATE
+    action[bad_class] = REMOVED_CLASS
+    action[outside] = REMOVED_CENTER
 
-    txt_files = sorted(ANNOTATIONS_DIR.glob("*.txt"))
-    print(f"\nProcessando {len(txt_files)} arquivos...\n")
+    with np.errstate(invalid="ignore"):
+        x = np.clip(x, 0.0, 1.0)
+        y = np.clip(y, 0.0, 1.0)
+        # Mesma ordem do ajuste original: borda esquerda/topo primeiro
+        w = np.where(x - w / 2 < 0, x * 2, w)
+        w = np.where(x + w / 2 > 1, (1 - x) * 2, w)
+        h = np.where(y - h / 2 < 0, y * 2, h)
+        h = np.where(y + h / 2 > 1, (1 - y) * 2, h)
+        fixed = np.column_stack([x, y, np.clip(w, MIN_SIZE, 1.0), np.clip(h, MIN_SIZE, 1.0)])
 
-    for filepath in txt_files:
-        stats = fix_annotation_file(filepath)
+    kept = action == OK
+    changed = kept & (fixed != boxes).any(axis=1)
+    action[changed] = FIXED
 
-        for key in total_stats:
-            total_stats[key] += stats[key]
+    candidates = np.flatnonzero(action <= FIXED)
+    duplicate = find_duplicates(file_index[candidates], classes[candidates], fixed[candidates], duplicate_iou)
+    action[candidates[duplicate]] = REMOVED_DUPLICATE
+    return fixed, action
 
-        if stats["fixed"] > 0 or stats["removed"] > 0:
-            files_with_issues += 1
-            print(f"  {filepath.name}: {stats['fixed']} fixed, {stats['removed']} removed (de {stats['total']})")
 
+def _format(classes: np.ndarray, boxes: np.ndarray) -> str:
+    # Um único % para o arquivo inteiro
+    values = np.column_stack([classes, boxes]).ravel().tolist()
+    return "\n".join(["%d %.6f %.6f %.6f %.6f"] * len(classes)) % tuple(values)
+
+
+def fix_files(
+    files: List[Path],
+    nc: int = DEFAULT_NC,
+    dry_run: bool = False,
+    duplicate_iou: float = DUPLICATE_IOU,
+    detail: bool = False,
+) -> List[Dict]:
+    """
+    Valida/corrige um shard de arquivos; retorna um relatório por arquivo
+    (com as linhas afetadas se detail=True).
+    """
+    labels = load_labels(files)
+    fixed, action = fix_boxes(labels.classes, labels.boxes, labels.file_index, nc, duplicate_iou)
+
+    n_files = len(files)
+    per_action = np.zeros((n_files, len(ACTIONS)), dtype=np.int64)
+    np.add.at(per_action, (labels.file_index, action), 1)
+    starts = np.searchsorted(labels.file_index, np.arange(n_files))
+    ends = np.searchsorted(labels.file_index, np.arange(n_files), side="right")
+    touched = (per_action[:, FIXED:].sum(axis=1) + labels.malformed) > 0
+
+    # Listas Python: o laço por arquivo não paga indexação de escalares NumPy
+    counts_per_file = per_action.tolist()
+    starts, ends = starts.tolist(), ends.tolist()
+    malformed, touched = labels.malformed.tolist(), touched.tolist()
+    reports = []
+    for i, path in enumerate(files):
+        counts = dict(zip(ACTIONS, counts_per_file[i]))
+        report = {
+            "file": path.name,
+            "changed": False,
+            "total": ends[i] - starts[i] + malformed[i],
+            "ok": counts["ok"],
+            "fixed": counts["fixed"],
+            "removed": sum(counts[key] for key in ACTIONS[2:]) + malformed[i],
+            **{key: counts[key] for key in ACTIONS[2:]},
+            "malformed": malformed[i],
+        }
+        if touched[i]:
+            rows = slice(starts[i], ends[i])
+            keep = action[rows] <= FIXED
+            text = _format(labels.classes[rows][keep], fixed[rows][keep])
+            report["changed"] = text != labels.texts[i]
+            if detail:
+                report["lines"] = [
+                    {
+                        "index": k,
+                        "action": ACTIONS[a],
+                        "before": [float(labels.classes[starts[i] + k]), *labels.boxes[starts[i] + k].tolist()],
+                        "after": [round(v, 6) for v in fixed[starts[i] + k].tolist()] if a == FIXED else None,
+                    }
+                    for k, a in enumerate(action[rows].tolist())
+                    if a != OK
+                ]
+            if report["changed"] and not dry_run:
+                path.write_text(text)
+        reports.append(report)
+    return reports
+
+
+def fix_annotation_file(filepath: Path, nc: int = DEFAULT_NC, dry_run: bool = False) -> dict:
+    """Corrige um arquivo de anotação YOLO (só reescreve se mudar)."""
+    report = fix_files([filepath], nc, dry_run)[0]
+    return {key: report[key] for key in STAT_KEYS}
+
+
+def fix_all(
+    files: List[Path],
+    nc: int = DEFAULT_NC,
+    dry_run: bool = False,
+    duplicate_iou: float = DUPLICATE_IOU,
+    workers: Optional[int] = None,
+    detail: bool = False,
+) -> Dict:
+    """Valida/corrige todos os arquivos; em paralelo por shards se forem muitos."""
+    if len(files) >= PARALLEL_MIN_FILES and workers != 1:
+        shards = [files[i:i + SHARD_SIZE] for i in range(0, len(files), SHARD_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            n = len(shards)
+            results = pool.map(fix_files, shards, [nc] * n, [dry_run] * n, [duplicate_iou] * n, [detail] * n)
+            reports = [report for shard in results for report in shard]
+    else:
+        reports = fix_files(files, nc, dry_run, duplicate_iou, detail) if files else []
+
+    totals = {key: sum(r[key] for r in reports) for key in STAT_KEYS}
+    return {
+        "dry_run": dry_run,
+        "nc": nc,
+        "duplicate_iou": duplicate_iou,
+        "files": len(reports),
+        "files_changed": sum(r["changed"] for r in reports),
+        "totals": totals,
+        "details": [r for r in reports if r["changed"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida e corrige anotações YOLO")
+    parser.add_argument("--dir", type=Path, default=ANNOTATIONS_DIR, help="Diretório dos .txt")
+    parser.add_argument("--dry-run", action="store_true", help="Não grava nada; só relatório")
+    parser.add_argument("--report", type=Path, help="Salvar relatório JSON")
+    parser.add_argument("--nc", type=int, default=None, help="Número de classes (padrão: dataset_config.yaml)")
+    parser.add_argument("--duplicate-iou", type=float, default=DUPLICATE_IOU, help="IoU para boxes duplicados")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (1 = sem pool)")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Fixing YOLO Annotations" + (" (dry-run)" if args.dry_run else ""))
+    print("=" * 50)
+
+    nc = args.nc or read_nc()
+    txt_files = sorted(args.dir.glob("*.txt"))
+    print(f"\nProcessando {len(txt_files)} arquivos (nc={nc})...\n")
+
+    report = fix_all(txt_files, nc, args.dry_run, args.duplicate_iou, args.workers, detail=args.report is not None)
+    for detail in report["details"]:
+        print(f"  {detail['file']}: {detail['fixed']} fixed, {detail['removed']} removed (de {detail['total']})")
+
+    totals = report["totals"]
     print(f"\n{'=' * 50}")
     print(f"Resumo:")
-    print(f"  Anotações totais: {total_stats['total']}")
-    print(f"  OK (sem mudança):  {total_stats['ok']}")
-    print(f"  Corrigidas:        {total_stats['fixed']}")
-    print(f"  Removidas:         {total_stats['removed']}")
-    print(f"  Arquivos afetados: {files_with_issues}")
+    print(f"  Anotações totais: {totals['total']}")
+    print(f"  OK (sem mudança):  {totals['ok']}")
+    print(f"  Corrigidas:        {totals['fixed']}")
+    print(f"  Removidas:         {totals['removed']}")
+    print(f"    centro fora: {totals['removed_center']}, classe inválida: {totals['removed_class']}, "
+          f"degeneradas: {totals['removed_degenerate']}, duplicadas: {totals['removed_duplicate']}, "
+          f"mal formatadas: {totals['malformed']}")
+    print(f"  Arquivos {'a alterar' if args.dry_run else 'alterados'}: {report['files_changed']}")
     print(f"{'=' * 50}")
 
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Relatório salvo em: {args.report}")
+
 
 if __name__ == "__main__":
     main()
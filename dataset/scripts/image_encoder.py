@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Codificação adaptativa de imagens para as requisições de anotação.
+
+O modelo reduz internamente imagens acima de ~1568 px no lado maior
+(ou ~1,15 megapixel), então mandar o PNG original de vários MB só custa
+upload. O encoder:
+
+- reduz para a resolução útil do modelo (escala uniforme, LANCZOS)
+- escolhe o formato pelo conteúdo: diagramas com poucas cores viram PNG
+  com paleta; conteúdo fotográfico/gradientes vai no menor entre WebP e
+  JPEG
+- descarta metadados (EXIF, ICC, chunks de texto)
+- mantém o original quando ele é menor que o recodificado
+
+Como a escala é uniforme, bbox_percent (0-100 da imagem enviada) vale
+igual na original; as coordenadas em pixels continuam sendo calculadas
+com as dimensões originais. O arredondamento do novo tamanho desloca no
+máximo meio pixel da imagem reduzida.
+
+Uso direto (relatório sem chamar a API):
+    python image_encoder.py ../images/azure/*.png
+    python image_encoder.py ../images --max-edge 1092
+"""
+
+import argparse
+import base64
+import io
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+from PIL import Image
+
+# Limites em que o modelo ainda usa todos os pixels
+DEFAULT_MAX_EDGE = 1568
+DEFAULT_MAX_PIXELS = 1_150_000
+# Abaixo disso (cores distintas) a imagem é tratada como diagrama chapado
+PALETTE_MAX_COLORS = 256
+
+MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+
+@dataclass
+class EncodeOptions:
+    max_edge: int = DEFAULT_MAX_EDGE
+    max_pixels: int = DEFAULT_MAX_PIXELS
+    jpeg_quality: int = 88
+    webp_quality: int = 88
+    optimize: bool = True  # False: envia o arquivo original (comportamento antigo)
+
+
+@dataclass
+class EncodedImage:
+    data: str  # base64
+    media_type: str
+    width: int  # dimensões originais (para bbox_pixels)
+    height: int
+    sent_width: int
+    sent_height: int
+    original_bytes: int
+    encoded_bytes: int
+    format: str
+
+    @property
+    def tokens_before(self) -> int:
+        return estimate_tokens(*fit_size(self.width, self.height, DEFAULT_MAX_EDGE, DEFAULT_MAX_PIXELS))
+
+    @property
+    def tokens_after(self) -> int:
+        return estimate_tokens(*fit_size(self.sent_width, self.sent_height, DEFAULT_MAX_EDGE, DEFAULT_MAX_PIXELS))
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.encoded_bytes
+
+
+def estimate_tokens(width: int, height: int) -> int:
+    """Estimativa de tokens de imagem: ~1 token a cada 750 px."""
+    return math.ceil(width * height / 750)
+
+
+def fit_size(width: int, height: int, max_edge: int, max_pixels: int) -> Tuple[int, int]:
+    """Maior tamanho com a mesma proporção dentro dos limites."""
+    scale = min(1.0, max_edge / max(width, height), math.sqrt(max_pixels / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """RGB sobre fundo branco (transparência de diagramas vira papel)."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _save(img: Image.Image, fmt: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **params)
+    return buffer.getvalue()
+
+
+def encode_for_request(path: Path, options: EncodeOptions = EncodeOptions()) -> EncodedImage:
+    """Codifica a imagem para a requisição, escolhendo tamanho e formato."""
+    original = path.read_bytes()
+    with Image.open(io.BytesIO(original)) as img:
+        width, height = img.size
+        source_format = (img.format or "").upper()
+
+        if not options.optimize:
+            return EncodedImage(
+                base64.standard_b64encode(original).decode("utf-8"),
+                MEDIA_TYPES.get(path.suffix.lower(), "image/png"),
+                width, height, width, height, len(original), len(original), source_format,
+            )
+
+        img.draft("RGB", fit_size(width, height, options.max_edge, options.max_pixels))  # JPEG: reduz no decode
+        rgb = _flatten(img)
+
+    target = fit_size(width, height, options.max_edge, options.max_pixels)
+    if rgb.size != target:
+        rgb = rgb.resize(target, Image.LANCZOS)
+
+    colors = rgb.getcolors(maxcolors=PALETTE_MAX_COLORS)
+    if colors is not None:
+        # Poucas cores: paleta exata, sem perda
+        candidates = [("PNG", _save(rgb.quantize(colors=len(colors), dither=Image.Dither.NONE), "PNG", optimize=True))]
+    else:
+        candidates = [
+            ("PNG", _save(rgb, "PNG")),
+            ("WEBP", _save(rgb, "WEBP", quality=options.webp_quality, method=3)),
+            ("JPEG", _save(rgb, "JPEG", quality=options.jpeg_quality, optimize=True, progressive=True)),
+        ]
+        # PNG só se for competitivo (diagramas com antialiasing)
+        lossy = min(candidates[1:], key=lambda c: len(c[1]))
+        candidates = [candidates[0]] if len(candidates[0][1]) <= len(lossy[1]) * 1.1 else [lossy]
+    fmt, data = candidates[0]
+
+    # Original menor que o recodificado: manda o original, desde que a redução
+    # da própria API chegue ao mesmo tamanho (mesmos tokens)
+    api_size = fit_size(width, height, DEFAULT_MAX_EDGE, DEFAULT_MAX_PIXELS)
+    if len(original) <= len(data) and source_format in ("PNG", "JPEG", "WEBP") and target == api_size:
+        fmt, data = source_format, original
+        target = (width, height)
+
+    return EncodedImage(
+        base64.standard_b64encode(data).decode("utf-8"),
+        f"image/{fmt.lower()}",
+        width, height, target[0], target[1], len(original), len(data), fmt,
+    )
+
+
+def print_encoding(path: Path, encoded: EncodedImage):
+    print(
+        f"  {path.name}: {encoded.width}x{encoded.height} -> {encoded.sent_width}x{encoded.sent_height} "
+        f"{encoded.format}, {encoded.original_bytes / 1024:.0f} KB -> {encoded.encoded_bytes / 1024:.0f} KB, "
+        f"~{encoded.tokens_before} -> ~{encoded.tokens_after} tokens"
+    )
+
+
+def print_totals(encoded: List[EncodedImage]):
+    if not encoded:
+        return
+    before = sum(e.original_bytes for e in encoded)
+    after = sum(e.encoded_bytes for e in encoded)
+    tokens_before = sum(e.tokens_before for e in encoded)
+    tokens_after = sum(e.tokens_after for e in encoded)
+    print(
+        f"  💾 Payload de imagens: {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB "
+        f"({(1 - after / before) * 100 if before else 0:.0f}% menor), "
+        f"~{tokens_before} -> ~{tokens_after} tokens de imagem"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório do encoder adaptativo de imagens")
+    parser.add_argument("paths", nargs="+", type=Path, help="Imagens ou diretórios")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE, help="Lado maior máximo (px)")
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help="Área máxima (px)")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in MEDIA_TYPES))
+        else:
+            files.append(path)
+
+    options = EncodeOptions(max_edge=args.max_edge, max_pixels=args.max_pixels)
+    results = []
+    for path in files:
+        encoded = encode_for_request(path, options)
+        print_encoding(path, encoded)
+        results.append(encoded)
+    print_totals(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Metadados incrementais das imagens do dataset.
+
+Um cache de stat (caminho -> tamanho, mtime, hash, dimensões) evita
+reprocessar imagens que não mudaram: numa nova execução só o walk e o
+stat tocam o disco, e apenas arquivos novos ou alterados são lidos.
+
+Para os arquivos que mudaram:
+- dimensões saem do cabeçalho (PNG: IHDR; JPEG: marcador SOF), sem
+  decodificar a imagem; outros formatos caem no PIL (que também só lê o
+  cabeçalho no open)
+- o MD5 usa buffers de 1 MB (o hashlib libera o GIL nesses blocos)
+- hash e dimensões rodam num pool de threads
+
+Uso direto:
+    python metadata.py                 # Atualiza dataset/metadata.json
+    python metadata.py --rehash        # Ignora o cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).parent.parent
+IMAGES_DIR = BASE_DIR / "images"
+METADATA_PATH = BASE_DIR / "metadata.json"
+CACHE_PATH = BASE_DIR / "metadata_cache.json"
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+HASH_BUFFER = 1 << 20
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC)
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def file_md5(path: Path) -> str:
+    """MD5 do arquivo lido em blocos de 1 MB."""
+    return _file_digest(path, hashlib.md5())
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 do arquivo (chave do annotation_store)."""
+    return _file_digest(path, hashlib.sha256())
+
+
+def _file_digest(path: Path, hasher) -> str:
+    buffer = bytearray(HASH_BUFFER)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:  # preenchimento
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0x01, *range(0xD0, 0xD8)):  # marcadores sem tamanho
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if code in JPEG_SOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_dimensions(path: Path) -> Tuple[int, int]:
+    """(largura, altura) lidas do cabeçalho; (0, 0) se ilegível."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(24)
+            if head.startswith(PNG_SIGNATURE) and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head.startswith(b"\xff\xd8"):
+                size = _jpeg_size(f)
+                if size:
+                    return size
+    except OSError:
+        return 0, 0
+
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return 0, 0
+
+
+@dataclass
+class ImageRecord:
+    rel_path: str  # relativo a IMAGES_DIR
+    provider: str
+    size: int
+    mtime_ns: int
+    hash: str = ""
+    width: int = 0
+    height: int = 0
+
+    def cache_entry(self) -> Dict:
+        return {
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "hash": self.hash,
+            "width": self.width,
+            "height": self.height,
+        }
+
+
+class StatCache:
+    """Cache JSON caminho -> (tamanho, mtime_ns, hash, dimensões)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        if path.exists():
+            try:
+                self._entries = json.loads(path.read_text()).get("entries", {})
+            except (json.JSONDecodeError, OSError):
+                self._entries = {}  # cache corrompido: recalcula tudo
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, record: ImageRecord) -> bool:
+        """Preenche hash/dimensões do cache se tamanho e mtime batem."""
+        entry = self._entries.get(record.rel_path)
+        if entry is None or entry["size"] != record.size or entry["mtime_ns"] != record.mtime_ns:
+            return False
+        record.hash = entry["hash"]
+        record.width, record.height = entry["width"], entry["height"]
+        return True
+
+    def replace(self, records: List[ImageRecord]):
+        """Cache passa a ter só as imagens atuais (apagadas saem)."""
+        self._entries = {r.rel_path: r.cache_entry() for r in records}
+
+    def save(self):
+        """Escrita atômica do cache."""
+        partial = self.path.with_name(self.path.name + ".part")
+        partial.write_text(json.dumps({"version": 1, "entries": self._entries}, separators=(",", ":")))
+        partial.replace(self.path)
+
+
+def _walk(directory: str, prefix: str, provider: str, found: List[ImageRecord]):
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != "_svg_temp" and "predictions" not in entry.name:
+                    _walk(entry.path, f"{prefix}{entry.name}/", provider, found)
+                continue
+            name = entry.name
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS or "predictions" in name:
+                continue
+            st = entry.stat()
+            found.append(ImageRecord(f"{prefix}{name}", provider, st.st_size, st.st_mtime_ns))
+
+
+def scan_images(images_dir: Path = IMAGES_DIR) -> List[ImageRecord]:
+    """
+    Lista as imagens de cada provedor (subdiretórios que não começam com
+    "_"), com tamanho e mtime do stat, na ordem de find_local_images.
+    """
+    records = []
+    for provider_dir in sorted(images_dir.iterdir()):
+        if not provider_dir.is_dir() or provider_dir.name.startswith("_"):
+            continue
+        found: List[ImageRecord] = []
+        _walk(str(provider_dir), f"{provider_dir.name}/", provider_dir.name, found)
+        records.extend(sorted(found, key=lambda r: r.rel_path))
+    return records
+
+
+def _fill(images_dir: Path, record: ImageRecord) -> ImageRecord:
+    path = images_dir / record.rel_path
+    record.width, record.height = image_dimensions(path)
+    record.hash = file_md5(path)
+    return record
+
+
+def update_records(
+    images_dir: Path = IMAGES_DIR,
+    cache_path: Path = CACHE_PATH,
+    workers: Optional[int] = None,
+    rehash: bool = False,
+) -> Tuple[List[ImageRecord], Dict]:
+    """
+    Varre o dataset, reaproveita o cache e recalcula só o que mudou.
+    Retorna os registros e estatísticas da execução.
+    """
+    start = time.perf_counter()
+    cache = StatCache(cache_path)
+    records = scan_images(images_dir)
+    stale = [r for r in records if rehash or not cache.lookup(r)]
+
+    if stale:
+        workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda r: _fill(images_dir, r), stale))
+
+    # Nada novo nem apagado: o cache em disco já está certo
+    if stale or len(cache) != len(records):
+        cache.replace(records)
+        cache.save()
+    stats = {
+        "total": len(records),
+        "cached": len(records) - len(stale),
+        "computed": len(stale),
+        "bytes_hashed": sum(r.size for r in stale),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    return records, stats
+
+
+def build_metadata(records: List[ImageRecord]) -> Dict:
+    metadata = {
+        "version": "2.0.0",
+        "created": time.strftime("%Y-%m-%d"),
+        "description": "Dataset de diagramas de arquitetura de software para detecção de componentes",
+        "sources": [
+            "GitHub: arpitbhardwaj/architecture-diagrams (MIT License)",
+            "Azure Architecture Center (Microsoft Learn)",
+            "Hackathon FIAP - imagens de teste",
+        ],
+        "images": [],
+        "statistics": {
+            "total": len(records),
+            "by_provider": {}
+        }
+    }
+    for record in records:
+        by_provider = metadata["statistics"]["by_provider"]
+        by_provider[record.provider] = by_provider.get(record.provider, 0) + 1
+        metadata["images"].append({
+            "file_name": f"{record.provider}/{Path(record.rel_path).name}",
+            "provider": record.provider,
+            "width": record.width,
+            "height": record.height,
+            "hash": record.hash,
+        })
+    return metadata
+
+
+def write_metadata(
+    images_dir: Path = IMAGES_DIR,
+    output_path: Path = METADATA_PATH,
+    cache_path: Path = CACHE_PATH,
+    workers: Optional[int] = None,
+    rehash: bool = False,
+) -> Tuple[Dict, Dict]:
+    """Atualiza o cache e grava metadata.json; retorna (metadados, estatísticas)."""
+    records, stats = update_records(images_dir, cache_path, workers, rehash)
+    metadata = build_metadata(records)
+    with open(output_path, "w") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    return metadata, stats
+
+
+def print_stats(stats: Dict):
+    print(
+        f"  ⏱ {stats['total']} imagens em {stats['seconds']}s: "
+        f"{stats['cached']} do cache, {stats['computed']} recalculadas "
+        f"({stats['bytes_hashed'] / 2**20:.1f} MB lidos)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera metadata.json do dataset (incremental)")
+    parser.add_argument("--images-dir", type=Path, default=IMAGES_DIR, help="Diretório de imagens")
+    parser.add_argument("--output", type=Path, default=METADATA_PATH, help="Arquivo de metadados")
+    parser.add_argument("--cache", type=Path, default=CACHE_PATH, help="Cache de stat/hash")
+    parser.add_argument("--workers", type=int, default=None, help="Threads de hash (padrão: 4x núcleos, máx 32)")
+    parser.add_argument("--rehash", action="store_true", help="Ignorar o cache e recalcular tudo")
+    args = parser.parse_args()
+
+    metadata, stats = write_metadata(args.images_dir, args.output, args.cache, args.workers, args.rehash)
+    print_stats(stats)
+    for provider, count in metadata["statistics"]["by_provider"].items():
+        print(f"  - {provider}: {count}")
+    print(f"💾 Salvo em: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
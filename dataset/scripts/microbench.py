@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks das funções críticas dos scripts do dataset.
+
+Gera labels YOLO e imagens sintéticas em escala (1k, 10k, 100k arquivos)
+e cronometra cada função sobre o conjunto inteiro:
+
+- fix_annotation_file e fix_all (fix_annotations.py)
+- convert_to_yolo (auto_annotate.py)
+- calculate_hash (collect_images.py)
+- draw_predictions_from_yolo (demo_inference.py)
+- create_splits e assign_splits (create_splits.py)
+
+O expoente de escala (log t / log n entre escalas vizinhas) mostra quem
+deixa de ser linear primeiro. Cada execução é anexada a um histórico
+JSONL com o commit atual; se alguma medição piorar mais que --threshold
+em relação à última execução na mesma máquina, sai com exit code 1.
+
+Uso:
+    python microbench.py
+    python microbench.py --scales 1000 10000 --only fix_annotation_file calculate_hash
+    python microbench.py --threshold 0.3 --no-record
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).parent.parent
+SCRIPTS_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_HISTORY = BASE_DIR / "benchmarks" / "microbench_history.jsonl"
+DEFAULT_WORKDIR = Path(tempfile.gettempdir()) / "threat-modeler-microbench"
+
+# Imagens sintéticas: poucos templates distintos, copiados N vezes
+IMAGE_SIZE = (320, 240)
+IMAGE_TEMPLATES = 16
+BOXES_PER_FILE = 12
+
+# Repetições: repete enquanto o total ficar abaixo de MIN_TIME_S
+MIN_TIME_S = 1.0
+MAX_REPEAT = 5
+
+
+# ============================================================
+# Fixtures sintéticas
+# ============================================================
+
+def _label_line(rng: random.Random) -> str:
+    """Linha YOLO; ~10% com coordenadas fora de [0, 1] (como nas anotações reais)."""
+    class_id = rng.randrange(30)
+    if rng.random() < 0.1:
+        x, y = rng.uniform(-0.2, 1.2), rng.uniform(-0.2, 1.2)
+    else:
+        x, y = rng.uniform(0.05, 0.95), rng.uniform(0.05, 0.95)
+    w, h = rng.uniform(0.02, 0.3), rng.uniform(0.02, 0.3)
+    return f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
+
+
+def _render_templates(seed: int) -> List[bytes]:
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    templates = []
+    for _ in range(IMAGE_TEMPLATES):
+        img = Image.new("RGB", IMAGE_SIZE, "white")
+        draw = ImageDraw.Draw(img)
+        for _ in range(BOXES_PER_FILE):
+            x, y = rng.randrange(IMAGE_SIZE[0] - 40), rng.randrange(IMAGE_SIZE[1] - 30)
+            draw.rectangle([x, y, x + 40, y + 30], outline=(0, 0, 0), width=2)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        templates.append(buf.getvalue())
+    return templates
+
+
+def prepare_fixture(workdir: Path, n: int, seed: int = 42) -> Path:
+    """
+    Cria (ou reaproveita) n pares imagem/label em workdir/n{n}:
+        images/synthetic/img_000000.png, annotations/img_000000.txt
+    """
+    root = workdir / f"n{n}"
+    marker = root / "fixture.json"
+    params = {"n": n, "seed": seed, "image_size": IMAGE_SIZE, "boxes": BOXES_PER_FILE}
+    if marker.exists() and json.loads(marker.read_text()) == json.loads(json.dumps(params)):
+        return root
+
+    print(f"  Gerando fixture com {n} arquivos em {root}...")
+    shutil.rmtree(root, ignore_errors=True)
+    images_dir = root / "images" / "synthetic"
+    labels_dir = root / "annotations"
+    images_dir.mkdir(parents=True)
+    labels_dir.mkdir(parents=True)
+
+    rng = random.Random(seed)
+    templates = _render_templates(seed)
+    for i in range(n):
+        stem = f"img_{i:06d}"
+        (images_dir / f"{stem}.png").write_bytes(templates[i % len(templates)])
+        (labels_dir / f"{stem}.txt").write_text(
+            "\n".join(_label_line(rng) for _ in range(BOXES_PER_FILE))
+        )
+
+    marker.write_text(json.dumps(params))
+    return root
+
+
+def _fixture_pairs(root: Path) -> List[Tuple[Path, Path]]:
+    images = sorted((root / "images" / "synthetic").glob("*.png"))
+    return [(img, root / "annotations" / f"{img.stem}.txt") for img in images]
+
+
+# ============================================================
+# Benchmarks
+# ============================================================
+# Cada benchmark recebe (raiz da fixture, diretório de trabalho limpo) e
+# devolve a função a cronometrar; o preparo fica fora da medição.
+
+def bench_fix_annotation_file(root: Path, scratch: Path) -> Callable[[], None]:
+    from fix_annotations import fix_annotation_file
+
+    # fix_annotation_file reescreve o arquivo: trabalha numa cópia
+    labels = scratch / "annotations"
+    shutil.copytree(root / "annotations", labels)
+    files = sorted(labels.glob("*.txt"))
+
+    def run():
+        for path in files:
+            fix_annotation_file(path)
+
+    return run
+
+
+def bench_fix_all(root: Path, scratch: Path) -> Callable[[], None]:
+    from fix_annotations import fix_all
+
+    labels = scratch / "annotations"
+    shutil.copytree(root / "annotations", labels)
+    files = sorted(labels.glob("*.txt"))
+
+    def run():
+        fix_all(files)
+
+    return run
+
+
+def bench_convert_to_yolo(root: Path, scratch: Path) -> Callable[[], None]:
+    from auto_annotate import convert_to_yolo
+
+    annotations = []
+    for _, label in _fixture_pairs(root):
+        rows = [line.split() for line in label.read_text().splitlines()]
+        annotations.append({
+            "annotations": [
+                {"category_id": int(r[0]), "bbox": [float(v) for v in r[1:]]} for r in rows
+            ]
+        })
+    out_dir = scratch / "yolo"
+    out_dir.mkdir()
+
+    def run():
+        # convert_to_yolo imprime uma linha por arquivo; o print faz parte do custo
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for i, annotation in enumerate(annotations):
+                convert_to_yolo(annotation, out_dir / f"{i:06d}.txt")
+
+    return run
+
+
+def bench_calculate_hash(root: Path, scratch: Path) -> Callable[[], None]:
+    from collect_images import calculate_hash
+
+    images = [img for img, _ in _fixture_pairs(root)]
+
+    def run():
+        for path in images:
+            calculate_hash(path)
+
+    return run
+
+
+def bench_draw_predictions_from_yolo(root: Path, scratch: Path) -> Callable[[], None]:
+    from demo_inference import draw_predictions_from_yolo
+    from fix_annotations import fix_annotation_file
+
+    # Como no pipeline real, desenha labels já corrigidos (boxes fora da
+    # imagem quebram o ImageDraw)
+    labels = scratch / "annotations"
+    shutil.copytree(root / "annotations", labels)
+    pairs = [(img, labels / label.name) for img, label in _fixture_pairs(root)]
+    for _, label in pairs:
+        fix_annotation_file(label)
+    out_dir = scratch / "predictions"
+    out_dir.mkdir()
+
+    def run():
+        for img, label in pairs:
+            draw_predictions_from_yolo(img, label, out_dir / img.name)
+
+    return run
+
+
+def bench_create_splits(root: Path, scratch: Path) -> Callable[[], None]:
+    import create_splits
+
+    splits_dir = scratch / "splits"
+    splits_dir.mkdir()
+    # create_splits lê diretórios de variáveis do módulo
+    create_splits.BASE_DIR = root
+    create_splits.IMAGES_DIR = root / "images"
+    create_splits.ANNOTATIONS_DIR = root / "annotations"
+    create_splits.SPLITS_DIR = splits_dir
+    create_splits.CATALOG_PATH = scratch / "catalog.db"
+
+    def run():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            create_splits.create_splits()
+
+    return run
+
+
+def bench_assign_splits(root: Path, scratch: Path) -> Callable[[], None]:
+    # Mesmo preparo; sem splits/*.txt todas as imagens são novas
+    bench_create_splits(root, scratch)
+    import create_splits
+
+    def run():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            create_splits.assign_splits(stratify=("provider", "class"))
+
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[Path, Path], Callable[[], None]]] = {
+    "fix_annotation_file": bench_fix_annotation_file,
+    "fix_all": bench_fix_all,
+    "convert_to_yolo": bench_convert_to_yolo,
+    "calculate_hash": bench_calculate_hash,
+    "draw_predictions_from_yolo": bench_draw_predictions_from_yolo,
+    "create_splits": bench_create_splits,
+    "assign_splits": bench_assign_splits,
+}
+
+
+def time_benchmark(factory, root: Path, workdir: Path) -> float:
+    """Melhor tempo (s) entre repetições; o preparo é refeito a cada uma."""
+    best = math.inf
+    total = 0.0
+    for _ in range(MAX_REPEAT):
+        scratch = Path(tempfile.mkdtemp(dir=workdir, prefix="scratch_"))
+        try:
+            run = factory(root, scratch)
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        best = min(best, elapsed)
+        total += elapsed
+        if total >= MIN_TIME_S:
+            break
+    return best
+
+
+def scaling_exponents(results: Dict[str, Dict]) -> Dict[str, float]:
+    """Expoente k de t ~ n^k entre escalas vizinhas (1.0 = linear)."""
+    scales = sorted(int(s) for s in results)
+    exponents = {}
+    for small, large in zip(scales, scales[1:]):
+        t_small, t_large = results[str(small)]["seconds"], results[str(large)]["seconds"]
+        if t_small > 0 and t_large > 0:
+            k = math.log(t_large / t_small) / math.log(large / small)
+            exponents[f"{small}->{large}"] = round(k, 3)
+    return exponents
+
+
+# ============================================================
+# Histórico e regressões
+# ============================================================
+
+def git_commit() -> Tuple[str, bool]:
+    """(commit atual, working tree com alterações?)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--", "."], cwd=BASE_DIR, capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def machine_id() -> str:
+    return f"{platform.node()}/{platform.machine()}/py{platform.python_version()}"
+
+
+def last_entry(history: Path, machine: str) -> Optional[Dict]:
+    """Última execução registrada na mesma máquina."""
+    if not history.exists():
+        return None
+    previous = None
+    for line in history.read_text().splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            if entry.get("machine") == machine:
+                previous = entry
+    return previous
+
+
+def find_regressions(current: Dict, previous: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, by_scale in current["results"].items():
+        for scale, measurement in by_scale["scales"].items():
+            before = previous.get("results", {}).get(name, {}).get("scales", {}).get(scale)
+            if not before or before["seconds"] <= 0:
+                continue
+            change = measurement["seconds"] / before["seconds"] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{name} @ {scale}: {before['seconds']:.3f}s -> {measurement['seconds']:.3f}s ({change:+.0%})"
+                )
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], scales: List[int]):
+    header = f"  {'função':<28}" + "".join(f"{f'{s} (µs/item)':>18}" for s in scales) + "   expoente"
+    print(header)
+    print("  " + "-" * (len(header) - 2))
+    for name, data in results.items():
+        if "error" in data:
+            print(f"  {name:<28}  indisponível: {data['error']}")
+            continue
+        cells = []
+        for s in scales:
+            m = data["scales"].get(str(s))
+            cells.append(f"{m['per_item_us']:>18.1f}" if m else f"{'-':>18}")
+        exps = ", ".join(f"{k:.2f}" for k in data["exponents"].values())
+        print(f"  {name:<28}" + "".join(cells) + f"   {exps}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos scripts do dataset")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Número de arquivos por escala")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Rodar apenas estas funções")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="Onde gerar (e reaproveitar) fixtures")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY, help="Histórico JSONL entre commits")
+    parser.add_argument("--budget", type=float, default=600.0, help="Tempo máximo estimado por medição (s, 0 = sem limite)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Piora máxima tolerada (0.2 = 20%%)")
+    parser.add_argument("--no-record", action="store_true", help="Não anexar esta execução ao histórico")
+    parser.add_argument("--output", type=Path, help="Salvar resultado JSON neste caminho")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Dataset Scripts Microbenchmarks")
+    print("=" * 50)
+
+    scales = sorted(set(args.scales))
+    names = args.only or list(BENCHMARKS)
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    fixtures = {n: prepare_fixture(args.workdir, n) for n in scales}
+
+    results: Dict[str, Dict] = {}
+    for name in names:
+        print(f"\n{name}:")
+        by_scale = {}
+        try:
+            for n in scales:
+                if by_scale:
+                    # Estima pela escala anterior para não travar em funções lentas
+                    estimate = list(by_scale.values())[-1]["per_item_us"] * n / 1e6
+                    if args.budget and estimate > args.budget:
+                        print(f"  {n:>7} arquivos: pulado (estimado {estimate:.0f}s > --budget {args.budget:.0f}s)")
+                        continue
+                seconds = time_benchmark(BENCHMARKS[name], fixtures[n], args.workdir)
+                by_scale[str(n)] = {"seconds": round(seconds, 6), "per_item_us": round(seconds / n * 1e6, 3)}
+                print(f"  {n:>7} arquivos: {seconds:8.3f}s ({seconds / n * 1e6:.1f} µs/item)")
+        except ImportError as e:
+            # ex: auto_annotate exige o SDK anthropic
+            print(f"  ⚠ Pulando: {e}")
+            results[name] = {"error": str(e)}
+            continue
+        results[name] = {"scales": by_scale, "exponents": scaling_exponents(by_scale)}
+
+    commit, dirty = git_commit()
+    entry = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": machine_id(),
+        "results": {name: data for name, data in results.items() if "error" not in data},
+    }
+
+    print(f"\n{'=' * 50}")
+    print(f"Resumo (commit {commit}{' +alterações' if dirty else ''}):\n")
+    print_table(results, scales)
+
+    previous = last_entry(args.history, entry["machine"])
+    regressions = find_regressions(entry, previous, args.threshold) if previous else []
+    if previous:
+        print(f"\nComparado com {previous['commit']} ({previous['timestamp']}), limite {args.threshold:.0%}")
+
+    if not args.no_record:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"Histórico: {args.history}")
+
+    if args.output:
+        args.output.write_text(json.dumps(entry, indent=2))
+        print(f"Resultado salvo em: {args.output}")
+
+    if regressions:
+        print(f"\n✗ {len(regressions)} regressão(ões):")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print(f"{'=' * 50}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Estágio paralelo de rasterização SVG -> PNG.
+
+Os downloads alimentam um pool de processos (cairosvg é CPU-bound e
+segura o GIL) através de uma fila limitada: quando há `max_pending` SVGs
+esperando, quem submete bloqueia, e os downloads desaceleram em vez de
+acumular arquivos sem converter.
+
+Cada SVG pode gerar várias larguras de saída (treino multi-escala). O
+resumo mostra throughput do estágio: imagens/s, megapixels/s e
+eficiência paralela (tempo somado dos workers / tempo de parede).
+
+Uso direto (converte SVGs locais):
+    python rasterize.py arquivo.svg outro.svg --widths 1200 2400 --output-dir saida/
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+DEFAULT_WIDTHS = (1200,)
+
+
+@dataclass
+class RasterOutput:
+    png_path: Path
+    width: int
+    ok: bool = False
+    size: Tuple[int, int] = (0, 0)
+    error: str = ""
+
+
+@dataclass
+class RasterResult:
+    svg_path: Path
+    outputs: List[RasterOutput] = field(default_factory=list)
+    seconds: float = 0.0  # tempo de CPU no worker
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.outputs) and all(o.ok for o in self.outputs)
+
+
+def render_svg(svg_path: Path, png_path: Path, width: int) -> Tuple[int, int]:
+    """Converte um SVG em PNG com a largura dada; retorna o tamanho gerado."""
+    import cairosvg
+    from PIL import Image
+
+    png_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = png_path.with_name(png_path.name + ".part")
+    cairosvg.svg2png(url=str(svg_path), write_to=str(partial), output_width=width)
+    # Validar antes de publicar o arquivo
+    with Image.open(partial) as img:
+        size = img.size
+    partial.replace(png_path)
+    return size
+
+
+def rasterize(svg_path: Path, outputs: Sequence[Tuple[Path, int]]) -> RasterResult:
+    """Roda no worker: gera todas as larguras de um SVG."""
+    start = time.process_time()
+    result = RasterResult(svg_path)
+    for png_path, width in outputs:
+        out = RasterOutput(png_path, width)
+        try:
+            out.size = render_svg(svg_path, png_path, width)
+            out.ok = True
+        except ImportError:
+            out.error = "cairosvg não instalado (pip install cairosvg)"
+        except Exception as e:
+            out.error = str(e)
+            png_path.with_name(png_path.name + ".part").unlink(missing_ok=True)
+        result.outputs.append(out)
+    result.seconds = time.process_time() - start
+    return result
+
+
+class RasterPool:
+    """
+    Pool de processos com fila limitada de SVGs pendentes.
+
+    submit() é thread-safe (chamado direto do callback do downloader) e
+    bloqueia enquanto houver `max_pending` SVGs na fila ou em conversão.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        on_done: Optional[Callable[[RasterResult], None]] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.on_done = on_done
+        self.results: List[RasterResult] = []
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._start = 0.0
+        self.wall_seconds = 0.0
+
+    def __enter__(self) -> "RasterPool":
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True)
+        self.wall_seconds = time.perf_counter() - self._start
+        return False
+
+    def submit(self, svg_path: Path, outputs: Sequence[Tuple[Path, int]]):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(rasterize, svg_path, list(outputs))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._finish(f, svg_path, outputs))
+
+    def _finish(self, future: Future, svg_path: Path, outputs: Sequence[Tuple[Path, int]]):
+        self._slots.release()
+        try:
+            result = future.result()
+        except Exception as e:  # worker morreu (ex: falta de memória)
+            result = RasterResult(svg_path, [RasterOutput(p, w, error=str(e)) for p, w in outputs])
+        with self._lock:
+            self.results.append(result)
+        if self.on_done is not None:
+            self.on_done(result)
+
+    def stats(self) -> dict:
+        images = [o for r in self.results for o in r.outputs if o.ok]
+        megapixels = sum(o.size[0] * o.size[1] for o in images) / 1e6
+        cpu = sum(r.seconds for r in self.results)
+        wall = self.wall_seconds or (time.perf_counter() - self._start)
+        return {
+            "svgs": len(self.results),
+            "images": len(images),
+            "failed": sum(1 for r in self.results for o in r.outputs if not o.ok),
+            "wall_s": round(wall, 2),
+            "images_per_s": round(len(images) / wall, 2) if wall > 0 else 0.0,
+            "megapixels_per_s": round(megapixels / wall, 2) if wall > 0 else 0.0,
+            # ~workers quando o pool fica ocupado; menor = esperando download
+            "parallelism": round(cpu / wall, 2) if wall > 0 else 0.0,
+        }
+
+
+def print_stats(stats: dict, workers: int):
+    print(
+        f"  🔄 Rasterização: {stats['images']} PNGs de {stats['svgs']} SVGs em {stats['wall_s']}s "
+        f"({stats['images_per_s']} img/s, {stats['megapixels_per_s']} MPix/s, "
+        f"paralelismo {stats['parallelism']}/{workers}), {stats['failed']} falhas"
+    )
+
+
+def output_paths(png_name: str, widths: Sequence[int], primary_dir: Path, multiscale_dir: Path) -> List[Tuple[Path, int]]:
+    """
+    Saídas de um SVG: a primeira largura vai para o diretório do dataset;
+    as demais para multiscale_dir/w{largura}/ (mesmo nome, mesmo label YOLO
+    normalizado, sem duplicar imagens no split).
+    """
+    outputs = [(primary_dir / png_name, widths[0])]
+    outputs += [(multiscale_dir / f"w{w}" / png_name, w) for w in widths[1:]]
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rasterização paralela de SVGs")
+    parser.add_argument("svgs", nargs="+", type=Path, help="Arquivos SVG")
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS), help="Larguras de saída")
+    parser.add_argument("--output-dir", type=Path, default=Path("."), help="Diretório de saída")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: núcleos)")
+    args = parser.parse_args()
+
+    def report(result: RasterResult):
+        for out in result.outputs:
+            if out.ok:
+                print(f"  ✓ {out.png_path} ({out.size[0]}x{out.size[1]})")
+            else:
+                print(f"  ✗ {result.svg_path.name} @ {out.width}px: {out.error}")
+
+    with RasterPool(args.workers, on_done=report) as pool:
+        for svg in args.svgs:
+            png_name = svg.with_suffix(".png").name
+            pool.submit(svg, output_paths(png_name, args.widths, args.output_dir, args.output_dir))
+    print_stats(pool.stats(), pool.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Servidor stub que imita a Messages API (POST /v1/messages) para testar
+o runner de anotação sem gastar chamadas.
+
+Responde com componentes determinísticos (derivados do hash da imagem
+enviada) no mesmo formato JSON que o prompt pede, com latência
+configurável e falhas injetadas:
+- 429 rate_limit_error com retry-after a cada N requisições
+- 529 overloaded_error e 500 api_error com probabilidade dada
+- limite de requisições simultâneas: acima dele, 429
+
+Também imita a Message Batches API: POST /v1/messages/batches guarda as
+requisições, o batch fica "in_progress" por --batch-delay segundos e
+depois "ended", com os resultados em JSONL (com --batch-error-rate
+de "errored").
+
+GET /stats devolve contadores (requisições, erros, pico de concorrência).
+
+Uso:
+    python stub_messages_server.py --port 8765 --latency 0.5 --rate-limit-every 10 --overload-rate 0.05
+    python auto_annotate.py --base-url http://localhost:8765 --api-key stub
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORIES = [
+    "user", "api_gateway", "load_balancer", "web_server", "app_server", "microservice",
+    "container", "database_sql", "database_nosql", "cache", "queue", "storage_object",
+    "cdn", "monitoring", "external_service",
+]
+
+
+class StubState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.errors = {}
+        self.batches = {}
+
+    def error(self, kind: str):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "errors": dict(self.errors),
+                "batches": len(self.batches),
+                "batch_requests": sum(len(b["requests"]) for b in self.batches.values()),
+            }
+
+
+def fake_annotation(seed: bytes) -> dict:
+    rng = random.Random(hashlib.md5(seed).hexdigest())
+    components = []
+    for i in range(rng.randint(3, 12)):
+        components.append({
+            "category": rng.choice(CATEGORIES),
+            "label": f"Component {i + 1}",
+            "bbox_percent": [rng.uniform(10, 90), rng.uniform(10, 90), rng.uniform(4, 15), rng.uniform(4, 15)],
+        })
+    connections = [
+        {"from_label": f"Component {i}", "to_label": f"Component {i + 1}", "protocol": "HTTPS"}
+        for i in range(1, len(components))
+    ]
+    return {"provider": "generic", "components": components, "connections": connections}
+
+
+def fake_message(body: bytes, model: str, number) -> dict:
+    text = "```json\n" + json.dumps(fake_annotation(body), indent=2) + "\n```"
+    return {
+        "id": f"msg_stub_{number}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(body) // 4, "output_tokens": len(text) // 4},
+    }
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def make_handler(state: StubState):
+    args = state.args
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("request-id", f"req_stub_{state.requests}")
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self, status: int, kind: str, message: str, headers: dict = None):
+            state.error(kind)
+            self._json(status, {"type": "error", "error": {"type": kind, "message": message}}, headers)
+
+        def _batch_object(self, batch: dict) -> dict:
+            ended = time.time() >= batch["ready_at"]
+            n = len(batch["requests"])
+            errored = sum(1 for r in batch["results"] if r["result"]["type"] == "errored")
+            host = self.headers.get("Host", f"127.0.0.1:{args.port}")
+            return {
+                "id": batch["id"],
+                "type": "message_batch",
+                "processing_status": "ended" if ended else "in_progress",
+                "request_counts": {
+                    "processing": 0 if ended else n,
+                    "succeeded": n - errored if ended else 0,
+                    "errored": errored if ended else 0,
+                    "canceled": 0,
+                    "expired": 0,
+                },
+                "created_at": _iso(batch["created_at"]),
+                "expires_at": _iso(batch["created_at"] + 86400),
+                "ended_at": _iso(batch["ready_at"]) if ended else None,
+                "cancel_initiated_at": None,
+                "archived_at": None,
+                "results_url": f"http://{host}/v1/messages/batches/{batch['id']}/results" if ended else None,
+            }
+
+        def _create_batch(self, body: bytes):
+            requests = json.loads(body).get("requests", [])
+            ids = [r.get("custom_id", "") for r in requests]
+            if not requests or len(set(ids)) != len(ids):
+                self._error(400, "invalid_request_error", "requests must be non-empty with unique custom_id")
+                return
+            results = []
+            for number, request in enumerate(requests):
+                params = json.dumps(request["params"]).encode()
+                if random.random() < args.batch_error_rate:
+                    result = {"type": "errored",
+                              "error": {"type": "error", "error": {"type": "api_error", "message": "Internal error"}}}
+                else:
+                    message = fake_message(params, request["params"].get("model", "stub"), f"{number}")
+                    result = {"type": "succeeded", "message": message}
+                results.append({"custom_id": request["custom_id"], "result": result})
+            random.shuffle(results)  # a API não garante ordem
+            now = time.time()
+            batch = {
+                "id": f"msgbatch_stub_{uuid.uuid4().hex[:12]}",
+                "requests": ids,
+                "results": results,
+                "created_at": now,
+                "ready_at": now + args.batch_delay,
+            }
+            with state.lock:
+                state.batches[batch["id"]] = batch
+            self._json(200, self._batch_object(batch))
+
+        def _results(self, batch: dict):
+            if time.time() < batch["ready_at"]:
+                self._error(400, "invalid_request_error", "Batch is still processing")
+                return
+            data = "".join(json.dumps(r) + "\n" for r in batch["results"]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/binary")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/stats":
+                self._json(200, state.stats())
+                return
+            parts = path.strip("/").split("/")
+            if parts[:3] == ["v1", "messages", "batches"] and len(parts) in (4, 5):
+                batch = state.batches.get(parts[3])
+                if batch is None:
+                    self._error(404, "not_found_error", "Batch not found")
+                elif len(parts) == 4:
+                    self._json(200, self._batch_object(batch))
+                elif parts[4] == "results":
+                    self._results(batch)
+                else:
+                    self._error(404, "not_found_error", "Not found")
+                return
+            self._error(404, "not_found_error", "Not found")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.split("?")[0] == "/v1/messages/batches":
+                self._create_batch(body)
+                return
+            if self.path.split("?")[0] != "/v1/messages":
+                self._error(404, "not_found_error", "Not found")
+                return
+
+            with state.lock:
+                state.requests += 1
+                number = state.requests
+                over_limit = args.max_concurrency and state.in_flight >= args.max_concurrency
+                if not over_limit:
+                    state.in_flight += 1
+                    state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+
+            if over_limit:
+                self._error(429, "rate_limit_error", "Too many concurrent requests", {"retry-after": "1"})
+                return
+            try:
+                time.sleep(max(0.0, random.gauss(args.latency, args.latency / 4)))
+                if args.rate_limit_every and number % args.rate_limit_every == 0:
+                    self._error(429, "rate_limit_error", "Rate limited", {"retry-after": str(args.retry_after)})
+                    return
+                roll = random.random()
+                if roll < args.overload_rate:
+                    self._error(529, "overloaded_error", "Overloaded")
+                    return
+                if roll < args.overload_rate + args.error_rate:
+                    self._error(500, "api_error", "Internal server error")
+                    return
+
+                request = json.loads(body)
+                self._json(200, fake_message(body, request.get("model", "stub"), number))
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def serve(args) -> ThreadingHTTPServer:
+    state = StubState(args)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da Messages API")
+    parser.add_argument("--port", type=int, default=8765, help="Porta")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latência média por resposta (s)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="429 a cada N requisições (0 = nunca)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Valor do header retry-after nos 429")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="Probabilidade de 529")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidade de 500")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Acima disso responde 429 (0 = sem limite)")
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="Segundos até um batch terminar")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Fração de resultados 'errored' nos batches")
+    args = parser.parse_args()
+
+    server = serve(args)
+    print(f"Stub da Messages API em http://127.0.0.1:{args.port} (GET /stats para contadores)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.state.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Busca de hiperparâmetros do treino YOLO (augmentation e otimizador).
+
+Cada estudo fica num banco SQLite (runs/sweep/sweeps.db): espaço de busca,
+configuração, trials com parâmetros/estado/resultado e o mAP50-95 de val
+a cada época. Rodar de novo com o mesmo --study retoma de onde parou:
+trials terminados não são refeitos e os que estavam rodando quando o
+processo morreu recomeçam com os mesmos parâmetros (o sorteio de cada
+trial depende só da seed do estudo e do número do trial).
+
+- trials em paralelo, um processo por trial, cada um com um orçamento
+  de threads (núcleos / --parallel) aplicado a torch, OpenMP/BLAS e cv2
+- poda pela mediana: a partir de --warmup-epochs, se o melhor mAP do
+  trial até a época e for menor que a mediana dos outros trials que
+  chegaram à mesma época (pelo menos --startup-trials), o treino para
+- placar ordenado por mAP com os parâmetros de cada trial
+
+Espaço de busca em JSON, um parâmetro do model.train() por chave:
+    {"lr0": {"type": "loguniform", "low": 1e-4, "high": 1e-2},
+     "degrees": {"type": "uniform", "low": 0, "high": 10},
+     "optimizer": {"type": "choice", "values": ["AdamW", "SGD"]}}
+Tipos: uniform, loguniform, int (low/high inclusivos), choice.
+Parâmetros fora do espaço ficam com HYPERPARAMS de train_yolo.py.
+
+Uso:
+    python sweep.py --study aug1 --trials 20 --parallel 2 --epochs 30
+    python sweep.py --study aug1 --space space.json
+    python sweep.py --study aug1 --leaderboard
+    python train_yolo.py --params-from aug1     # Treina com os melhores parâmetros
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASE_DIR = Path(__file__).parent.parent
+YOLO_DIR = BASE_DIR / "yolo_dataset"
+SWEEP_DIR = Path("runs/sweep")
+SWEEP_DB = SWEEP_DIR / "sweeps.db"
+OBJECTIVE = "metrics/mAP50-95(B)"
+
+RUNNING, COMPLETE, PRUNED, FAILED = "running", "complete", "pruned", "failed"
+# Variáveis que limitam os pools de threads nativos (lidas no import)
+THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+DEFAULT_SPACE = {
+    "lr0": {"type": "loguniform", "low": 1e-4, "high": 1e-2},
+    "weight_decay": {"type": "loguniform", "low": 1e-5, "high": 1e-3},
+    "hsv_s": {"type": "uniform", "low": 0.0, "high": 0.7},
+    "hsv_v": {"type": "uniform", "low": 0.0, "high": 0.6},
+    "degrees": {"type": "uniform", "low": 0.0, "high": 10.0},
+    "translate": {"type": "uniform", "low": 0.0, "high": 0.2},
+    "scale": {"type": "uniform", "low": 0.1, "high": 0.6},
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    name TEXT PRIMARY KEY,
+    space TEXT NOT NULL,            -- JSON
+    config TEXT NOT NULL,           -- JSON: seed, epochs, batch, imgsz, model, poda
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS trials (
+    study TEXT NOT NULL REFERENCES studies(name) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    params TEXT NOT NULL,           -- JSON
+    state TEXT NOT NULL,
+    value REAL,                     -- melhor mAP50-95 de val
+    best_epoch INTEGER,
+    epochs INTEGER,                 -- épocas rodadas
+    seconds REAL,
+    error TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    PRIMARY KEY (study, number)
+);
+
+CREATE TABLE IF NOT EXISTS intermediate (
+    study TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    epoch INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (study, number, epoch)
+) WITHOUT ROWID;
+"""
+
+
+def sample(space: Dict[str, Dict], seed: int, number: int) -> Dict:
+    """Parâmetros do trial: determinísticos por (seed, número)."""
+    rng = random.Random(f"{seed}:{number}")
+    params = {}
+    for name, spec in sorted(space.items()):
+        kind = spec["type"]
+        if kind == "uniform":
+            params[name] = rng.uniform(spec["low"], spec["high"])
+        elif kind == "loguniform":
+            params[name] = math.exp(rng.uniform(math.log(spec["low"]), math.log(spec["high"])))
+        elif kind == "int":
+            params[name] = rng.randint(spec["low"], spec["high"])
+        elif kind == "choice":
+            params[name] = rng.choice(spec["values"])
+        else:
+            raise ValueError(f"Tipo desconhecido para {name}: {kind}")
+    return params
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class Study:
+    """Estudo no SQLite; uma conexão por processo (trials escrevem a própria)."""
+
+    def __init__(self, name: str, db_path: Path = SWEEP_DB):
+        self.name = name
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT space, config FROM studies WHERE name = ?", (name,)).fetchone()
+        self.space, self.config = (json.loads(row[0]), json.loads(row[1])) if row else (None, None)
+
+    def __enter__(self) -> "Study":
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        return False
+
+    @property
+    def exists(self) -> bool:
+        return self.space is not None
+
+    def create(self, space: Dict, config: Dict):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO studies (name, space, config, created_at) VALUES (?, ?, ?, ?)",
+                (self.name, json.dumps(space), json.dumps(config), _now()),
+            )
+        self.space, self.config = space, config
+
+    def pending(self, n_trials: int) -> List[int]:
+        """Trials ainda sem resultado entre 0..n_trials-1 (inclui os que morreram rodando)."""
+        done = {
+            row[0] for row in self.conn.execute(
+                "SELECT number FROM trials WHERE study = ? AND state != ?", (self.name, RUNNING)
+            )
+        }
+        return [number for number in range(n_trials) if number not in done]
+
+    def start(self, number: int, params: Dict):
+        with self.conn:
+            self.conn.execute("DELETE FROM intermediate WHERE study = ? AND number = ?", (self.name, number))
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO trials (study, number, params, state, started_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (self.name, number, json.dumps(params), RUNNING, _now()),
+            )
+
+    def report(self, number: int, epoch: int, value: float):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO intermediate (study, number, epoch, value) VALUES (?, ?, ?, ?)",
+                (self.name, number, epoch, value),
+            )
+
+    def should_prune(self, number: int, epoch: int) -> bool:
+        """Poda pela mediana dos melhores valores dos outros trials até esta época."""
+        if epoch < self.config["warmup_epochs"]:
+            return False
+        others = [
+            row[0] for row in self.conn.execute(
+                """
+                SELECT MAX(value) FROM intermediate
+                WHERE study = ? AND number != ? AND epoch <= ?
+                GROUP BY number HAVING MAX(epoch) = ?
+                """,
+                (self.name, number, epoch, epoch),
+            )
+        ]
+        if len(others) < self.config["startup_trials"]:
+            return False
+        mine = self.conn.execute(
+            "SELECT MAX(value) FROM intermediate WHERE study = ? AND number = ? AND epoch <= ?",
+            (self.name, number, epoch),
+        ).fetchone()[0]
+        return mine is not None and mine < statistics.median(others)
+
+    def finish(self, number: int, state: str, seconds: float, error: Optional[str] = None):
+        best = self.conn.execute(
+            """
+            SELECT value, epoch, (SELECT MAX(epoch) FROM intermediate WHERE study = ? AND number = ?)
+            FROM intermediate WHERE study = ? AND number = ?
+            ORDER BY value DESC, epoch LIMIT 1
+            """,
+            (self.name, number, self.name, number),
+        ).fetchone() or (None, None, None)
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE trials SET state = ?, value = ?, best_epoch = ?, epochs = ?, seconds = ?,
+                                  error = ?, finished_at = ?
+                WHERE study = ? AND number = ?
+                """,
+                (state, best[0], best[1], best[2], round(seconds, 1), error, _now(), self.name, number),
+            )
+
+    def trials(self, states: Optional[List[str]] = None) -> List[Dict]:
+        sql = """
+            SELECT number, params, state, value, best_epoch, epochs, seconds, error
+            FROM trials WHERE study = ?
+        """
+        params: list = [self.name]
+        if states:
+            sql += f" AND state IN ({','.join('?' * len(states))})"
+            params += states
+        sql += " ORDER BY value IS NULL, value DESC, number"
+        keys = ("number", "params", "state", "value", "best_epoch", "epochs", "seconds", "error")
+        rows = [dict(zip(keys, row)) for row in self.conn.execute(sql, params)]
+        for row in rows:
+            row["params"] = json.loads(row["params"])
+        return rows
+
+    def best_params(self) -> Optional[Dict]:
+        ranked = self.trials([COMPLETE, PRUNED])
+        return ranked[0]["params"] if ranked and ranked[0]["value"] is not None else None
+
+
+def _init_worker(threads: int):
+    # Antes de qualquer import de torch/numpy no processo do trial
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+
+
+def run_trial(task: Dict) -> Dict:
+    """Roda um trial (processo próprio); grava tudo no estudo."""
+    import torch
+
+    threads = task["threads"]
+    torch.set_num_threads(threads)
+    try:
+        import cv2
+
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+    from ultralytics import YOLO
+
+    from train_yolo import HYPERPARAMS
+
+    number, params, config = task["number"], task["params"], task["config"]
+    start = time.perf_counter()
+    with Study(task["study"], Path(task["db_path"])) as study:
+        study.start(number, params)
+        reported = set()
+        outcome = {"pruned_at": None}
+
+        def on_fit_epoch_end(trainer):
+            epoch = trainer.epoch + 1
+            # Também é chamado na validação final do best.pt: ignora a repetição
+            if epoch in reported or OBJECTIVE not in trainer.metrics:
+                return
+            reported.add(epoch)
+            study.report(number, epoch, float(trainer.metrics[OBJECTIVE]))
+            if not trainer.stop and study.should_prune(number, epoch):
+                outcome["pruned_at"] = epoch
+                trainer.stop = True
+
+        trainer = None
+        if config["image_cache"]:
+            from train_cache import ensure, make_trainer
+
+            trainer = make_trainer(ensure(Path(config["data"]).parent, imgsz=config["imgsz"], verbose=False))
+
+        try:
+            model = YOLO(config["model"])
+            model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+            model.train(
+                trainer=trainer,
+                data=config["data"],
+                epochs=config["epochs"],
+                batch=config["batch"],
+                imgsz=config["imgsz"],
+                device="cpu",
+                workers=0,  # o orçamento de threads já é do trial
+                patience=config["epochs"],  # a poda decide
+                save=False,
+                plots=False,
+                verbose=False,
+                project=str(SWEEP_DIR / task["study"]),
+                name=f"trial_{number:04d}",
+                exist_ok=True,
+                **{**HYPERPARAMS, **params},
+            )
+        except Exception as e:
+            study.finish(number, FAILED, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return {"number": number, "state": FAILED, "error": str(e)}
+
+        state = PRUNED if outcome["pruned_at"] else COMPLETE
+        study.finish(number, state, time.perf_counter() - start)
+        row = next(t for t in study.trials() if t["number"] == number)
+    return {**row, "pruned_at": outcome["pruned_at"]}
+
+
+def run_study(
+    name: str,
+    data_yaml: Path,
+    n_trials: int = 20,
+    parallel: int = 2,
+    space: Optional[Dict] = None,
+    epochs: int = 30,
+    batch: int = 4,
+    imgsz: int = 640,
+    model: str = "yolov8n.pt",
+    image_cache: bool = True,
+    seed: int = 0,
+    warmup_epochs: int = 5,
+    startup_trials: int = 3,
+    db_path: Path = SWEEP_DB,
+):
+    """Cria ou retoma o estudo e roda os trials que faltam."""
+    with Study(name, db_path) as study:
+        if not study.exists:
+            study.create(space or DEFAULT_SPACE, {
+                "data": str(Path(data_yaml).resolve()),
+                "epochs": epochs, "batch": batch, "imgsz": imgsz, "model": model,
+                "image_cache": image_cache, "seed": seed,
+                "warmup_epochs": warmup_epochs, "startup_trials": startup_trials,
+            })
+        elif space is not None and space != study.space:
+            raise ValueError(f"Estudo '{name}' já existe com outro espaço de busca; use outro --study")
+        config, space = study.config, study.space
+        pending = study.pending(n_trials)
+
+    print(f"  Estudo '{name}': {n_trials - len(pending)}/{n_trials} trials prontos, {len(pending)} a rodar")
+    if not pending:
+        print_leaderboard(name, db_path)
+        return
+
+    if config["image_cache"]:
+        # Constrói o cache antes: os trials só leem
+        from train_cache import ensure
+
+        ensure(Path(config["data"]).parent, imgsz=config["imgsz"])
+
+    parallel = max(1, min(parallel, len(pending)))
+    threads = max(1, (os.cpu_count() or 1) // parallel)
+    print(f"  {parallel} trials em paralelo, {threads} threads cada, {config['epochs']} épocas por trial")
+    tasks = [
+        {"study": name, "db_path": str(db_path), "number": number, "threads": threads,
+         "params": sample(space, config["seed"], number), "config": config}
+        for number in pending
+    ]
+    # spawn: cada trial começa limpo, com as variáveis de threads antes do import do torch
+    with ProcessPoolExecutor(
+        max_workers=parallel, mp_context=get_context("spawn"),
+        initializer=_init_worker, initargs=(threads,), max_tasks_per_child=1,
+    ) as pool:
+        futures = [pool.submit(run_trial, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            if result["state"] == FAILED:
+                print(f"  ❌ Trial {result['number']}: {result['error']}")
+            elif result["state"] == PRUNED:
+                print(f"  ✂️  Trial {result['number']}: podado na época {result['pruned_at']} "
+                      f"(mAP50-95 {result['value'] or 0:.4f})")
+            else:
+                print(f"  ✓ Trial {result['number']}: mAP50-95 {result['value'] or 0:.4f} "
+                      f"(melhor época {result['best_epoch']}, {result['seconds']:.0f}s)")
+
+    print_leaderboard(name, db_path)
+
+
+def _format_params(params: Dict) -> str:
+    return ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in sorted(params.items()))
+
+
+def print_leaderboard(name: str, db_path: Path = SWEEP_DB, top: int = 10):
+    with Study(name, db_path) as study:
+        if not study.exists:
+            print(f"  Estudo '{name}' não encontrado em {db_path}")
+            return
+        trials = study.trials()
+    counts = {state: sum(1 for t in trials if t["state"] == state) for state in (COMPLETE, PRUNED, FAILED, RUNNING)}
+    print(f"\n🏆 Placar '{name}': " + ", ".join(f"{n} {state}" for state, n in counts.items() if n))
+    ranked = [t for t in trials if t["value"] is not None]
+    for rank, trial in enumerate(ranked[:top], 1):
+        mark = "✂️ " if trial["state"] == PRUNED else "  "
+        print(
+            f"  {rank:>2}. {mark}trial {trial['number']:<3} mAP50-95 {trial['value']:.4f} "
+            f"(época {trial['best_epoch']}/{trial['epochs']}, {trial['seconds'] or 0:.0f}s)  "
+            f"{_format_params(trial['params'])}"
+        )
+
+
+def load_space(path: Optional[Path]) -> Optional[Dict]:
+    if path is None:
+        return None
+    space = json.loads(Path(path).read_text())
+    for name, spec in space.items():
+        sample({name: spec}, 0, 0)  # valida o tipo
+    return space
+
+
+def add_sweep_arguments(parser: argparse.ArgumentParser):
+    """Argumentos do sweep (também usados por train_yolo.py)."""
+    parser.add_argument("--study", type=str, help="Nome do estudo (cria ou retoma)")
+    parser.add_argument("--space", type=Path, help="Espaço de busca em JSON (padrão: DEFAULT_SPACE)")
+    parser.add_argument("--trials", type=int, default=20, help="Total de trials do estudo")
+    parser.add_argument("--parallel", type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help="Trials simultâneos (as threads são divididas entre eles)")
+    parser.add_argument("--warmup-epochs", type=int, default=5, help="Épocas antes de poder podar")
+    parser.add_argument("--startup-trials", type=int, default=3, help="Trials de referência antes de podar")
+    parser.add_argument("--seed", type=int, default=0, help="Seed do sorteio de parâmetros")
+    parser.add_argument("--leaderboard", action="store_true", help="Só mostrar o placar do estudo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros do treino YOLO")
+    add_sweep_arguments(parser)
+    parser.add_argument("--data", type=Path, default=YOLO_DIR / "data.yaml", help="data.yaml do dataset")
+    parser.add_argument("--epochs", type=int, default=30, help="Épocas por trial")
+    parser.add_argument("--batch", type=int, default=4, help="Batch size")
+    parser.add_argument("--imgsz", type=int, default=640, help="Tamanho das imagens")
+    parser.add_argument("--model", type=str, default="yolov8n.pt", help="Pesos/config iniciais")
+    parser.add_argument("--no-image-cache", action="store_true", help="Não usar o cache de train_cache.py")
+    args = parser.parse_args()
+    if not args.study:
+        parser.error("--study é obrigatório")
+
+    print("=" * 50)
+    print("Sweep de hiperparâmetros")
+    print("=" * 50)
+    if args.leaderboard:
+        print_leaderboard(args.study)
+        return
+    try:
+        run_study(
+            args.study, args.data, args.trials, args.parallel, load_space(args.space),
+            args.epochs, args.batch, args.imgsz, args.model, not args.no_image_cache, args.seed,
+            args.warmup_epochs, args.startup_trials,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
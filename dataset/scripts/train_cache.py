@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Cache de imagens pré-redimensionadas para o treino em CPU.
+
+O treino decodifica o PNG inteiro (diagramas de vários MB) e redimensiona
+para imgsz a cada época. Aqui cada imagem de yolo_dataset/{split}/images
+é decodificada e redimensionada uma única vez, exatamente como o
+load_image do ultralytics (cv2.imread BGR, lado maior = imgsz,
+INTER_LINEAR), e os pixels vão em sequência para um único arquivo uint8
+lido com mmap:
+
+    train_cache/{split}/pixels.u8     pixels de todas as imagens (HxWx3)
+    train_cache/{split}/offsets.npy   int64 (n+1): início de cada imagem
+    train_cache/{split}/shapes.npy    int32 (n, 4): h0, w0, h, w
+    train_cache/{split}/meta.json     imgsz, nomes, MD5, tamanho e mtime
+
+A invalidação é por conteúdo: só imagens cujo MD5 mudou (ou novas) são
+decodificadas de novo; as demais são copiadas do cache anterior. O MD5
+só é recalculado quando tamanho/mtime mudam. O padding do letterbox
+fica com as transformações do ultralytics, porque os labels são
+normalizados sobre a imagem sem padding.
+
+CachedTrainer (ultralytics) lê do cache e cai no caminho normal para
+imagens fora dele.
+
+Uso:
+    python train_cache.py                   # Atualiza o cache de train e val
+    python train_cache.py --imgsz 960
+    python train_cache.py --bench           # Tempo de uma época de leitura, com e sem cache
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from metadata import IMAGE_EXTENSIONS, file_md5
+
+BASE_DIR = Path(__file__).parent.parent
+YOLO_DIR = BASE_DIR / "yolo_dataset"
+CACHE_DIR = BASE_DIR / "train_cache"
+FORMAT_VERSION = 1
+DEFAULT_IMGSZ = 640
+CACHED_SPLITS = ("train", "val")
+# Imagens decodificadas em memória por vez durante a construção
+WINDOW = 64
+
+
+def resized_image(path: Path, imgsz: int) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Imagem BGR com o lado maior em imgsz, como BaseDataset.load_image (rect_mode)."""
+    import cv2
+
+    im = cv2.imread(str(path))
+    if im is None:
+        raise FileNotFoundError(f"Imagem ilegível: {path}")
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(im), (h0, w0)
+
+
+def _listing(images_dir: Path) -> List[Tuple[str, int, int]]:
+    """(nome, tamanho, mtime_ns) das imagens do diretório, em ordem de nome."""
+    found = []
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                st = entry.stat()
+                found.append((entry.name, st.st_size, st.st_mtime_ns))
+    return sorted(found)
+
+
+class ImageCache:
+    """Cache de um split, aberto em mmap sob demanda (sobrevive a pickle)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        meta = json.loads((path / "meta.json").read_text())
+        self.imgsz = meta["imgsz"]
+        self.names = meta["names"]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self._pixels = self._offsets = self._shapes = None
+
+    def __getstate__(self):
+        # Workers do DataLoader reabrem o mmap em vez de receber os pixels
+        state = self.__dict__.copy()
+        state["_pixels"] = state["_offsets"] = state["_shapes"] = None
+        return state
+
+    def _open(self):
+        self._offsets = np.load(self.path / "offsets.npy")
+        self._shapes = np.load(self.path / "shapes.npy")
+        total = int(self._offsets[-1])
+        self._pixels = np.memmap(self.path / "pixels.u8", dtype=np.uint8, mode="r", shape=(total,)) if total else None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.path / "pixels.u8").stat().st_size
+
+    def entry(self, i: int) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """(imagem redimensionada em mmap, (h0, w0)) da i-ésima imagem."""
+        if self._offsets is None:
+            self._open()
+        h0, w0, h, w = (int(v) for v in self._shapes[i])
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._pixels[start:end].reshape(h, w, 3), (h0, w0)
+
+    def get(self, image_path) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        """Como entry(), pelo caminho da imagem (só o nome importa); None se fora do cache."""
+        i = self.index.get(os.path.basename(image_path))
+        return None if i is None else self.entry(i)
+
+
+def build(
+    images_dir: Path,
+    cache_dir: Path,
+    imgsz: int = DEFAULT_IMGSZ,
+    workers: Optional[int] = None,
+) -> Dict:
+    """Atualiza o cache de um diretório de imagens; reaproveita o que não mudou."""
+    start = time.perf_counter()
+    listing = _listing(images_dir) if images_dir.is_dir() else []
+
+    old: Optional[ImageCache] = None
+    old_files: Dict[str, dict] = {}
+    if (cache_dir / "meta.json").exists():
+        meta = json.loads((cache_dir / "meta.json").read_text())
+        if meta.get("version") == FORMAT_VERSION:
+            old = ImageCache(cache_dir)
+            old_files = {name: info for name, info in zip(meta["names"], meta["files"])}
+            if meta["imgsz"] != imgsz:
+                old = None  # pixels de outro tamanho: só os MD5 servem
+
+    pool = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4))
+
+    def digest(item: Tuple[str, int, int]) -> str:
+        name, size, mtime_ns = item
+        info = old_files.get(name)
+        if info and info["size"] == size and info["mtime_ns"] == mtime_ns:
+            return info["md5"]
+        return file_md5(images_dir / name)
+
+    digests = list(pool.map(digest, listing))
+    # Reaproveitável: mesmo conteúdo, já no cache com o mesmo imgsz
+    reuse = [old is not None and old_files.get(name, {}).get("md5") == md5
+             for (name, _, _), md5 in zip(listing, digests)]
+
+    def load(i: int) -> Tuple[np.ndarray, Tuple[int, int]]:
+        if reuse[i]:
+            return old.entry(old.index[listing[i][0]])
+        return resized_image(images_dir / listing[i][0], imgsz)
+
+    partial = cache_dir.with_name(cache_dir.name + ".part")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+    offsets = np.zeros(len(listing) + 1, dtype=np.int64)
+    shapes = np.zeros((len(listing), 4), dtype=np.int32)
+    with open(partial / "pixels.u8", "wb") as f:
+        for window in range(0, len(listing), WINDOW):
+            indices = range(window, min(window + WINDOW, len(listing)))
+            for i, (im, (h0, w0)) in zip(indices, pool.map(load, indices)):
+                f.write(im.tobytes())
+                offsets[i + 1] = offsets[i] + im.size
+                shapes[i] = (h0, w0, im.shape[0], im.shape[1])
+    pool.shutdown()
+    np.save(partial / "offsets.npy", offsets)
+    np.save(partial / "shapes.npy", shapes)
+    meta = {
+        "version": FORMAT_VERSION,
+        "imgsz": imgsz,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "names": [name for name, _, _ in listing],
+        "files": [{"size": size, "mtime_ns": mtime_ns, "md5": md5} for (_, size, mtime_ns), md5 in zip(listing, digests)],
+    }
+    (partial / "meta.json").write_text(json.dumps(meta))
+
+    old = None  # fecha o mmap antigo antes da troca
+    backup = cache_dir.with_name(cache_dir.name + ".old")
+    shutil.rmtree(backup, ignore_errors=True)
+    if cache_dir.exists():
+        cache_dir.replace(backup)
+    partial.replace(cache_dir)
+    shutil.rmtree(backup, ignore_errors=True)
+
+    decoded = reuse.count(False)
+    return {
+        "images": len(listing),
+        "decoded": decoded,
+        "reused": len(listing) - decoded,
+        "removed": len(set(old_files) - set(meta["names"])),
+        "bytes": int(offsets[-1]),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def is_current(images_dir: Path, cache_dir: Path, imgsz: int) -> bool:
+    """Cache existe, tem o mesmo imgsz e a mesma listagem (nome, tamanho, mtime)?"""
+    meta_path = cache_dir / "meta.json"
+    if not meta_path.exists() or not images_dir.is_dir():
+        return False
+    meta = json.loads(meta_path.read_text())
+    if meta.get("version") != FORMAT_VERSION or meta["imgsz"] != imgsz:
+        return False
+    cached = [(name, info["size"], info["mtime_ns"]) for name, info in zip(meta["names"], meta["files"])]
+    return cached == _listing(images_dir)
+
+
+def ensure(
+    yolo_dir: Path = YOLO_DIR,
+    cache_dir: Path = CACHE_DIR,
+    imgsz: int = DEFAULT_IMGSZ,
+    splits: Iterable[str] = CACHED_SPLITS,
+    verbose: bool = True,
+) -> Dict[str, ImageCache]:
+    """Atualiza (se preciso) e abre o cache de cada split."""
+    caches = {}
+    for split in splits:
+        images_dir, split_cache = yolo_dir / split / "images", cache_dir / split
+        if not is_current(images_dir, split_cache, imgsz):
+            stats = build(images_dir, split_cache, imgsz)
+            if verbose:
+                print(
+                    f"  🗜️  Cache {split}: {stats['images']} imagens ({stats['decoded']} decodificadas, "
+                    f"{stats['reused']} reaproveitadas, -{stats['removed']}), "
+                    f"{stats['bytes'] / 2**20:.0f} MB em {stats['seconds']}s"
+                )
+        caches[split] = ImageCache(split_cache)
+    return caches
+
+
+def make_trainer(caches: Dict[str, ImageCache]):
+    """DetectionTrainer cujos datasets leem as imagens do cache (import tardio do ultralytics)."""
+    from ultralytics.data import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class CachedYOLODataset(YOLODataset):
+        def __init__(self, *args, image_cache: Optional[ImageCache] = None, **kwargs):
+            self.image_cache = image_cache
+            super().__init__(*args, **kwargs)
+
+        def load_image(self, i, rect_mode=True):
+            usable = self.image_cache is not None and self.image_cache.imgsz == self.imgsz and rect_mode
+            cached = self.image_cache.get(self.im_files[i]) if usable and self.ims[i] is None else None
+            if cached is None:
+                return super().load_image(i, rect_mode)
+            im, hw0 = cached
+            if self.augment:
+                # Mesmo buffer do load_image original (o mosaic sorteia dele)
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    self.buffer.pop(0)
+            # Cópia: as transformações alteram a imagem no lugar
+            return np.array(im), hw0, im.shape[:2]
+
+    class CachedTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            from ultralytics.utils.torch_utils import de_parallel
+            from ultralytics.utils import colorstr
+
+            # Mesmos argumentos de build_yolo_dataset, com o cache do split
+            gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            cfg = self.args
+            return CachedYOLODataset(
+                img_path=img_path,
+                imgsz=cfg.imgsz,
+                batch_size=batch,
+                augment=mode == "train",
+                hyp=cfg,
+                rect=cfg.rect or mode == "val",
+                cache=cfg.cache or None,
+                single_cls=cfg.single_cls or False,
+                stride=int(gs),
+                pad=0.0 if mode == "train" else 0.5,
+                prefix=colorstr(f"{mode}: "),
+                task=cfg.task,
+                classes=cfg.classes,
+                data=self.data,
+                fraction=cfg.fraction if mode == "train" else 1.0,
+                image_cache=caches.get(Path(img_path).parent.name),
+            )
+
+    return CachedTrainer
+
+
+def bench(images_dir: Path, cache: ImageCache) -> Tuple[float, float]:
+    """Segundos para ler todas as imagens uma vez: decode+resize vs cache."""
+    names = cache.names
+    start = time.perf_counter()
+    for name in names:
+        resized_image(images_dir / name, cache.imgsz)
+    decoded = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(len(names)):
+        np.array(cache.entry(i)[0])
+    cached = time.perf_counter() - start
+    return decoded, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache de imagens pré-redimensionadas para o treino")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help="Lado maior das imagens (px)")
+    parser.add_argument("--splits", nargs="+", default=list(CACHED_SPLITS), help="Splits a cachear")
+    parser.add_argument("--bench", action="store_true", help="Comparar uma época de leitura com e sem cache")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Cache de imagens para o treino")
+    print("=" * 50)
+    caches = ensure(YOLO_DIR, CACHE_DIR, args.imgsz, args.splits)
+    for split, cache in caches.items():
+        print(f"  {split}: {len(cache)} imagens, {cache.nbytes / 2**20:.0f} MB em {cache.path}")
+        if args.bench and len(cache):
+            decoded, cached = bench(YOLO_DIR / split / "images", cache)
+            print(
+                f"    ⏱️  Leitura por época: {decoded:.2f}s decodificando -> {cached:.3f}s do cache "
+                f"({decoded / max(cached, 1e-9):.0f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
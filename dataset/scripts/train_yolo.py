@@ -7,54 +7,52 @@ Pré-requisitos:
 
 Uso:
     python train_yolo.py [--epochs 100] [--batch 16] [--device cuda]
+    python train_yolo.py --no-image-cache   # Sem o cache de train_cache.py (compara o tempo por época)
+    python train_yolo.py --sweep --study aug1 --trials 20 --parallel 2 --epochs 30
+    python train_yolo.py --study aug1 --leaderboard
+    python train_yolo.py --params-from aug1  # Melhores parâmetros do sweep
 """
 
 import argparse
+import json
+import time
 from pathlib import Path
-import shutil
-import os
-
-def setup_yolo_structure():
-    """Reorganiza o dataset para o formato esperado pelo YOLO."""
+from typing import Dict, Optional
+
+from sweep import Study, add_sweep_arguments, load_space, print_leaderboard, run_study
+from yolo_sync import MODES, print_sync, sync
+
+EPOCH_TIMES_PATH = Path("runs/train/epoch_times.json")
+
+# Augmentation e otimização padrão; sweep.py busca valores melhores
+HYPERPARAMS = {
+    # Augmentation (reduzido para diagramas)
+    "hsv_h": 0.015,
+    "hsv_s": 0.3,
+    "hsv_v": 0.3,
+    "degrees": 5,
+    "translate": 0.1,
+    "scale": 0.3,
+    "flipud": 0.0,  # Não flipar (diagramas têm orientação)
+    "fliplr": 0.0,
+
+    # Otimização
+    "optimizer": "AdamW",
+    "lr0": 0.001,
+    "lrf": 0.01,
+    "weight_decay": 0.0005,
+}
+
+def setup_yolo_structure(mode: str = "auto"):
+    """Sincroniza yolo_dataset/ com os splits do catálogo (links, incremental)."""
     base_dir = Path(__file__).parent.parent
     yolo_dir = base_dir / "yolo_dataset"
 
-    # Criar estrutura YOLO
-    for split in ["train", "val", "test"]:
-        (yolo_dir / split / "images").mkdir(parents=True, exist_ok=True)
-        (yolo_dir / split / "labels").mkdir(parents=True, exist_ok=True)
-
-    # Copiar imagens e labels para cada split
-    splits_dir = base_dir / "splits"
-    images_dir = base_dir / "images"
-    annotations_dir = base_dir / "annotations"
-
-    for split in ["train", "val", "test"]:
-        split_file = splits_dir / f"{split}.txt"
-        if not split_file.exists():
-            continue
-
-        with open(split_file) as f:
-            image_paths = [line.strip() for line in f if line.strip()]
-
-        for img_rel_path in image_paths:
-            img_path = base_dir / img_rel_path
-            if not img_path.exists():
-                print(f"Warning: {img_path} not found")
-                continue
-
-            # Copiar imagem
-            dest_img = yolo_dir / split / "images" / img_path.name
-            if not dest_img.exists():
-                shutil.copy2(img_path, dest_img)
-
-            # Copiar label (mesmo nome, extensão .txt)
-            label_name = img_path.stem + ".txt"
-            label_path = annotations_dir / label_name
-            if label_path.exists():
-                dest_label = yolo_dir / split / "labels" / label_name
-                if not dest_label.exists():
-                    shutil.copy2(label_path, dest_label)
+    # Membros de cada split vêm do catálogo (sincronizado com splits/*.txt);
+    # imagens listadas no split mas ausentes do disco não aparecem. Arquivos
+    # que saíram do split são removidos e labels alterados são atualizados.
+    stats = sync(base_dir, yolo_dir, mode)
+    print_sync(stats, yolo_dir)
 
     print(f"Dataset prepared at: {yolo_dir}")
     return yolo_dir
@@ -112,16 +110,84 @@ nc: 30
     return yaml_path
 
 
-def train(data_yaml: Path, epochs: int = 100, batch: int = 16, device: str = "cpu"):
-    """Treina o modelo YOLO v8."""
+def track_epoch_times(model, image_cache: bool):
+    """Registra o tempo de cada época (treino e total com validação) em EPOCH_TIMES_PATH."""
+    key = "cache" if image_cache else "decode"
+    times = {"train": [], "fit": []}
+    started = {}
+
+    def on_train_epoch_start(trainer):
+        started["train"] = time.perf_counter()
+
+    def on_train_epoch_end(trainer):
+        times["train"].append(time.perf_counter() - started["train"])
+
+    def on_fit_epoch_end(trainer):
+        # Também é chamado na validação final, depois da última época
+        if len(times["fit"]) >= len(times["train"]):
+            return
+        if trainer.epoch_time is not None:
+            times["fit"].append(trainer.epoch_time)
+        print(f"  ⏱️  Epoch {len(times['train'])}: {times['train'][-1]:.1f}s train, "
+              f"{times['fit'][-1] if times['fit'] else 0:.1f}s with val ({key})")
+
+    def on_train_end(trainer):
+        if not times["train"]:
+            return
+        history = json.loads(EPOCH_TIMES_PATH.read_text()) if EPOCH_TIMES_PATH.exists() else {}
+        history[key] = {
+            "epochs": len(times["train"]),
+            "mean_train_s": round(sum(times["train"]) / len(times["train"]), 2),
+            "mean_fit_s": round(sum(times["fit"]) / len(times["fit"]), 2) if times["fit"] else None,
+        }
+        EPOCH_TIMES_PATH.parent.mkdir(parents=True, exist_ok=True)
+        EPOCH_TIMES_PATH.write_text(json.dumps(history, indent=2))
+        print_epoch_times(history)
+
+    model.add_callback("on_train_epoch_start", on_train_epoch_start)
+    model.add_callback("on_train_epoch_end", on_train_epoch_end)
+    model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+    model.add_callback("on_train_end", on_train_end)
+
+
+def print_epoch_times(history: dict):
+    """Tempo médio por época sem cache (decode) e com cache, quando os dois existem."""
+    print("\nMean time per epoch:")
+    for key, label in (("decode", "Before (decode PNG)"), ("cache", "After (image cache)")):
+        if key in history:
+            entry = history[key]
+            print(f"  {label}: {entry['mean_train_s']:.1f}s train, {entry['mean_fit_s'] or 0:.1f}s with val "
+                  f"({entry['epochs']} epochs)")
+    if "decode" in history and "cache" in history and history["cache"]["mean_train_s"]:
+        print(f"  Speedup (train): {history['decode']['mean_train_s'] / history['cache']['mean_train_s']:.2f}x")
+
+
+def train(
+    data_yaml: Path,
+    epochs: int = 100,
+    batch: int = 16,
+    device: str = "cpu",
+    image_cache: bool = True,
+    imgsz: int = 640,
+    hyperparams: Optional[Dict] = None,
+):
+    """Treina o modelo YOLO v8 (hyperparams sobrescreve HYPERPARAMS)."""
     try:
         from ultralytics import YOLO
     except ImportError:
         print("Error: ultralytics not installed. Run: pip install ultralytics")
         return None
 
+    # Imagens decodificadas e redimensionadas uma vez (train_cache.py), lidas em mmap
+    trainer = None
+    if image_cache:
+        from train_cache import ensure, make_trainer
+
+        trainer = make_trainer(ensure(data_yaml.parent, imgsz=imgsz))
+
     # Usar modelo pré-treinado como base
     model = YOLO("yolov8n.pt")  # nano model (mais rápido para teste)
+    track_epoch_times(model, image_cache)
 
     print("\n" + "=" * 50)
     print("Starting YOLO Training")
@@ -130,34 +196,21 @@ def train(data_yaml: Path, epochs: int = 100, batch: int = 16, device: str = "cp
     print(f"  Epochs: {epochs}")
     print(f"  Batch size: {batch}")
     print(f"  Device: {device}")
+    print(f"  Image cache: {'on' if image_cache else 'off'}")
     print("=" * 50 + "\n")
 
     # Treinar
     results = model.train(
+        trainer=trainer,
         data=str(data_yaml),
         epochs=epochs,
         batch=batch,
-        imgsz=640,
+        imgsz=imgsz,
         device=device,
         patience=20,  # Early stopping
         save=True,
         plots=True,
-
-        # Augmentation (reduzido para diagramas)
-        hsv_h=0.015,
-        hsv_s=0.3,
-        hsv_v=0.3,
-        degrees=5,
-        translate=0.1,
-        scale=0.3,
-        flipud=0.0,  # Não flipar (diagramas têm orientação)
-        fliplr=0.0,
-
-        # Otimização
-        optimizer="AdamW",
-        lr0=0.001,
-        lrf=0.01,
-        weight_decay=0.0005,
+        **{**HYPERPARAMS, **(hyperparams or {})},
 
         # Nome do projeto
         project="runs/train",
@@ -209,23 +262,60 @@ def main():
     parser.add_argument("--device", type=str, default="cpu", help="Device (cpu/cuda/mps)")
     parser.add_argument("--eval-only", action="store_true", help="Only evaluate existing model")
     parser.add_argument("--export", type=str, help="Export model to format (onnx/torchscript)")
+    parser.add_argument("--imgsz", type=int, default=640, help="Training image size")
+    parser.add_argument("--no-image-cache", action="store_true",
+                        help="Decode images every epoch instead of reading the pre-resized cache")
+    parser.add_argument("--link-mode", choices=MODES, default="auto",
+                        help="How yolo_dataset/ files are materialized (hardlink/symlink/copy)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Run a hyperparameter sweep (sweep.py) instead of a single training")
+    parser.add_argument("--params-from", type=str, metavar="STUDY",
+                        help="Train with the best parameters found by a sweep study")
+    add_sweep_arguments(parser)
     args = parser.parse_args()
+    if (args.sweep or args.leaderboard) and not args.study:
+        parser.error("--sweep/--leaderboard need --study")
+
+    if args.leaderboard:
+        print_leaderboard(args.study)
+        return
+
+    hyperparams = None
+    if args.params_from:
+        with Study(args.params_from) as study:
+            hyperparams = study.best_params()
+        if hyperparams is None:
+            parser.error(f"Study '{args.params_from}' has no finished trials")
+        print(f"Using parameters from study '{args.params_from}': {hyperparams}")
 
     # Setup
     print("Setting up dataset structure...")
-    yolo_dir = setup_yolo_structure()
+    yolo_dir = setup_yolo_structure(args.link_mode)
     data_yaml = create_data_yaml(yolo_dir)
 
     # Check for existing model
     best_model = Path("runs/train/architecture_detector/weights/best.pt")
 
-    if args.eval_only and best_model.exists():
+    if args.sweep:
+        print("\n" + "=" * 50)
+        print("Hyperparameter Sweep")
+        print("=" * 50)
+        try:
+            run_study(
+                args.study, data_yaml, args.trials, args.parallel, load_space(args.space),
+                args.epochs, args.batch, args.imgsz, image_cache=not args.no_image_cache, seed=args.seed,
+                warmup_epochs=args.warmup_epochs, startup_trials=args.startup_trials,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.eval_only and best_model.exists():
         evaluate(best_model, data_yaml)
     elif args.export and best_model.exists():
         export_model(best_model, args.export)
     else:
         # Train
-        train(data_yaml, epochs=args.epochs, batch=args.batch, device=args.device)
+        train(data_yaml, epochs=args.epochs, batch=args.batch, device=args.device,
+              image_cache=not args.no_image_cache, imgsz=args.imgsz, hyperparams=hyperparams)
 
         # Evaluate
         if best_model.exists():
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Sincronização incremental de yolo_dataset/ com o catálogo.
+
+yolo_dataset/{split}/images e labels espelham os splits do catálogo:
+cada imagem vira um link para images/ e cada label um link para
+annotations/{stem}.txt, então preparar o dataset não duplica espaço.
+
+- modo auto: hardlink; se o sistema de arquivos recusar (outro disco,
+  sem permissão), symlink relativo; em último caso, cópia
+- o que já está certo não é tocado: hardlink para o mesmo inode,
+  symlink para o mesmo alvo ou cópia com o mesmo conteúdo (tamanho,
+  depois MD5)
+- fix_annotations.py e convert_to_yolo (auto_annotate.py) reescrevem o
+  .txt no lugar, no mesmo inode: com hardlink/symlink a mudança já
+  aparece em yolo_dataset/ e nada é religado; cópias são comparadas por
+  conteúdo e recopiadas
+- arquivos que saíram do split (ou perderam o label) são removidos
+- cada troca é atômica (.part + replace) e as operações rodam num pool
+  de threads
+
+Duas imagens com o mesmo nome no mesmo split colidem em images/; fica a
+primeira em ordem de caminho e a colisão é reportada.
+
+Atenção: nos modos hardlink e symlink, yolo_dataset/ não é uma cópia.
+Editar yolo_dataset/*/labels/*.txt (ou as imagens) no lugar altera
+annotations/ (e images/) também. Rodar fix_annotations.py --dir nessa
+pasta tem o mesmo efeito. Um editor que salva por rename quebra o link:
+annotations/ fica como estava, e o próximo sync troca o arquivo editado
+pelo link de novo. Edite sempre em annotations/: --mode copy protege
+annotations/, mas o sync desfaz edições em yolo_dataset/ em qualquer
+modo.
+
+Uso:
+    python yolo_sync.py                     # Sincroniza (modo auto)
+    python yolo_sync.py --mode copy
+    python yolo_sync.py --dry-run           # Só mostra o que mudaria
+"""
+
+import argparse
+import errno
+import os
+import shutil
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from catalog import SPLITS, open_catalog
+from metadata import file_md5
+
+BASE_DIR = Path(__file__).parent.parent
+YOLO_DIR = BASE_DIR / "yolo_dataset"
+MODES = ("auto", "hardlink", "symlink", "copy")
+# Erros de link que mandam tentar o próximo modo
+_LINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EMLINK, errno.EOPNOTSUPP}
+
+
+@dataclass
+class SyncStats:
+    mode: str = ""
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    collisions: List[Tuple[str, str]] = field(default_factory=list)
+    per_split: Dict[str, Tuple[int, int]] = field(default_factory=dict)  # split -> (imagens, labels)
+    seconds: float = 0.0
+
+
+def desired_files(base_dir: Path, yolo_dir: Path, catalog) -> Tuple[Dict[Path, Path], SyncStats]:
+    """Destino em yolo_dir -> origem, a partir dos splits do catálogo."""
+    annotations_dir = base_dir / "annotations"
+    wanted: Dict[Path, Path] = {}
+    stats = SyncStats()
+    for split in SPLITS:
+        images = catalog.images(split=split)
+        labeled = set(catalog.images(split=split, annotated=True))
+        n_images = n_labels = 0
+        for image in images:
+            dest = yolo_dir / split / "images" / image.name
+            if dest in wanted:
+                stats.collisions.append((wanted[dest].relative_to(base_dir).as_posix(),
+                                         image.relative_to(base_dir).as_posix()))
+                continue
+            wanted[dest] = image
+            n_images += 1
+            if image in labeled:
+                wanted[yolo_dir / split / "labels" / f"{image.stem}.txt"] = annotations_dir / f"{image.stem}.txt"
+                n_labels += 1
+        stats.per_split[split] = (n_images, n_labels)
+    return wanted, stats
+
+
+def _symlink_target(dest: Path, source: Path) -> str:
+    return os.path.relpath(source, dest.parent)
+
+
+def is_current(dest: Path, source: Path, mode: str) -> bool:
+    """dest já corresponde a source no modo dado?"""
+    try:
+        st = os.lstat(dest)
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(st.st_mode):
+        return mode == "symlink" and os.readlink(dest) == _symlink_target(dest, source)
+    if mode == "symlink":
+        return False
+    src = os.stat(source)
+    if (st.st_dev, st.st_ino) == (src.st_dev, src.st_ino):
+        return True
+    if mode == "hardlink":
+        return False  # cópia antiga: vira link e libera o espaço
+    return st.st_size == src.st_size and file_md5(dest) == file_md5(source)
+
+
+def place(dest: Path, source: Path, mode: str):
+    """Cria dest (link ou cópia de source) de forma atômica."""
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.part")
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    if mode == "hardlink":
+        os.link(source, tmp)
+    elif mode == "symlink":
+        os.symlink(_symlink_target(dest, source), tmp)
+    else:
+        shutil.copy2(source, tmp)
+    os.replace(tmp, dest)
+
+
+def resolve_mode(mode: str, probe: Optional[Tuple[Path, Path]]) -> str:
+    """Primeiro modo de link que o sistema de arquivos aceita."""
+    if mode != "auto":
+        return mode
+    if probe is None:
+        return "hardlink"
+    dest, source = probe
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    for candidate in ("hardlink", "symlink"):
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.probe")
+        try:
+            if candidate == "hardlink":
+                os.link(source, tmp)
+            else:
+                os.symlink(_symlink_target(dest, source), tmp)
+        except OSError as e:
+            if e.errno not in _LINK_ERRORS:
+                raise
+            continue
+        os.unlink(tmp)
+        return candidate
+    return "copy"
+
+
+def stale_files(yolo_dir: Path, wanted: Dict[Path, Path]) -> List[Path]:
+    """Arquivos em {split}/images e {split}/labels que não deveriam estar lá."""
+    stale = []
+    for split in SPLITS:
+        for kind in ("images", "labels"):
+            directory = yolo_dir / split / kind
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    path = directory / entry.name
+                    if path not in wanted and not entry.is_dir(follow_symlinks=False):
+                        stale.append(path)
+    return stale
+
+
+def sync(
+    base_dir: Path = BASE_DIR,
+    yolo_dir: Optional[Path] = None,
+    mode: str = "auto",
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+) -> SyncStats:
+    """Deixa yolo_dir igual aos splits do catálogo; retorna estatísticas."""
+    start = time.perf_counter()
+    yolo_dir = yolo_dir or base_dir / YOLO_DIR.name
+    with open_catalog(base_dir) as catalog:
+        wanted, stats = desired_files(base_dir, yolo_dir, catalog)
+
+    if not dry_run:
+        for split in SPLITS:
+            (yolo_dir / split / "images").mkdir(parents=True, exist_ok=True)
+            (yolo_dir / split / "labels").mkdir(parents=True, exist_ok=True)
+    # Em dry-run nada é criado: "auto" é avaliado como hardlink
+    stats.mode = resolve_mode(mode, None if dry_run else next(iter(wanted.items()), None))
+
+    def apply(item: Tuple[Path, Path]) -> str:
+        dest, source = item
+        if is_current(dest, source, stats.mode):
+            return "unchanged"
+        action = "updated" if os.path.lexists(dest) else "created"
+        if not dry_run:
+            place(dest, source, stats.mode)
+        return action
+
+    def remove(path: Path):
+        if not dry_run:
+            os.unlink(path)
+
+    stale = stale_files(yolo_dir, wanted)
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        for action in pool.map(apply, wanted.items(), chunksize=64):
+            setattr(stats, action, getattr(stats, action) + 1)
+        list(pool.map(remove, stale))
+    stats.removed = len(stale)
+    stats.seconds = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def print_sync(stats: SyncStats, yolo_dir: Path, dry_run: bool = False):
+    for split, (images, labels) in stats.per_split.items():
+        print(f"  {split}: {images} imagens, {labels} com labels")
+    prefix = "🔍 (dry-run) " if dry_run else "🔗 "
+    print(
+        f"  {prefix}{yolo_dir.name}: modo {stats.mode}, +{stats.created} ~{stats.updated} "
+        f"-{stats.removed}, {stats.unchanged} inalterados em {stats.seconds}s"
+    )
+    if stats.collisions:
+        print(f"  ⚠️  {len(stats.collisions)} imagens com nome repetido no mesmo split (mantida a primeira):")
+        for keep, skipped in stats.collisions[:10]:
+            print(f"    {skipped} (colide com {keep})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza yolo_dataset/ com os splits do catálogo")
+    parser.add_argument("--mode", choices=MODES, default="auto", help="Como materializar os arquivos")
+    parser.add_argument("--output", type=Path, default=YOLO_DIR, help="Diretório do dataset YOLO")
+    parser.add_argument("--workers", type=int, default=None, help="Threads de I/O")
+    parser.add_argument("--dry-run", action="store_true", help="Só relatar o que mudaria")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Sincronizando dataset YOLO")
+    print("=" * 50)
+    stats = sync(BASE_DIR, args.output, args.mode, args.workers, args.dry_run)
+    print_sync(stats, args.output, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Endpoints administrativos (profiling, memoria), protegidos por token.
+
+O token vem de YOLO_ADMIN_TOKEN e deve ser enviado no header
+X-Admin-Token. Sem a variavel definida, as rotas administrativas ficam
+desabilitadas.
+"""
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+import memory
+import profiling
+
+ADMIN_TOKEN = os.environ.get("YOLO_ADMIN_TOKEN", "")
+
+
+def token_ok(token: Optional[str]) -> bool:
+    """Compara o token em tempo constante; falso se admin desabilitado."""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Endpoints administrativos desabilitados")
+    if not token_ok(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token administrativo invalido")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+# ---------------------------------------------------------------------------
+# Profiling por requisicao (?profile=1)
+# ---------------------------------------------------------------------------
+
+@router.get("/profiles")
+async def list_profiles():
+    """Perfis de requisicao guardados em memoria (mais recentes por ultimo)."""
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """Arvore de chamadas, tempos por estagio e top funcoes de uma requisicao."""
+    report = profiling.get_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Perfil nao encontrado: {profile_id}")
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Profiler por amostragem
+# ---------------------------------------------------------------------------
+
+@router.post("/profiler/start")
+async def start_sampling(
+    duration: float = Query(30.0, gt=0, le=600, description="Janela de amostragem em segundos"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Intervalo entre amostras"),
+):
+    """Liga o profiler por amostragem durante `duration` segundos."""
+    if not profiling.sampler.start(duration, interval_ms / 1000):
+        raise HTTPException(status_code=409, detail="Profiler por amostragem ja esta rodando")
+    return profiling.sampler.status()
+
+
+@router.post("/profiler/stop")
+async def stop_sampling():
+    """Encerra a janela de amostragem antes do prazo."""
+    profiling.sampler.stop()
+    return profiling.sampler.status()
+
+
+@router.get("/profiler/status")
+async def sampling_status():
+    return profiling.sampler.status()
+
+
+@router.get("/profiler/stacks", response_class=PlainTextResponse)
+async def sampling_stacks():
+    """Pilhas no formato collapsed, prontas para flamegraph.pl ou speedscope."""
+    return profiling.sampler.collapsed()
+
+
+# ---------------------------------------------------------------------------
+# Memoria (tracemalloc, objetos vivos, GC)
+# ---------------------------------------------------------------------------
+
+@router.get("/memory")
+async def memory_summary():
+    """RSS, estado do tracemalloc e pico/retido das requisicoes recentes."""
+    return memory.summary()
+
+
+@router.get("/memory/objects")
+async def memory_objects():
+    """Instancias vivas de PIL Image, Results/Boxes do ultralytics e ndarray."""
+    return memory.live_objects()
+
+
+@router.post("/memory/gc")
+async def memory_gc():
+    return memory.collect_garbage()
+
+
+@router.post("/memory/tracemalloc/start")
+async def tracemalloc_start(
+    frames: int = Query(1, ge=1, le=50, description="Frames de traceback por alocacao"),
+):
+    if not memory.start_tracing(frames):
+        raise HTTPException(status_code=409, detail="tracemalloc ja esta ligado")
+    return memory.summary()
+
+
+@router.post("/memory/tracemalloc/stop")
+async def tracemalloc_stop():
+    memory.stop_tracing()
+    return memory.summary()
+
+
+@router.post("/memory/snapshots")
+async def memory_snapshot(label: str = Query("", max_length=100)):
+    """Tira um snapshot do tracemalloc (roda gc.collect() antes)."""
+    try:
+        return memory.take_snapshot(label)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="tracemalloc desligado: POST /admin/memory/tracemalloc/start")
+
+
+@router.get("/memory/snapshots")
+async def memory_snapshots():
+    return memory.list_snapshots()
+
+
+@router.get("/memory/snapshots/{snapshot_id}")
+async def memory_snapshot_top(
+    snapshot_id: str,
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=500),
+):
+    """Maiores alocacoes vivas no snapshot."""
+    try:
+        return memory.snapshot_top(snapshot_id, group_by, limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Snapshot nao encontrado: {snapshot_id}")
+
+
+@router.get("/memory/snapshots/{snapshot_id}/diff")
+async def memory_snapshot_diff(
+    snapshot_id: str,
+    base: str = Query(..., description="Snapshot de referencia (mais antigo)"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=500),
+):
+    """O que cresceu de `base` ate `snapshot_id`, maiores diferencas primeiro."""
+    try:
+        return memory.snapshot_diff(base, snapshot_id, group_by, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Snapshot nao encontrado: {e.args[0]}")
@@ -0,0 +1,233 @@
+"""
+Extracao local de conexoes entre componentes detectados.
+
+Hoje so o Claude Vision devolve conexoes (~5-10s por diagrama). Este
+estagio estima o grafo de conexoes direto da imagem:
+
+1. mascara binaria de tracos finos (threshold adaptativo), com o
+   interior dos boxes detectados apagado
+2. segmentos de reta via Hough probabilistico (OpenCV)
+3. segmentos que se tocam viram uma polilinha (componentes conexos
+   sobre os segmentos rasterizados)
+4. extremidades dos segmentos sao ancoradas ao box mais proximo via
+   indice espacial em grade (merge.GridIndex)
+5. cada polilinha que toca dois ou mais boxes gera conexoes; a direcao
+   vem da densidade de tinta (ponta de seta) em cada extremidade
+
+Todas as etapas operam sobre arrays inteiros; a saida segue a estrutura
+`connections` de dataset/scripts/auto_annotate.py.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from merge import GridIndex, first_per_group
+
+# Polilinhas que tocam mais boxes que isso costumam ser molduras/grupos
+MAX_FANOUT = 4
+
+# Uma extremidade e ponta de seta se tem esta razao de tinta sobre a outra
+ARROWHEAD_RATIO = 1.3
+
+
+def to_gray(source) -> np.ndarray:
+    """Converte imagem PIL (RGB) ou array BGR em tons de cinza uint8."""
+    import cv2
+
+    if isinstance(source, np.ndarray):
+        return cv2.cvtColor(np.ascontiguousarray(source), cv2.COLOR_BGR2GRAY)
+    return np.asarray(source.convert("L"))
+
+
+def _box_mask(shape: Tuple[int, int], boxes: np.ndarray) -> np.ndarray:
+    """Mascara booleana da uniao dos boxes, via array de diferencas 2D."""
+    h, w = shape
+    diff = np.zeros((h + 1, w + 1), dtype=np.int32)
+    if len(boxes):
+        x1 = np.clip(boxes[:, 0], 0, w).astype(np.int64)
+        y1 = np.clip(boxes[:, 1], 0, h).astype(np.int64)
+        # Bordas direita/inferior inclusivas: o contorno do box tambem sai
+        x2 = np.clip(boxes[:, 2] + 1, 0, w).astype(np.int64)
+        y2 = np.clip(boxes[:, 3] + 1, 0, h).astype(np.int64)
+        np.add.at(diff, (y1, x1), 1)
+        np.add.at(diff, (y1, x2), -1)
+        np.add.at(diff, (y2, x1), -1)
+        np.add.at(diff, (y2, x2), 1)
+    return diff.cumsum(axis=0).cumsum(axis=1)[:h, :w] > 0
+
+
+def line_mask(gray: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Tracos finos escuros sobre fundo claro (inverte fundos escuros)."""
+    import cv2
+
+    if np.median(gray) < 128:
+        gray = 255 - gray
+    mask = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+    )
+    mask[_box_mask(gray.shape, boxes)] = 0
+    return mask
+
+
+def detect_segments(mask: np.ndarray, min_length: float, max_gap: float) -> np.ndarray:
+    """Segmentos (N, 4) x1, y1, x2, y2 via HoughLinesP."""
+    import cv2
+
+    lines = cv2.HoughLinesP(
+        mask,
+        rho=1,
+        theta=np.pi / 180,
+        threshold=max(10, int(min_length * 0.6)),
+        minLineLength=min_length,
+        maxLineGap=max_gap,
+    )
+    if lines is None:
+        return np.zeros((0, 4), dtype=np.float64)
+    return lines.reshape(-1, 4).astype(np.float64)
+
+
+def group_polylines(shape: Tuple[int, int], segments: np.ndarray, thickness: int) -> np.ndarray:
+    """Id de polilinha de cada segmento (segmentos que se tocam compartilham id)."""
+    import cv2
+
+    canvas = np.zeros(shape, dtype=np.uint8)
+    pts = segments.reshape(-1, 2, 2).round().astype(np.int32)
+    cv2.polylines(canvas, list(pts), False, 255, thickness)
+    _, labels = cv2.connectedComponents(canvas, connectivity=8)
+
+    mid = ((segments[:, :2] + segments[:, 2:]) / 2).round().astype(np.int64)
+    mid[:, 0] = mid[:, 0].clip(0, shape[1] - 1)
+    mid[:, 1] = mid[:, 1].clip(0, shape[0] - 1)
+    return labels[mid[:, 1], mid[:, 0]]
+
+
+def snap_points(points: np.ndarray, boxes: np.ndarray, margin: float) -> np.ndarray:
+    """
+    Box mais proximo de cada ponto (distancia ate a borda <= margin), ou -1.
+    """
+    snapped = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0 or len(boxes) == 0:
+        return snapped
+
+    expanded = boxes + np.array([-margin, -margin, margin, margin])
+    index = GridIndex(expanded)
+    p, b = index.candidate_pairs(np.concatenate([points, points], axis=1))
+
+    dx = np.maximum.reduce([boxes[b, 0] - points[p, 0], np.zeros(len(p)), points[p, 0] - boxes[b, 2]])
+    dy = np.maximum.reduce([boxes[b, 1] - points[p, 1], np.zeros(len(p)), points[p, 1] - boxes[b, 3]])
+    dist = np.hypot(dx, dy)
+    near = dist <= margin
+    p, b, dist = p[near], b[near], dist[near]
+
+    best = first_per_group(p, dist, b)
+    snapped[p[best]] = b[best]
+    return snapped
+
+
+def endpoint_density(mask: np.ndarray, points: np.ndarray, radius: int) -> np.ndarray:
+    """Fracao de pixels de tinta numa janela quadrada em torno de cada ponto."""
+    import cv2
+
+    h, w = mask.shape
+    integral = cv2.integral((mask > 0).astype(np.uint8))
+    pts = points.round().astype(np.int64)
+    x1 = np.clip(pts[:, 0] - radius, 0, w)
+    x2 = np.clip(pts[:, 0] + radius + 1, 0, w)
+    y1 = np.clip(pts[:, 1] - radius, 0, h)
+    y2 = np.clip(pts[:, 1] + radius + 1, 0, h)
+    ink = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    area = np.maximum((x2 - x1) * (y2 - y1), 1)
+    return ink / area
+
+
+def _pairs_within_group(groups: np.ndarray, items: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices (i, j) de todos os pares com items[i] < items[j] no mesmo grupo."""
+    order = np.lexsort((items, groups))
+    groups, items = groups[order], items[order]
+    start = np.searchsorted(groups, groups, side="left")
+    stop = np.searchsorted(groups, groups, side="right")
+    counts = stop - start
+    left = np.repeat(np.arange(len(groups)), counts)
+    right = np.repeat(start, counts) + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+    keep = items[left] < items[right]
+    return order[left[keep]], order[right[keep]]
+
+
+def extract_connections(
+    gray: np.ndarray,
+    boxes: np.ndarray,
+    snap_margin: Optional[float] = None,
+    min_length: Optional[float] = None,
+) -> List[Dict]:
+    """
+    Estima conexoes entre boxes (xyxy em pixels).
+
+    Retorna lista de {"from": i, "to": j, "bidirectional": bool}, com i e j
+    indices em `boxes`. Sem ponta de seta identificavel (densidade de tinta
+    parecida nas duas extremidades) a conexao e marcada como bidirecional.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) < 2:
+        return []
+
+    h, w = gray.shape
+    diag = float(np.hypot(h, w))
+    if snap_margin is None:
+        snap_margin = max(6.0, 0.04 * diag)
+    if min_length is None:
+        min_length = max(15.0, 0.02 * diag)
+    max_gap = max(4.0, 0.005 * diag)
+
+    mask = line_mask(gray, boxes)
+    segments = detect_segments(mask, min_length, max_gap)
+    if len(segments) == 0:
+        return []
+
+    polyline = group_polylines((h, w), segments, thickness=max(3, int(max_gap)))
+
+    # Extremidades: [seg0.p1, seg0.p2, seg1.p1, ...]
+    endpoints = segments.reshape(-1, 2)
+    endpoint_line = np.repeat(polyline, 2)
+    endpoint_box = snap_points(endpoints, boxes, snap_margin)
+    density = endpoint_density(mask, endpoints, radius=max(3, int(snap_margin / 2)))
+
+    touched = endpoint_box >= 0
+    if not touched.any():
+        return []
+    line_ids, box_ids = endpoint_line[touched], endpoint_box[touched]
+
+    # Tabela (polilinha, box) unica com a maior densidade de ponta
+    key = line_ids * len(boxes) + box_ids
+    uniq, inverse = np.unique(key, return_inverse=True)
+    head = np.zeros(len(uniq))
+    np.maximum.at(head, inverse, density[touched])
+    lines, line_boxes = uniq // len(boxes), uniq % len(boxes)
+
+    # Polilinhas com fanout fora de [2, MAX_FANOUT] sao descartadas
+    _, line_inverse, fanout = np.unique(lines, return_inverse=True, return_counts=True)
+    ok = (fanout[line_inverse] >= 2) & (fanout[line_inverse] <= MAX_FANOUT)
+    lines, line_boxes, head = lines[ok], line_boxes[ok], head[ok]
+    if len(lines) == 0:
+        return []
+
+    a, b = _pairs_within_group(lines, line_boxes)
+    box_a, box_b = line_boxes[a], line_boxes[b]
+    head_a = head[a] >= head[b] * ARROWHEAD_RATIO
+    head_b = head[b] >= head[a] * ARROWHEAD_RATIO
+
+    # Ponta so no lado a: a conexao aponta de b para a
+    src = np.where(head_a & ~head_b, box_b, box_a)
+    dst = np.where(head_a & ~head_b, box_a, box_b)
+    bidirectional = head_a == head_b
+
+    # Varias polilinhas podem ligar o mesmo par de boxes
+    pair_key = np.minimum(src, dst) * len(boxes) + np.maximum(src, dst)
+    _, first = np.unique(pair_key, return_index=True)
+
+    return [
+        {"from": int(s), "to": int(d), "bidirectional": bool(bi)}
+        for s, d, bi in zip(src[first], dst[first], bidirectional[first])
+    ]
@@ -0,0 +1,136 @@
+"""
+Ingestao de pixels brutos para chamadores colocalizados (mesmo host).
+
+Quando o chamador ja tem o diagrama decodificado em memoria (script batch,
+sidecar), enviar PNG implica um ciclo encode/decode + conversao PIL inutil.
+Este modulo entrega ao modelo um array uint8 (H, W, 3) a partir de:
+
+- upload .npy: o array e uma view sobre os bytes recebidos (sem copia)
+- segmento POSIX de shared memory: o array e uma view read-only sobre o
+  mmap do segmento (sem copia), liberada quando a ultima referencia cai
+
+O ultralytics espera arrays numpy em ordem BGR (convencao OpenCV). Com
+`channels="bgr"` o buffer vai direto ao modelo; com `channels="rgb"` ha
+uma unica copia contigua para inverter os canais - a mesma que o caminho
+PIL ja faz internamente, mas sem o decode.
+"""
+
+import io
+import mmap
+import os
+import re
+from typing import Tuple
+
+import numpy as np
+
+# Segmentos POSIX de shared memory ficam em /dev/shm no Linux
+SHM_DIR = os.environ.get("YOLO_SHM_DIR", "/dev/shm")
+
+# Ingestao via shared memory e opt-in: expoe leitura de segmentos do host
+SHM_INGEST_ENABLED = os.environ.get("YOLO_SHM_INGEST", "0") == "1"
+
+_SHM_NAME_RE = re.compile(r"^/?[A-Za-z0-9_.\-]{1,255}$")
+
+SUPPORTED_DTYPES = {"uint8"}
+SUPPORTED_CHANNELS = {"rgb", "bgr"}
+
+
+def parse_shape(shape: str) -> Tuple[int, int, int]:
+    """Converte "H,W,3" (ou "HxWx3") em tupla validada."""
+    try:
+        dims = tuple(int(d) for d in re.split(r"[,x]", shape.strip()) if d)
+    except ValueError:
+        raise ValueError(f"shape invalido: {shape!r}")
+    if len(dims) != 3 or dims[2] != 3 or dims[0] <= 0 or dims[1] <= 0:
+        raise ValueError(f"shape deve ser (altura, largura, 3), recebido: {shape!r}")
+    return dims
+
+
+def _validate_array(arr: np.ndarray) -> np.ndarray:
+    if arr.dtype != np.uint8:
+        raise ValueError(f"dtype deve ser uint8, recebido: {arr.dtype}")
+    if arr.ndim != 3 or arr.shape[2] != 3:
+        raise ValueError(f"array deve ter shape (H, W, 3), recebido: {arr.shape}")
+    if arr.shape[0] == 0 or arr.shape[1] == 0:
+        raise ValueError("array vazio")
+    return arr
+
+
+def array_from_npy(data: bytes) -> np.ndarray:
+    """
+    Interpreta bytes de um arquivo .npy como array, sem copiar os pixels.
+
+    Apenas o header e lido via np.lib.format; o corpo vira uma view
+    read-only sobre `data` (np.load copiaria o buffer inteiro).
+    """
+    fp = io.BytesIO(data)
+    try:
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+        else:
+            raise ValueError(f"versao .npy nao suportada: {version}")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f".npy invalido: {e}")
+
+    if dtype.hasobject:
+        raise ValueError(".npy com objetos Python nao e aceito")
+    if fortran_order:
+        raise ValueError(".npy deve estar em ordem C")
+
+    count = int(np.prod(shape))
+    offset = fp.tell()
+    if len(data) - offset < count * dtype.itemsize:
+        raise ValueError(".npy truncado")
+
+    arr = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return _validate_array(arr)
+
+
+def array_from_shm(name: str, shape: str, dtype: str = "uint8") -> np.ndarray:
+    """
+    Mapeia um segmento POSIX de shared memory como array read-only.
+
+    Usa mmap direto em vez de multiprocessing.shared_memory: o
+    resource_tracker do Python < 3.13 registraria (e removeria no exit)
+    um segmento que pertence ao chamador. O mmap e liberado quando o
+    ultimo array que o referencia e coletado.
+    """
+    if not SHM_INGEST_ENABLED:
+        raise PermissionError("Ingestao via shared memory desabilitada (YOLO_SHM_INGEST=1)")
+    if not _SHM_NAME_RE.match(name) or ".." in name:
+        raise ValueError(f"nome de segmento invalido: {name!r}")
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype deve ser uint8, recebido: {dtype!r}")
+
+    dims = parse_shape(shape)
+    nbytes = dims[0] * dims[1] * dims[2]
+
+    path = os.path.join(SHM_DIR, name.lstrip("/"))
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        raise ValueError(f"segmento nao encontrado: {name!r}")
+    try:
+        size = os.fstat(fd).st_size
+        if size < nbytes:
+            raise ValueError(f"segmento tem {size} bytes, shape exige {nbytes}")
+        mm = mmap.mmap(fd, nbytes, prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+
+    return np.frombuffer(mm, dtype=np.uint8, count=nbytes).reshape(dims)
+
+
+def to_model_layout(arr: np.ndarray, channels: str = "rgb") -> np.ndarray:
+    """Entrega o array na ordem BGR esperada pelo ultralytics."""
+    if channels not in SUPPORTED_CHANNELS:
+        raise ValueError(f"channels deve ser rgb ou bgr, recebido: {channels!r}")
+    _validate_array(arr)
+    if channels == "bgr":
+        return arr
+    return np.ascontiguousarray(arr[:, :, ::-1])
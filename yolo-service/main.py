@@ -15,11 +15,22 @@ from pathlib import Path
 from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
 
-from fastapi import FastAPI, UploadFile, File, Query, HTTPException
+from fastapi import FastAPI, Request, UploadFile, File, Form, Query, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+import numpy as np
 from PIL import Image
 
+import admin
+import edges
+import ingest
+import memory
+import merge
+import postprocess
+import profiling
+import stride_templates
+
 # ---------------------------------------------------------------------------
 # Configuracao
 # ---------------------------------------------------------------------------
@@ -104,6 +115,9 @@ YOLO_TO_BACKEND_TYPE = {
     "email_service": "email",
 }
 
+# Grupo (backend_type) de cada classe, usado no NMS entre classes
+CLASS_GROUPS = postprocess.group_lookup(CATEGORY_NAMES, YOLO_TO_BACKEND_TYPE)
+
 logger = logging.getLogger("yolo-service")
 
 # ---------------------------------------------------------------------------
@@ -137,6 +151,11 @@ def load_model():
 async def lifespan(app: FastAPI):
     """Lifecycle: carrega modelo no startup, libera no shutdown."""
     load_model()
+    stride_templates.get_store()
+    if memory.TRACEMALLOC_FRAMES > 0:
+        # Depois do modelo: os pesos nao interessam aos diffs
+        memory.start_tracing(memory.TRACEMALLOC_FRAMES)
+        logger.info(f"tracemalloc ligado ({memory.TRACEMALLOC_FRAMES} frames)")
     yield
     logger.info("Shutting down YOLO service")
 
@@ -159,16 +178,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(admin.router)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    `?profile=1` (com X-Admin-Token) roda a requisicao sob cProfile;
+    `?timing=1` so mede os estagios e devolve Server-Timing.
+    """
+    if request.query_params.get("profile") != "1":
+        if request.query_params.get("timing") != "1":
+            return await call_next(request)
+        with profiling.StageTimings() as timings:
+            response = await call_next(request)
+        response.headers["Server-Timing"] = timings.server_timing()
+        return response
+    if not admin.token_ok(request.headers.get("X-Admin-Token")):
+        return JSONResponse(status_code=403, content={"detail": "Profiling exige X-Admin-Token valido"})
+
+    with profiling.RequestProfile(request.url.path) as profile:
+        response = await call_next(request)
+    response.headers["X-Profile-Id"] = profiling.store_profile(profile)
+    response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
+
+@app.middleware("http")
+async def track_memory(request: Request, call_next):
+    """Pico/retido por requisicao (ver memory.py); rotas /admin ficam de fora."""
+    if request.url.path.startswith("/admin"):
+        return await call_next(request)
+    with memory.RequestMemory(request.url.path):
+        return await call_next(request)
+
 
 # ---------------------------------------------------------------------------
 # Schemas de resposta
 # ---------------------------------------------------------------------------
 
 class BoundingBox(BaseModel):
-    x_center: float
-    y_center: float
-    width: float
-    height: float
+    # Normalizado; fora de [0, 1] o indice em grade do /merge explodiria em celulas
+    x_center: float = Field(..., ge=0.0, le=1.0)
+    y_center: float = Field(..., ge=0.0, le=1.0)
+    width: float = Field(..., ge=0.0, le=1.0)
+    height: float = Field(..., ge=0.0, le=1.0)
 
 
 class BoundingBoxPixels(BaseModel):
@@ -178,6 +232,13 @@ class BoundingBoxPixels(BaseModel):
     y2: int
 
 
+class StrideThreat(BaseModel):
+    category: str
+    threat: str
+    severity: str
+    countermeasure: str
+
+
 class Detection(BaseModel):
     class_id: int
     class_name: str
@@ -185,6 +246,16 @@ class Detection(BaseModel):
     confidence: float
     bbox_normalized: BoundingBox
     bbox_pixels: BoundingBoxPixels
+    # Ameacas pre-computadas do cache de templates (None = usar o LLM)
+    stride: Optional[List[StrideThreat]] = None
+
+
+class Connection(BaseModel):
+    # Ids 1-based, na ordem de `detections` (mesma convencao do auto_annotate)
+    from_id: int
+    to_id: int
+    protocol: str = ""
+    bidirectional: bool
 
 
 class PredictionResponse(BaseModel):
@@ -193,6 +264,44 @@ class PredictionResponse(BaseModel):
     image_size: Dict[str, int]
     detections: List[Detection]
     total_detections: int
+    connections: Optional[List[Connection]] = None
+
+
+class ClaudeComponent(BaseModel):
+    name: str
+    type: str
+    description: Optional[str] = None
+    bbox_normalized: Optional[BoundingBox] = None
+
+
+class MergeRequest(BaseModel):
+    yolo_detections: List[Detection]
+    claude_components: List[ClaudeComponent]
+    iou_threshold: float = Field(0.3, ge=0.0, le=1.0)
+    yolo_min_confidence: float = Field(0.08, ge=0.0, le=1.0)
+
+
+class MergedComponent(BaseModel):
+    name: str
+    type: str
+    description: Optional[str] = None
+    detection_source: str
+    confidence: Optional[float] = None
+    yolo_class: Optional[str] = None
+    bbox_normalized: Optional[BoundingBox] = None
+
+
+class MergeResponse(BaseModel):
+    merge_time_ms: float
+    components: List[MergedComponent]
+    by_source: Dict[str, int]
+
+
+class StrideTemplateResponse(BaseModel):
+    backend_type: str
+    neighbors: List[str]
+    version: str
+    threats: List[StrideThreat]
 
 
 class HealthResponse(BaseModel):
@@ -202,6 +311,26 @@ class HealthResponse(BaseModel):
     total_classes: int
 
 
+# ---------------------------------------------------------------------------
+# Parametros de pos-filtro (compartilhados pelos endpoints de predicao)
+# ---------------------------------------------------------------------------
+
+def post_filter_params(
+    class_conf: Optional[str] = Query(
+        None, description='Thresholds por classe em JSON, ex: {"vpc": 0.3, "subnet": 0.25}'
+    ),
+    group_iou: Optional[float] = Query(
+        None, ge=0.0, le=1.0, description="IoU do NMS entre classes do mesmo backend_type"
+    ),
+    max_per_class: Optional[int] = Query(None, ge=1, description="Maximo de deteccoes por classe"),
+) -> Dict:
+    try:
+        thresholds = postprocess.parse_class_conf(class_conf, CATEGORY_NAMES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"class_conf": thresholds, "group_iou": group_iou, "max_per_class": max_per_class}
+
+
 # ---------------------------------------------------------------------------
 # Endpoints
 # ---------------------------------------------------------------------------
@@ -221,76 +350,308 @@ async def health_check():
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(
     file: UploadFile = File(..., description="Imagem do diagrama de arquitetura"),
-    confidence: float = Query(0.05, ge=0.01, le=1.0, description="Threshold minimo de confianca"),
+    confidence: float = Query(
+        0.05, ge=postprocess.MIN_CONFIDENCE, le=1.0, description="Threshold minimo de confianca"
+    ),
+    filters: Dict = Depends(post_filter_params),
+    connections: bool = Query(False, description="Extrair conexoes entre componentes localmente"),
+    stride: bool = Query(False, description="Anexar ameacas STRIDE do cache de templates"),
 ):
     """
     Executa inferencia YOLO na imagem enviada.
 
     Retorna lista de componentes detectados com bounding boxes
-    e scores de confianca.
+    e scores de confianca. O pos-filtro (thresholds por classe, NMS por
+    backend_type, top-k por classe) e configuravel por requisicao.
     """
     if model is None:
         raise HTTPException(status_code=503, detail="Modelo YOLO nao carregado")
 
     # Ler imagem
-    image_bytes = await file.read()
-    try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Imagem invalida: {e}")
+    with profiling.stage("decode"):
+        image_bytes = await file.read()
+        try:
+            # Fecha o arquivo decodificado; so a copia RGB segue adiante
+            with Image.open(io.BytesIO(image_bytes)) as decoded:
+                image = decoded.convert("RGB")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Imagem invalida: {e}")
 
     img_width, img_height = image.size
+    return _run_inference(image, img_width, img_height, confidence, filters, connections, stride)
+
+
+@app.post("/predict/raw", response_model=PredictionResponse)
+async def predict_raw(
+    file: Optional[UploadFile] = File(None, description="Array .npy uint8 com shape (H, W, 3)"),
+    shm_name: Optional[str] = Form(None, description="Nome do segmento POSIX de shared memory"),
+    shape: Optional[str] = Form(None, description="Shape do segmento, ex: 1080,1920,3"),
+    dtype: str = Form("uint8", description="Tipo dos pixels (apenas uint8)"),
+    channels: str = Query("rgb", pattern="^(rgb|bgr)$", description="Ordem dos canais do buffer"),
+    confidence: float = Query(
+        0.05, ge=postprocess.MIN_CONFIDENCE, le=1.0, description="Threshold minimo de confianca"
+    ),
+    filters: Dict = Depends(post_filter_params),
+    connections: bool = Query(False, description="Extrair conexoes entre componentes localmente"),
+    stride: bool = Query(False, description="Anexar ameacas STRIDE do cache de templates"),
+):
+    """
+    Inferencia sobre pixels brutos, para chamadores no mesmo host.
 
-    # Inferencia
+    Aceita um upload .npy ou o nome de um segmento de shared memory
+    (com shape e dtype). Os pixels vao ao modelo sem decode PNG nem
+    conversao PIL; com channels=bgr, sem nenhuma copia.
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail="Modelo YOLO nao carregado")
+
+    if (file is None) == (shm_name is None):
+        raise HTTPException(status_code=400, detail="Envie exatamente um: file (.npy) ou shm_name")
+
+    try:
+        with profiling.stage("decode"):
+            if file is not None:
+                array = ingest.array_from_npy(await file.read())
+            else:
+                if not shape:
+                    raise ValueError("shape obrigatorio com shm_name")
+                array = ingest.array_from_shm(shm_name, shape, dtype)
+            source = ingest.to_model_layout(array, channels)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Buffer invalido: {e}")
+
+    img_height, img_width = source.shape[:2]
+    return _run_inference(source, img_width, img_height, confidence, filters, connections, stride)
+
+
+@app.post("/merge", response_model=MergeResponse)
+async def merge_detections(request: MergeRequest):
+    """
+    Fase 3 do pipeline hibrido: combina deteccoes YOLO e componentes do
+    Claude Vision, marcando cada componente como hybrid, claude ou yolo.
+
+    Tipos YOLO sao resolvidos via YOLO_TO_BACKEND_TYPE; o matching usa
+    indice espacial em grade + IoU vetorizado (componentes do Claude sem
+    bbox casam apenas por tipo).
+    """
     start_time = time.time()
-    results = model.predict(
-        source=image,
-        conf=confidence,
-        verbose=False,
+    yolo = request.yolo_detections
+    claude = request.claude_components
+
+    yolo_types = [YOLO_TO_BACKEND_TYPE.get(d.class_name, "external_service") for d in yolo]
+    claude_types = [YOLO_TO_BACKEND_TYPE.get(c.type, c.type) for c in claude]
+    _, type_ids = np.unique(np.array(yolo_types + claude_types, dtype=str), return_inverse=True)
+
+    yolo_xyxy = merge.xywh_to_xyxy([
+        (b.x_center, b.y_center, b.width, b.height) for b in (d.bbox_normalized for d in yolo)
+    ])
+    yolo_conf = np.array([d.confidence for d in yolo], dtype=np.float64)
+    claude_has_bbox = np.array([c.bbox_normalized is not None for c in claude], dtype=bool)
+    claude_xyxy = merge.xywh_to_xyxy([
+        (b.x_center, b.y_center, b.width, b.height) if b is not None else (0.0, 0.0, 0.0, 0.0)
+        for b in (c.bbox_normalized for c in claude)
+    ])
+
+    match = merge.match_detections(
+        yolo_xyxy,
+        type_ids[:len(yolo)],
+        yolo_conf,
+        claude_xyxy,
+        type_ids[len(yolo):],
+        claude_has_bbox,
+        iou_threshold=request.iou_threshold,
     )
-    inference_time = (time.time() - start_time) * 1000  # ms
 
-    # Processar resultados
-    detections: List[Detection] = []
-    for result in results:
-        if result.boxes is None:
+    components: List[MergedComponent] = []
+    for comp, comp_type, yolo_idx in zip(claude, claude_types, match.tolist()):
+        if yolo_idx < 0:
+            components.append(MergedComponent(
+                name=comp.name,
+                type=comp_type,
+                description=comp.description,
+                detection_source="claude",
+                bbox_normalized=comp.bbox_normalized,
+            ))
             continue
-        for box in result.boxes:
-            class_id = int(box.cls[0])
-            class_name = CATEGORY_NAMES.get(class_id, f"class_{class_id}")
+        det = yolo[yolo_idx]
+        components.append(MergedComponent(
+            name=comp.name,
+            type=comp_type,
+            description=comp.description,
+            detection_source="hybrid",
+            confidence=det.confidence,
+            yolo_class=det.class_name,
+            bbox_normalized=det.bbox_normalized,
+        ))
+
+    unmatched = np.ones(len(yolo), dtype=bool)
+    unmatched[match[match >= 0]] = False
+    yolo_only = np.flatnonzero(unmatched & (yolo_conf >= request.yolo_min_confidence))
+    for yolo_idx in yolo_only[np.argsort(-yolo_conf[yolo_only], kind="stable")].tolist():
+        det = yolo[yolo_idx]
+        components.append(MergedComponent(
+            name=det.class_name,
+            type=yolo_types[yolo_idx],
+            detection_source="yolo",
+            confidence=det.confidence,
+            yolo_class=det.class_name,
+            bbox_normalized=det.bbox_normalized,
+        ))
+
+    by_source = {"hybrid": 0, "claude": 0, "yolo": 0}
+    for comp in components:
+        by_source[comp.detection_source] += 1
+
+    return MergeResponse(
+        merge_time_ms=round((time.time() - start_time) * 1000, 2),
+        components=components,
+        by_source=by_source,
+    )
+
+
+@app.get("/stride/templates", response_model=List[str])
+async def stride_template_types():
+    """Backend types cobertos pelo cache de templates STRIDE."""
+    return stride_templates.get_store().backend_types
+
+
+@app.get("/stride/templates/{backend_type}", response_model=StrideTemplateResponse)
+async def stride_template(
+    backend_type: str,
+    neighbors: Optional[str] = Query(None, description="Tipos vizinhos separados por virgula, ex: user,waf"),
+):
+    """
+    Ameacas STRIDE pre-computadas para um tipo de componente.
 
-            # Coordenadas normalizadas (0-1) - formato YOLO
-            xywhn = box.xywhn[0]
-            x_center = float(xywhn[0])
-            y_center = float(xywhn[1])
-            w = float(xywhn[2])
-            h = float(xywhn[3])
+    404 indica tipo sem template: o backend deve recorrer ao LLM.
+    """
+    store = stride_templates.get_store()
+    neighbor_list = sorted({n.strip() for n in (neighbors or "").split(",") if n.strip()})
+    threats = store.threats_for(backend_type, neighbor_list)
+    if threats is None:
+        raise HTTPException(status_code=404, detail=f"Sem template STRIDE para: {backend_type}")
+    return StrideTemplateResponse(
+        backend_type=backend_type,
+        neighbors=neighbor_list,
+        version=store.version,
+        threats=[StrideThreat(**t) for t in threats],
+    )
+
+
+def _run_inference(
+    source,
+    img_width: int,
+    img_height: int,
+    confidence: float,
+    filters: Optional[Dict] = None,
+    with_connections: bool = False,
+    with_stride: bool = False,
+) -> PredictionResponse:
+    """Executa o modelo sobre uma imagem PIL ou array BGR e monta a resposta."""
+    filters = filters or {}
+    class_conf = filters.get("class_conf") or {}
 
-            # Coordenadas em pixels
-            xyxy = box.xyxy[0]
-            x1 = int(xyxy[0])
-            y1 = int(xyxy[1])
-            x2 = int(xyxy[2])
-            y2 = int(xyxy[3])
+    # Thresholds por classe abaixo do global exigem que o modelo os devolva
+    model_conf = min([confidence, *class_conf.values()])
 
+    # Inferencia
+    with profiling.stage("inference"):
+        start_time = time.time()
+        results = model.predict(
+            source=source,
+            conf=model_conf,
+            verbose=False,
+        )
+        inference_time = (time.time() - start_time) * 1000  # ms
+
+    # Extrair arrays uma vez por imagem (sem indexar tensores box a box)
+    # e aplicar o pos-filtro
+    with profiling.stage("postprocess"):
+        xyxy_all, xywhn_all, conf_all, cls_all = [], [], [], []
+        for result in results:
+            if result.boxes is None:
+                continue
+            boxes = result.boxes.cpu().numpy()
+            xyxy_all.append(boxes.xyxy)
+            xywhn_all.append(boxes.xywhn)
+            conf_all.append(boxes.conf)
+            cls_all.append(boxes.cls.astype(np.int64))
+        del results
+
+        if xyxy_all:
+            xyxy = np.concatenate(xyxy_all)
+            xywhn = np.concatenate(xywhn_all)
+            conf = np.concatenate(conf_all)
+            cls = np.concatenate(cls_all)
+        else:
+            xyxy = xywhn = np.zeros((0, 4), dtype=np.float32)
+            conf = np.zeros(0, dtype=np.float32)
+            cls = np.zeros(0, dtype=np.int64)
+
+        # Pos-filtro: thresholds por classe, NMS por backend_type, top-k por classe
+        thresholds = postprocess.class_thresholds(len(CLASS_GROUPS), confidence, class_conf)
+        keep = postprocess.post_filter(
+            xyxy,
+            conf,
+            cls,
+            thresholds,
+            groups=CLASS_GROUPS,
+            group_iou=filters.get("group_iou"),
+            max_per_class=filters.get("max_per_class"),
+        )
+
+    # Processar resultados (ja ordenados por confianca, maior primeiro)
+    with profiling.stage("serialize"):
+        xywhn_kept = np.round(xywhn[keep].astype(np.float64), 6).tolist()
+        xyxy_kept = xyxy[keep].astype(np.int64).tolist()
+        conf_kept = np.round(conf[keep].astype(np.float64), 4).tolist()
+
+        detections: List[Detection] = []
+        for class_id, score, (x_center, y_center, w, h), (x1, y1, x2, y2) in zip(
+            cls[keep].tolist(), conf_kept, xywhn_kept, xyxy_kept
+        ):
+            class_name = CATEGORY_NAMES.get(class_id, f"class_{class_id}")
             detections.append(
                 Detection(
                     class_id=class_id,
                     class_name=class_name,
                     backend_type=YOLO_TO_BACKEND_TYPE.get(class_name, "external_service"),
-                    confidence=round(float(box.conf[0]), 4),
+                    confidence=score,
                     bbox_normalized=BoundingBox(
-                        x_center=round(x_center, 6),
-                        y_center=round(y_center, 6),
-                        width=round(w, 6),
-                        height=round(h, 6),
+                        x_center=x_center,
+                        y_center=y_center,
+                        width=w,
+                        height=h,
                     ),
                     bbox_pixels=BoundingBoxPixels(x1=x1, y1=y1, x2=x2, y2=y2),
                 )
             )
 
-    # Ordenar por confianca (maior primeiro)
-    detections.sort(key=lambda d: d.confidence, reverse=True)
+    # Conexoes locais (alternativa rapida as conexoes do Claude Vision)
+    connections = None
+    if with_connections:
+        with profiling.stage("connections"):
+            found = edges.extract_connections(edges.to_gray(source), xyxy[keep])
+            connections = [
+                Connection(from_id=c["from"] + 1, to_id=c["to"] + 1, bidirectional=c["bidirectional"])
+                for c in found
+            ]
+
+    # Ameacas STRIDE pre-computadas (vizinhos vem das conexoes, se extraidas)
+    if with_stride:
+        with profiling.stage("stride"):
+            store = stride_templates.get_store()
+            neighbors = stride_templates.neighbor_types(
+                len(detections),
+                [(c.from_id - 1, c.to_id - 1) for c in connections or []],
+                [d.backend_type for d in detections],
+            )
+            for det, det_neighbors in zip(detections, neighbors):
+                threats = store.threats_for(det.backend_type, det_neighbors)
+                if threats is not None:
+                    det.stride = [StrideThreat(**t) for t in threats]
 
     return PredictionResponse(
         model="architecture-detector-yolov8n-v2",
@@ -298,6 +659,7 @@ async def predict(
         image_size={"width": img_width, "height": img_height},
         detections=detections,
         total_detections=len(detections),
+        connections=connections,
     )
 
 
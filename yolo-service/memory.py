@@ -0,0 +1,286 @@
+"""
+Instrumentacao de memoria do servico de inferencia.
+
+Investiga o crescimento lento de RSS apos milhares de /predict
+(suspeitos: imagens PIL e `Results` do ultralytics vivos alem da
+requisicao):
+
+- RSS do processo (sempre disponivel, via /proc ou resource)
+- por requisicao: pico e memoria retida (tracemalloc), quando o tracing
+  esta ligado (YOLO_TRACEMALLOC=N frames no startup, ou via admin)
+- snapshots do tracemalloc guardados em memoria e diffs entre eles
+- contagem de objetos vivos dos tipos suspeitos
+
+Com tracing ligado, pico/retido de requisicoes concorrentes se misturam;
+para numeros limpos, use uma requisicao por vez (scripts/soak_test.py).
+"""
+
+import gc
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Quantos snapshots do tracemalloc manter (cada um pode ter dezenas de MB)
+MAX_SNAPSHOTS = 5
+
+# Janela de requisicoes recentes para as estatisticas por requisicao
+RECENT_REQUESTS = 200
+
+# Tipos contados em live_objects(): (modulo, nome da classe)
+TRACKED_TYPES = (
+    ("PIL.Image", "Image"),
+    ("ultralytics.engine.results", "Results"),
+    ("ultralytics.engine.results", "Boxes"),
+    ("numpy", "ndarray"),
+)
+
+# Frames por alocacao no tracemalloc ligado no startup (0 = desligado)
+TRACEMALLOC_FRAMES = int(os.environ.get("YOLO_TRACEMALLOC", "0"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """RSS atual do processo (cai para o pico do processo fora do Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss e em KB no Linux e em bytes no macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start_tracing(frames: int = 1) -> bool:
+    """Liga o tracemalloc. False se ja estava ligado."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_tracing():
+    """Desliga o tracemalloc (snapshots guardados continuam validos)."""
+    tracemalloc.stop()
+
+
+# ---------------------------------------------------------------------------
+# Por requisicao
+# ---------------------------------------------------------------------------
+
+class RequestMemory:
+    """Pico e memoria retida de uma requisicao (tracemalloc + RSS)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tracing = tracemalloc.is_tracing()
+        self.peak_bytes: Optional[int] = None
+        self.retained_bytes: Optional[int] = None
+        self.rss_delta_bytes = 0
+        self._start_traced = 0
+        self._start_rss = 0
+
+    def __enter__(self) -> "RequestMemory":
+        self._start_rss = rss_bytes()
+        if self.tracing:
+            tracemalloc.reset_peak()
+            self._start_traced = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        if self.tracing and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_bytes = max(peak - self._start_traced, 0)
+            self.retained_bytes = current - self._start_traced
+        self.rss_delta_bytes = rss_bytes() - self._start_rss
+        _record(self)
+        return False
+
+    def as_dict(self) -> Dict:
+        return {
+            "path": self.path,
+            "peak_bytes": self.peak_bytes,
+            "retained_bytes": self.retained_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+        }
+
+
+_recent: deque = deque(maxlen=RECENT_REQUESTS)
+_totals = {"requests": 0, "retained_bytes": 0, "rss_delta_bytes": 0}
+_recent_lock = threading.Lock()
+
+
+def _record(req: RequestMemory):
+    with _recent_lock:
+        _recent.append(req.as_dict())
+        _totals["requests"] += 1
+        _totals["retained_bytes"] += req.retained_bytes or 0
+        _totals["rss_delta_bytes"] += req.rss_delta_bytes
+
+
+def request_stats() -> Dict:
+    """Totais desde o startup e resumo das requisicoes recentes."""
+    with _recent_lock:
+        recent = list(_recent)
+        totals = dict(_totals)
+
+    traced = [r for r in recent if r["peak_bytes"] is not None]
+    summary = {"requests": len(recent), "traced": len(traced)}
+    if traced:
+        peaks = sorted(r["peak_bytes"] for r in traced)
+        retained = [r["retained_bytes"] for r in traced]
+        summary.update({
+            "peak_bytes_p50": peaks[len(peaks) // 2],
+            "peak_bytes_max": peaks[-1],
+            "retained_bytes_total": sum(retained),
+            "retained_bytes_mean": sum(retained) // len(retained),
+        })
+    return {"since_startup": totals, "recent": summary, "last": recent[-10:]}
+
+
+# ---------------------------------------------------------------------------
+# Snapshots do tracemalloc
+# ---------------------------------------------------------------------------
+
+_snapshots: "OrderedDict[str, Dict]" = OrderedDict()
+_snapshots_lock = threading.Lock()
+_snapshot_ids = itertools.count(1)
+
+# Alocacoes do proprio tracemalloc e do import system poluem os diffs
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _stat_dict(stat, group_by: str) -> Dict:
+    if group_by == "traceback":
+        location = stat.traceback.format()
+    elif group_by == "filename":
+        location = stat.traceback[0].filename
+    else:
+        location = str(stat.traceback[0])
+    entry = {"location": location, "size_bytes": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+def take_snapshot(label: str = "") -> Dict:
+    """Tira um snapshot (exige tracing ligado) e guarda no buffer."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc desligado")
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    info = {
+        "id": f"s{next(_snapshot_ids)}",
+        "label": label,
+        "taken_at": time.time(),
+        "rss_bytes": rss_bytes(),
+        "traced_bytes": sum(stat.size for stat in snapshot.statistics("filename")),
+        "traceback_limit": snapshot.traceback_limit,
+    }
+    with _snapshots_lock:
+        _snapshots[info["id"]] = {"info": info, "snapshot": snapshot}
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return info
+
+
+def list_snapshots() -> List[Dict]:
+    with _snapshots_lock:
+        return [entry["info"] for entry in _snapshots.values()]
+
+
+def _get_snapshot(snapshot_id: str):
+    with _snapshots_lock:
+        entry = _snapshots.get(snapshot_id)
+    if entry is None:
+        raise KeyError(snapshot_id)
+    return entry["snapshot"]
+
+
+def snapshot_top(snapshot_id: str, group_by: str = "lineno", limit: int = 25) -> List[Dict]:
+    """Maiores alocacoes vivas no snapshot."""
+    stats = _get_snapshot(snapshot_id).statistics(group_by)
+    return [_stat_dict(stat, group_by) for stat in stats[:limit]]
+
+
+def snapshot_diff(base_id: str, snapshot_id: str, group_by: str = "lineno", limit: int = 25) -> Dict:
+    """Alocacoes que mais cresceram de base_id para snapshot_id."""
+    base, current = _get_snapshot(base_id), _get_snapshot(snapshot_id)
+    stats = current.compare_to(base, group_by)
+    return {
+        "base": base_id,
+        "snapshot": snapshot_id,
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "top": [_stat_dict(stat, group_by) for stat in stats[:limit]],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Objetos vivos
+# ---------------------------------------------------------------------------
+
+def live_objects() -> Dict[str, int]:
+    """Quantidade de instancias vivas dos tipos em TRACKED_TYPES."""
+    tracked = {}
+    for module_name, class_name in TRACKED_TYPES:
+        cls = getattr(sys.modules.get(module_name), class_name, None)
+        if isinstance(cls, type):
+            tracked[cls] = f"{module_name}.{class_name}"
+
+    counts = dict.fromkeys(tracked.values(), 0)
+    if not tracked:
+        return counts
+    # Subclasses (ex: PngImageFile) contam para a classe base
+    classes = tuple(tracked)
+    with warnings.catch_warnings():
+        # isinstance() em modulos lazy/deprecados (torch) emite avisos
+        warnings.simplefilter("ignore")
+        for obj in gc.get_objects():
+            if isinstance(obj, classes):
+                for cls, name in tracked.items():
+                    if isinstance(obj, cls):
+                        counts[name] += 1
+    return counts
+
+
+def collect_garbage() -> Dict:
+    """Roda gc.collect() e mede o RSS antes e depois."""
+    before = rss_bytes()
+    collected = gc.collect()
+    return {
+        "collected": collected,
+        "uncollectable": len(gc.garbage),
+        "rss_before_bytes": before,
+        "rss_after_bytes": rss_bytes(),
+    }
+
+
+def summary() -> Dict:
+    tracing = tracemalloc.is_tracing()
+    traced_current, traced_peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+    return {
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "tracing": tracing,
+        "traceback_limit": tracemalloc.get_traceback_limit() if tracing else None,
+        "traced_bytes": traced_current,
+        "traced_peak_bytes": traced_peak,
+        "gc_counts": gc.get_count(),
+        "requests": request_stats(),
+    }
@@ -0,0 +1,240 @@
+"""
+Motor de merge YOLO + Claude Vision (Fase 3 do pipeline hibrido).
+
+Casa boxes YOLO com componentes do Claude por tipo do backend e IoU:
+
+- hybrid: componente do Claude confirmado por uma deteccao YOLO
+- claude: componente so do Claude
+- yolo:   deteccao so do YOLO (acima da confianca minima)
+
+Os pares candidatos saem de um indice espacial em grade (grid buckets):
+so boxes que compartilham celula sao comparados, e o IoU e calculado
+vetorizado sobre todos os pares de uma vez. Boxes que cobrem muitas
+celulas (um container "vpc" do tamanho da imagem entre boxes pequenos)
+nao sao expandidos: entram como candidatos de todos os boxes do outro
+lado, o que limita a memoria a O(pares) e nao O(celulas). A atribuicao 1:1 e feita em
+rodadas de "melhor mutuo", cada rodada sobre o array inteiro, sem laco
+O(n*m) em Python.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Piso do lado da celula (coordenadas normalizadas): 256 x 256 celulas
+MIN_CELL_SIZE = 1 / 256
+# Acima disso o box fica fora da grade e e comparado com todos
+MAX_CELLS_PER_BOX = 64
+
+
+class GridIndex:
+    """
+    Indice espacial em grade para boxes xyxy.
+
+    Cada box e registrado em todas as celulas que cobre; consultas juntam
+    (box, celula) por celula via searchsorted. Boxes com mais de
+    MAX_CELLS_PER_BOX celulas ficam em uma lista a parte (forca bruta).
+    """
+
+    def __init__(self, xyxy: np.ndarray, cell_size: Optional[float] = None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        if cell_size is None:
+            cell_size = self._auto_cell_size(self.xyxy)
+        self.cell_size = float(cell_size)
+
+        box_idx, cells, self._large = self._expand(self.xyxy)
+        order = np.argsort(cells, kind="stable")
+        self._cells = cells[order]
+        self._box_idx = box_idx[order]
+
+    @staticmethod
+    def _auto_cell_size(xyxy: np.ndarray) -> float:
+        if len(xyxy) == 0:
+            return 1.0
+        extent = np.maximum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1])
+        size = float(np.median(extent)) * 2
+        return max(size, MIN_CELL_SIZE) if size > 0 else 1.0
+
+    def _expand(self, xyxy: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pares (indice do box, id da celula) para cada celula coberta, e os
+        indices dos boxes grandes demais para expandir.
+        """
+        if len(xyxy) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+
+        lo = np.floor(xyxy[:, :2] / self.cell_size).astype(np.int64)
+        hi = np.floor(xyxy[:, 2:] / self.cell_size).astype(np.int64)
+        hi = np.maximum(hi, lo)
+        nx = hi[:, 0] - lo[:, 0] + 1
+        ny = hi[:, 1] - lo[:, 1] + 1
+        counts = nx * ny
+        large = np.flatnonzero(counts > MAX_CELLS_PER_BOX)
+        counts[large] = 0
+
+        box_idx = np.repeat(np.arange(len(xyxy)), counts)
+        # posicao de cada celula dentro do retangulo de celulas do seu box
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = lo[box_idx, 0] + offset % nx[box_idx]
+        cy = lo[box_idx, 1] + offset // nx[box_idx]
+        return box_idx, _cell_key(cx, cy), large
+
+    def candidate_pairs(self, query_xyxy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Pares unicos (indice da consulta, indice do box) que dividem celula."""
+        query_xyxy = np.asarray(query_xyxy, dtype=np.float64).reshape(-1, 4)
+        n = len(self.xyxy)
+        q_idx, q_cells, q_large = self._expand(query_xyxy)
+        if len(query_xyxy) == 0 or n == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        start = np.searchsorted(self._cells, q_cells, side="left")
+        stop = np.searchsorted(self._cells, q_cells, side="right")
+        counts = stop - start
+
+        pair_q = np.repeat(q_idx, counts)
+        pos = np.repeat(start, counts) + (
+            np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        pair_b = self._box_idx[pos]
+
+        # Forca bruta: consultas grandes x todos os boxes, todas as consultas x boxes grandes
+        keys = [
+            pair_q * n + pair_b,
+            (q_large[:, None] * n + np.arange(n)).ravel(),
+            (np.arange(len(query_xyxy))[:, None] * n + self._large).ravel(),
+        ]
+        # Boxes que dividem varias celulas geram pares repetidos
+        pairs = np.unique(np.concatenate(keys))
+        return pairs // n, pairs % n
+
+
+def _cell_key(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    # Coordenadas de celula cabem com folga em 31 bits
+    return (cx + (1 << 30)) * (1 << 31) + (cy + (1 << 30))
+
+
+def paired_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU elemento a elemento entre boxes xyxy a[i] e b[i]."""
+    tl = np.maximum(a[:, :2], b[:, :2])
+    br = np.minimum(a[:, 2:], b[:, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=1)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-12)
+
+
+def xywh_to_xyxy(xywh: np.ndarray) -> np.ndarray:
+    xywh = np.asarray(xywh, dtype=np.float64).reshape(-1, 4)
+    half = xywh[:, 2:] / 2
+    return np.concatenate([xywh[:, :2] - half, xywh[:, :2] + half], axis=1)
+
+
+def first_per_group(groups: np.ndarray, *keys: np.ndarray) -> np.ndarray:
+    """Indice do primeiro elemento de cada grupo, na ordem dada por keys."""
+    if len(groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((*keys[::-1], groups))
+    sorted_groups = groups[order]
+    first = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    return order[first]
+
+
+def mutual_best_assignment(
+    pair_a: np.ndarray, pair_b: np.ndarray, score: np.ndarray, tiebreak: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Atribuicao 1:1 gulosa entre os lados a e b.
+
+    Em cada rodada, todo par que e o melhor (maior score) tanto para seu
+    `a` quanto para seu `b` e aceito; seus pares concorrentes saem. Produz
+    o mesmo resultado do guloso global por score, em poucas rodadas
+    vetorizadas.
+    """
+    matched_a, matched_b = [], []
+    alive = np.arange(len(pair_a))
+    while len(alive):
+        a, b = pair_a[alive], pair_b[alive]
+        s, t = -score[alive], -tiebreak[alive]
+        best_for_a = np.zeros(len(alive), dtype=bool)
+        best_for_a[first_per_group(a, s, t, b)] = True
+        best_for_b = np.zeros(len(alive), dtype=bool)
+        best_for_b[first_per_group(b, s, t, a)] = True
+
+        accepted = alive[best_for_a & best_for_b]
+        if len(accepted) == 0:
+            break
+        matched_a.append(pair_a[accepted])
+        matched_b.append(pair_b[accepted])
+
+        taken = np.isin(pair_a[alive], pair_a[accepted]) | np.isin(pair_b[alive], pair_b[accepted])
+        alive = alive[~taken]
+
+    if not matched_a:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(matched_a), np.concatenate(matched_b)
+
+
+def _rank_in_group(groups: np.ndarray, *keys: np.ndarray) -> np.ndarray:
+    """Posicao de cada elemento dentro do seu grupo, na ordem dada por keys."""
+    rank = np.zeros(len(groups), dtype=np.int64)
+    if len(groups) == 0:
+        return rank
+    order = np.lexsort((*keys[::-1], groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    run_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    rank[order] = np.arange(len(order)) - run_start
+    return rank
+
+
+def match_detections(
+    yolo_xyxy: np.ndarray,
+    yolo_types: np.ndarray,
+    yolo_conf: np.ndarray,
+    claude_xyxy: np.ndarray,
+    claude_types: np.ndarray,
+    claude_has_bbox: np.ndarray,
+    iou_threshold: float = 0.3,
+) -> np.ndarray:
+    """
+    Casa componentes do Claude com deteccoes YOLO do mesmo tipo.
+
+    Retorna, para cada componente do Claude, o indice da deteccao YOLO
+    casada ou -1. Componentes com bbox casam por IoU (indice espacial);
+    os sem bbox casam por tipo, na ordem de confianca do YOLO, com as
+    deteccoes que sobraram.
+    """
+    match = np.full(len(claude_types), -1, dtype=np.int64)
+    if len(yolo_types) == 0 or len(claude_types) == 0:
+        return match
+
+    # 1. Matching espacial: candidatos via grade, IoU vetorizado
+    with_bbox = np.flatnonzero(claude_has_bbox)
+    if len(with_bbox):
+        index = GridIndex(yolo_xyxy)
+        q, y = index.candidate_pairs(claude_xyxy[with_bbox])
+        c = with_bbox[q]
+        same_type = claude_types[c] == yolo_types[y]
+        c, y = c[same_type], y[same_type]
+        iou = paired_iou(claude_xyxy[c], yolo_xyxy[y])
+        ok = iou >= iou_threshold
+        c, y, iou = c[ok], y[ok], iou[ok]
+        matched_c, matched_y = mutual_best_assignment(c, y, iou, yolo_conf[y])
+        match[matched_c] = matched_y
+
+    # 2. Matching por tipo para componentes sem bbox
+    pending = np.flatnonzero((match < 0) & ~claude_has_bbox)
+    free = np.setdiff1d(np.arange(len(yolo_types)), match[match >= 0])
+    if len(pending) and len(free):
+        c_rank = _rank_in_group(claude_types[pending], pending)
+        y_rank = _rank_in_group(yolo_types[free], -yolo_conf[free])
+        stride = len(claude_types) + len(yolo_types) + 1
+        c_key = claude_types[pending] * stride + c_rank
+        y_key = yolo_types[free] * stride + y_rank
+        _, c_pos, y_pos = np.intersect1d(c_key, y_key, assume_unique=True, return_indices=True)
+        match[pending[c_pos]] = free[y_pos]
+
+    return match
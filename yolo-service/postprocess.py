@@ -0,0 +1,156 @@
+"""
+Pos-filtro vetorizado das deteccoes YOLO.
+
+Varias classes colapsam no mesmo backend_type (user/web_browser/mobile_app,
+vpc/subnet, ...) e o modelo costuma disparar mais de uma delas no mesmo
+icone. Este estagio opera sobre os arrays inteiros de uma imagem:
+
+1. threshold de confianca por classe
+2. NMS entre classes do mesmo grupo (backend_type)
+3. top-k por classe
+
+Nenhuma etapa itera por box em Python.
+"""
+
+import json
+from typing import Dict, Optional
+
+import numpy as np
+
+# Mesmo piso do parametro `confidence` de /predict
+MIN_CONFIDENCE = 0.01
+
+
+def group_lookup(category_names: Dict[int, str], backend_types: Dict[str, str]) -> np.ndarray:
+    """Array class_id -> id inteiro do grupo (backend_type)."""
+    groups: Dict[str, int] = {}
+    lookup = np.zeros(max(category_names) + 1, dtype=np.int64)
+    for class_id, name in category_names.items():
+        backend_type = backend_types.get(name, "external_service")
+        lookup[class_id] = groups.setdefault(backend_type, len(groups))
+    return lookup
+
+
+def parse_class_conf(raw: Optional[str], category_names: Dict[int, str]) -> Dict[int, float]:
+    """
+    Converte o JSON da query (ex: {"vpc": 0.3, "subnet": 0.25}) em
+    {class_id: threshold}. Aceita nomes ou ids de classe; thresholds
+    sao numeros (nao booleanos) entre MIN_CONFIDENCE e 1.
+    """
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"class_conf nao e JSON valido: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("class_conf deve ser um objeto {classe: threshold}")
+
+    name_to_id = {name: class_id for class_id, name in category_names.items()}
+    thresholds: Dict[int, float] = {}
+    for key, value in data.items():
+        class_id = name_to_id.get(key)
+        if class_id is None and str(key).isdigit() and int(key) in category_names:
+            class_id = int(key)
+        if class_id is None:
+            raise ValueError(f"classe desconhecida em class_conf: {key!r}")
+        # bool e subclasse de int: true viraria threshold 1.0
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if not valid or not MIN_CONFIDENCE <= value <= 1.0:
+            raise ValueError(f"threshold invalido para {key!r}: {value!r}")
+        thresholds[class_id] = float(value)
+    return thresholds
+
+
+def class_thresholds(n_classes: int, default: float, overrides: Dict[int, float]) -> np.ndarray:
+    """Array class_id -> threshold minimo de confianca."""
+    thresholds = np.full(n_classes, default, dtype=np.float32)
+    if overrides:
+        thresholds[list(overrides)] = list(overrides.values())
+    return thresholds
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Matriz IoU (len(a), len(b)) entre boxes xyxy."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def group_nms(xyxy: np.ndarray, conf: np.ndarray, groups: np.ndarray, iou: float) -> np.ndarray:
+    """
+    NMS guloso restrito a boxes do mesmo grupo. Retorna indices mantidos.
+
+    Usa torchvision.ops.batched_nms (dependencia do ultralytics) quando
+    disponivel; senao, a supressao e feita sobre a matriz IoU completa.
+    """
+    if len(xyxy) == 0:
+        return np.zeros(0, dtype=np.int64)
+    try:
+        import torch
+        from torchvision.ops import batched_nms
+    except ImportError:
+        return _group_nms_numpy(xyxy, conf, groups, iou)
+
+    keep = batched_nms(
+        torch.from_numpy(np.ascontiguousarray(xyxy, dtype=np.float32)),
+        torch.from_numpy(np.ascontiguousarray(conf, dtype=np.float32)),
+        torch.from_numpy(np.ascontiguousarray(groups, dtype=np.int64)),
+        iou,
+    )
+    return keep.numpy()
+
+
+def _group_nms_numpy(xyxy: np.ndarray, conf: np.ndarray, groups: np.ndarray, iou: float) -> np.ndarray:
+    order = np.argsort(-conf, kind="stable")
+    boxes = xyxy[order]
+    same_group = groups[order][:, None] == groups[order][None, :]
+    # Apenas boxes de maior confianca (triangulo superior) podem suprimir
+    overlaps = np.triu((box_iou(boxes, boxes) > iou) & same_group, k=1)
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i in np.flatnonzero(overlaps.any(axis=1)):
+        if not suppressed[i]:
+            suppressed |= overlaps[i]
+    return order[~suppressed]
+
+
+def top_k_per_class(conf: np.ndarray, cls: np.ndarray, k: int) -> np.ndarray:
+    """Indices das k boxes de maior confianca de cada classe."""
+    if len(conf) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((-conf, cls))
+    sorted_cls = cls[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cls[1:] != sorted_cls[:-1]])
+    run_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    rank = np.arange(len(order)) - run_start
+    return order[rank < k]
+
+
+def post_filter(
+    xyxy: np.ndarray,
+    conf: np.ndarray,
+    cls: np.ndarray,
+    thresholds: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    group_iou: Optional[float] = None,
+    max_per_class: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Aplica o pos-filtro completo. Retorna indices mantidos, ordenados por
+    confianca decrescente.
+    """
+    keep = np.flatnonzero(conf >= thresholds[cls])
+
+    if group_iou is not None and groups is not None and len(keep):
+        kept = group_nms(xyxy[keep], conf[keep], groups[cls[keep]], group_iou)
+        keep = keep[kept]
+
+    if max_per_class is not None and len(keep):
+        keep = keep[top_k_per_class(conf[keep], cls[keep], max_per_class)]
+
+    return keep[np.argsort(-conf[keep], kind="stable")]
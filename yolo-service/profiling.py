@@ -0,0 +1,275 @@
+"""
+Profiling do servico de inferencia.
+
+Dois modos, ambos restritos a administradores (ver admin.py):
+
+- Por requisicao (`?profile=1`): roda a requisicao sob cProfile e guarda
+  uma arvore de chamadas + tempos por estagio (decode, inference,
+  postprocess, serialize, ...). O id do perfil volta no header
+  X-Profile-Id e os estagios em Server-Timing.
+  `?timing=1` devolve so o Server-Timing, sem cProfile nem token.
+- Amostragem continua: uma thread captura as pilhas de todas as threads
+  em intervalo fixo durante uma janela de tempo e acumula pilhas no
+  formato "collapsed" (flamegraph.pl, speedscope, inferno).
+
+O cProfile e por thread: requisicoes concorrentes no mesmo event loop
+aparecem no mesmo perfil. Use em trafego baixo ou isole a instancia.
+"""
+
+import cProfile
+import io
+import itertools
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Quantos perfis por requisicao manter em memoria
+MAX_STORED_PROFILES = 20
+
+# Ramos da arvore abaixo desta fracao do tempo total sao podados
+MIN_TREE_FRACTION = 0.01
+MAX_TREE_DEPTH = 25
+
+_current_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("profile_stages", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Cronometra um estagio da requisicao atual (no-op sem profiling ativo)."""
+    stages = _current_stages.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def _func_label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # builtins: "<built-in method ...>"
+    return f"{filename}:{line}({name})"
+
+
+def call_tree(stats: pstats.Stats) -> Dict:
+    """
+    Converte pstats em arvore de chamadas (tempo cumulativo por aresta),
+    podando ramos com menos de MIN_TREE_FRACTION do total.
+    """
+    raw = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    callees: Dict[Tuple, Dict[Tuple, float]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+    total = sum(raw[f][3] for f in roots) or stats.total_tt or 1e-9
+
+    def build(func, cumulative: float, depth: int, path: frozenset) -> Dict:
+        node = {
+            "function": _func_label(func),
+            "cumulative_ms": round(cumulative * 1000, 3),
+            "self_ms": round(raw[func][2] * 1000, 3) if func in raw else 0.0,
+            "calls": raw[func][1] if func in raw else 0,
+            "children": [],
+        }
+        if depth >= MAX_TREE_DEPTH:
+            return node
+        children = sorted(callees.get(func, {}).items(), key=lambda kv: kv[1], reverse=True)
+        for child, child_time in children:
+            if child_time < total * MIN_TREE_FRACTION or child in path:
+                continue
+            node["children"].append(build(child, child_time, depth + 1, path | {child}))
+        return node
+
+    roots.sort(key=lambda f: raw[f][3], reverse=True)
+    return {
+        "total_ms": round(total * 1000, 3),
+        "roots": [build(f, raw[f][3], 0, frozenset([f])) for f in roots if raw[f][3] >= total * MIN_TREE_FRACTION],
+    }
+
+
+class StageTimings:
+    """Tempos por estagio de uma requisicao, sem cProfile (`?timing=1`)."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.wall_ms = 0.0
+        self._token = None
+        self._start = 0.0
+
+    def __enter__(self):
+        self._token = _current_stages.set(self.stages)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_ms = (time.perf_counter() - self._start) * 1000
+        _current_stages.reset(self._token)
+        return False
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.wall_ms:.2f}")
+        return ", ".join(parts)
+
+
+class RequestProfile(StageTimings):
+    """cProfile + tempos por estagio de uma requisicao."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.id = f"p{next(self._ids)}"
+        self.path = path
+        self._profiler = cProfile.Profile()
+
+    def __enter__(self) -> "RequestProfile":
+        super().__enter__()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self._profiler.disable()
+        return super().__exit__(*exc)
+
+    def report(self, top: int = 30) -> Dict:
+        stats = pstats.Stats(self._profiler)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(top)
+        return {
+            "id": self.id,
+            "path": self.path,
+            "wall_ms": round(self.wall_ms, 3),
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()},
+            "call_tree": call_tree(stats),
+            "top_cumulative": text.getvalue(),
+        }
+
+
+_profiles: "OrderedDict[str, Dict]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def store_profile(profile: RequestProfile) -> str:
+    report = profile.report()
+    with _profiles_lock:
+        _profiles[profile.id] = report
+        while len(_profiles) > MAX_STORED_PROFILES:
+            _profiles.popitem(last=False)
+    return profile.id
+
+
+def get_profile(profile_id: str) -> Optional[Dict]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> List[Dict]:
+    with _profiles_lock:
+        return [
+            {"id": p["id"], "path": p["path"], "wall_ms": p["wall_ms"]}
+            for p in _profiles.values()
+        ]
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem de pilhas (todas as threads).
+
+    A thread de amostragem so le sys._current_frames() a cada intervalo,
+    entao o custo e proporcional a frequencia, nao ao trafego.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        self.interval_s = 0.0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration_s: float, interval_s: float = 0.01) -> bool:
+        """Inicia uma janela de amostragem. False se ja estiver rodando."""
+        with self._lock:
+            if self.running:
+                return False
+            with self._data_lock:
+                self._stacks = Counter()
+                self.samples = 0
+            self.interval_s = interval_s
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration_s, interval_s), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self, duration_s: float, interval_s: float):
+        own_id = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + duration_s
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                sampled.append(";".join(reversed(stack)))
+            del frames
+            with self._data_lock:
+                self._stacks.update(sampled)
+                self.samples += 1
+            self._stop.wait(interval_s)
+        self.stopped_at = time.time()
+
+    def collapsed(self) -> str:
+        """Pilhas no formato collapsed: "raiz;...;folha contagem" por linha."""
+        with self._data_lock:
+            stacks = dict(self._stacks)
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(stacks.items())) + "\n"
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "interval_ms": round(self.interval_s * 1000, 3),
+            "unique_stacks": len(self._stacks),
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
+
+
+sampler = SamplingProfiler()
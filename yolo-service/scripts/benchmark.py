@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ponta a ponta do yolo-service.
+
+Reenvia as imagens de dataset/images para /predict com concorrencia
+configuravel e mede throughput e latencia (p50/p95/p99) no cliente e por
+estagio no servidor (decode, inference, postprocess, serialize, ...),
+lidos do header Server-Timing (`?timing=1`).
+
+Modos:
+- inprocess: app FastAPI no proprio processo (TestClient)
+- http:      servico ja rodando em --url
+
+Com --stub-model (so inprocess) o modelo e trocado por um stub que
+devolve deteccoes sinteticas instantaneamente: o que sobra e overhead de
+HTTP, decode, pos-filtro e serializacao.
+
+Com --baseline o resultado e comparado a um relatorio salvo; se algum
+p50/p95 ou o throughput piorar mais que --max-regression, sai com
+exit code 1.
+
+Uso:
+    python scripts/benchmark.py --stub-model --requests 500 --concurrency 4
+    python scripts/benchmark.py --mode http --url http://localhost:8000 --output bench.json
+    python scripts/benchmark.py --stub-model --baseline bench_baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+SERVICE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+IMAGES_DIR = SERVICE_DIR.parent / "dataset" / "images"
+
+PERCENTILES = (50, 95, 99)
+
+# Metricas comparadas contra o baseline (p99 oscila demais para gate)
+GATED_PERCENTILES = ("p50", "p95")
+
+
+# ---------------------------------------------------------------------------
+# Modelo stub
+# ---------------------------------------------------------------------------
+
+class _StubBoxes:
+    """Imita ultralytics Boxes: .cpu().numpy() e arrays xyxy/xywhn/conf/cls."""
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, width: int, height: int):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        wh = xyxy[:, 2:] - xyxy[:, :2]
+        center = xyxy[:, :2] + wh / 2
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        self.xywhn = np.concatenate([center, wh], axis=1) / scale
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self
+
+
+class _StubResult:
+    def __init__(self, boxes: _StubBoxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """Substitui o YOLO: deteccoes sinteticas fixas, sem inferencia."""
+
+    def __init__(self, detections: int = 20, num_classes: int = 30, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self._xy = rng.uniform(0.0, 0.85, size=(detections, 2)).astype(np.float32)
+        self._wh = rng.uniform(0.03, 0.15, size=(detections, 2)).astype(np.float32)
+        self._conf = rng.uniform(0.1, 0.99, size=detections).astype(np.float32)
+        self._cls = rng.integers(0, num_classes, size=detections).astype(np.float32)
+
+    def predict(self, source, conf: float = 0.25, verbose: bool = False):
+        if isinstance(source, np.ndarray):
+            height, width = source.shape[:2]
+        else:
+            width, height = source.size
+        scale = np.array([width, height], dtype=np.float32)
+        xyxy = np.concatenate([self._xy * scale, (self._xy + self._wh) * scale], axis=1)
+        keep = self._conf >= conf
+        return [_StubResult(_StubBoxes(xyxy[keep], self._conf[keep], self._cls[keep], width, height))]
+
+
+# ---------------------------------------------------------------------------
+# Clientes
+# ---------------------------------------------------------------------------
+
+def inprocess_client(stub_model: bool, stub_detections: int):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    if stub_model:
+        main.model = StubModel(stub_detections, num_classes=len(main.CATEGORY_NAMES))
+    else:
+        main.load_model()
+        if main.model is None:
+            print("Erro: modelo YOLO nao encontrado (use --stub-model)")
+            sys.exit(2)
+    # Sem o context manager o lifespan nao roda e o stub nao e sobrescrito
+    return TestClient(main.app)
+
+
+def http_client(url: str):
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=64)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    base = url.rstrip("/")
+
+    class _Client:
+        def post(self, path, **kwargs):
+            return session.post(f"{base}{path}", **kwargs)
+
+    return _Client()
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """'decode;dur=1.2, inference;dur=30.1' -> {'decode': 1.2, 'inference': 30.1}"""
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                stages[name] = float(value)
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    arr = np.asarray(values, dtype=np.float64)
+    summary = {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in PERCENTILES}
+    summary["mean"] = round(float(arr.mean()), 3)
+    summary["max"] = round(float(arr.max()), 3)
+    return summary
+
+
+def run(client, images: List[Path], args) -> Dict:
+    payloads = [(path.name, path.read_bytes()) for path in images]
+    params = {"timing": "1", "confidence": args.confidence}
+    if args.connections:
+        params["connections"] = "true"
+
+    def send(payload):
+        name, data = payload
+        start = time.perf_counter()
+        response = client.post("/predict", params=params, files={"file": (name, data)})
+        latency = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            return latency, None, response.status_code
+        return latency, parse_server_timing(response.headers.get("server-timing", "")), 200
+
+    # Aquecimento: primeiras chamadas pagam import/JIT/alocacao de buffers
+    for payload in payloads[: args.warmup]:
+        send(payload)
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors: Dict[int, int] = {}
+
+    work = itertools.islice(itertools.cycle(payloads), args.requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for latency, timing, status in pool.map(send, work):
+            if timing is None:
+                errors[status] = errors.get(status, 0) + 1
+                continue
+            latencies.append(latency)
+            for name, ms in timing.items():
+                stages.setdefault(name, []).append(ms)
+            if "total" in timing:
+                # Tempo fora do handler: transporte, parsing multipart, middlewares
+                stages.setdefault("overhead", []).append(max(latency - timing["total"], 0.0))
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"Erro: nenhuma requisicao bem-sucedida ({errors})")
+        sys.exit(2)
+
+    return {
+        "config": {
+            "mode": args.mode,
+            "stub_model": args.stub_model,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "images": len(images),
+            "connections": args.connections,
+            "confidence": args.confidence,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "errors": errors,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+    }
+
+
+def compare(report: Dict, baseline: Dict, max_regression: float, min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Regressoes acima do limite relativo (lista vazia = ok). Diferencas de
+    latencia menores que min_delta_ms sao ruido e nunca contam.
+    """
+    regressions = []
+    if report["config"] != baseline.get("config"):
+        print(f"Aviso: configuracao difere do baseline ({baseline.get('config')})")
+
+    def check(label: str, current: float, reference: float, higher_is_better: bool = False):
+        if reference <= 0:
+            return
+        change = (current - reference) / reference
+        if higher_is_better:
+            change = -change
+        significant = higher_is_better or abs(current - reference) >= min_delta_ms
+        marker = "REGRESSAO" if change > max_regression and significant else ""
+        print(f"  {label:<28} {reference:>10.2f} -> {current:>10.2f}  ({change:+.1%}) {marker}")
+        if marker:
+            regressions.append(f"{label}: {reference:.2f} -> {current:.2f} ({change:+.1%})")
+
+    check("throughput_rps", report["throughput_rps"], baseline.get("throughput_rps", 0), higher_is_better=True)
+    for p in GATED_PERCENTILES:
+        check(f"latency.{p}", report["latency_ms"][p], baseline.get("latency_ms", {}).get(p, 0))
+    for name, summary in report["stages_ms"].items():
+        reference = baseline.get("stages_ms", {}).get(name)
+        if reference is None:
+            continue
+        for p in GATED_PERCENTILES:
+            check(f"{name}.{p}", summary[p], reference.get(p, 0))
+    return regressions
+
+
+def print_report(report: Dict):
+    cfg = report["config"]
+    print(f"\nModo:        {cfg['mode']}{' (stub)' if cfg['stub_model'] else ''}, concorrencia {cfg['concurrency']}")
+    print(f"Requisicoes: {cfg['requests']} em {report['elapsed_s']}s, erros: {report['errors'] or 0}")
+    print(f"Throughput:  {report['throughput_rps']} req/s\n")
+    print(f"  {'estagio':<14}" + "".join(f"{name:>10}" for name in ("p50", "p95", "p99", "mean")))
+    rows = [("cliente", report["latency_ms"])] + list(report["stages_ms"].items())
+    for name, summary in rows:
+        print(f"  {name:<14}" + "".join(f"{summary[key]:>10.2f}" for key in ("p50", "p95", "p99", "mean")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do yolo-service")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL do servico (modo http)")
+    parser.add_argument("--stub-model", action="store_true", help="Modelo stub (isola HTTP/serializacao)")
+    parser.add_argument("--stub-detections", type=int, default=20, help="Deteccoes por imagem do stub")
+    parser.add_argument("--images", type=Path, default=IMAGES_DIR, help="Diretorio com diagramas")
+    parser.add_argument("--requests", type=int, default=200, help="Total de requisicoes medidas")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requisicoes simultaneas")
+    parser.add_argument("--warmup", type=int, default=5, help="Requisicoes de aquecimento (nao medidas)")
+    parser.add_argument("--confidence", type=float, default=0.05)
+    parser.add_argument("--connections", action="store_true", help="Incluir extracao de conexoes")
+    parser.add_argument("--output", type=Path, help="Salvar relatorio JSON neste caminho")
+    parser.add_argument("--baseline", type=Path, help="Relatorio de referencia para comparacao")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="Piora maxima tolerada (0.15 = 15%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Diferenca minima de latencia para contar")
+    args = parser.parse_args()
+
+    if args.stub_model and args.mode == "http":
+        print("Erro: --stub-model so vale no modo inprocess")
+        sys.exit(2)
+
+    images = sorted(p for p in args.images.rglob("*") if p.suffix.lower() in {".png", ".jpg", ".jpeg"})
+    if not images:
+        print(f"Erro: nenhuma imagem em {args.images}")
+        sys.exit(2)
+
+    print("=" * 50)
+    print("YOLO Service Benchmark")
+    print("=" * 50)
+
+    if args.mode == "inprocess":
+        client = inprocess_client(args.stub_model, args.stub_detections)
+    else:
+        client = http_client(args.url)
+
+    report = run(client, images, args)
+    print_report(report)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nRelatorio salvo em: {args.output}")
+
+    if args.baseline:
+        print(f"\nComparacao com {args.baseline} (limite {args.max_regression:.0%}):")
+        regressions = compare(
+            report, json.loads(args.baseline.read_text()), args.max_regression, args.min_delta_ms
+        )
+        if regressions:
+            print(f"\nFALHOU: {len(regressions)} regressao(oes)")
+            sys.exit(1)
+        print("\nOK: sem regressoes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark da extracao local de conexoes (edges.py) contra as conexoes
+anotadas em dataset/annotations/*.json.
+
+Usa os boxes anotados como deteccoes (isola a qualidade das arestas da
+qualidade do detector) e compara pares nao-direcionados de componentes.
+
+Uso:
+    python scripts/benchmark_edges.py
+    python scripts/benchmark_edges.py --limit 10 --output edges_benchmark.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+SERVICE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+import edges  # noqa: E402
+
+DATASET_DIR = SERVICE_DIR.parent / "dataset"
+ANNOTATIONS_DIR = DATASET_DIR / "annotations"
+IMAGES_DIR = DATASET_DIR / "images"
+
+
+def annotated_pairs(annotation: dict) -> dict:
+    """Pares nao-direcionados (indice, indice) -> (origem, destino) anotados."""
+    id_to_idx = {ann["id"]: i for i, ann in enumerate(annotation["annotations"])}
+    pairs = {}
+    for conn in annotation["connections"]:
+        a, b = id_to_idx.get(conn["from_id"]), id_to_idx.get(conn["to_id"])
+        if a is not None and b is not None and a != b:
+            pairs[(min(a, b), max(a, b))] = (a, b)
+    return pairs
+
+
+def annotation_boxes(annotation: dict, width: int, height: int) -> np.ndarray:
+    """Boxes xyxy em pixels a partir do bbox normalizado."""
+    xywh = np.array([ann["bbox"] for ann in annotation["annotations"]], dtype=np.float64).reshape(-1, 4)
+    scale = np.array([width, height, width, height])
+    half = xywh[:, 2:] / 2
+    return np.concatenate([xywh[:, :2] - half, xywh[:, :2] + half], axis=1) * scale
+
+
+def benchmark(limit: int = 0) -> dict:
+    rows = []
+    for ann_path in sorted(ANNOTATIONS_DIR.glob("*.json")):
+        annotation = json.loads(ann_path.read_text())
+        truth = annotated_pairs(annotation)
+        image_path = IMAGES_DIR / annotation["file_name"]
+        if not truth or not image_path.exists():
+            continue
+
+        with Image.open(image_path) as img:
+            gray = np.asarray(img.convert("L"))
+        height, width = gray.shape
+        boxes = annotation_boxes(annotation, width, height)
+
+        start = time.perf_counter()
+        found = edges.extract_connections(gray, boxes)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        predicted = {(min(c["from"], c["to"]), max(c["from"], c["to"])): c for c in found}
+        hits = predicted.keys() & truth.keys()
+        tp = len(hits)
+        directed = [p for p in hits if not predicted[p]["bidirectional"]]
+        direction_ok = sum(1 for p in directed if truth[p] == (predicted[p]["from"], predicted[p]["to"]))
+        rows.append({
+            "image": annotation["file_name"],
+            "components": len(boxes),
+            "truth": len(truth),
+            "predicted": len(predicted),
+            "true_positives": tp,
+            "directed": len(directed),
+            "direction_ok": direction_ok,
+            "time_ms": round(elapsed_ms, 2),
+        })
+        print(f"  {annotation['file_name']}: {tp}/{len(truth)} conexoes, {len(predicted)} preditas ({elapsed_ms:.0f}ms)")
+
+        if limit and len(rows) >= limit:
+            break
+
+    tp = sum(r["true_positives"] for r in rows)
+    n_pred = sum(r["predicted"] for r in rows)
+    n_truth = sum(r["truth"] for r in rows)
+    precision = tp / n_pred if n_pred else 0.0
+    recall = tp / n_truth if n_truth else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    n_directed = sum(r["directed"] for r in rows)
+    direction_accuracy = sum(r["direction_ok"] for r in rows) / n_directed if n_directed else 0.0
+    times = np.array([r["time_ms"] for r in rows]) if rows else np.zeros(1)
+
+    return {
+        "images": len(rows),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "direction_accuracy": round(direction_accuracy, 4),
+        "time_ms": {
+            "p50": round(float(np.percentile(times, 50)), 2),
+            "p95": round(float(np.percentile(times, 95)), 2),
+            "max": round(float(times.max()), 2),
+        },
+        "per_image": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da extracao local de conexoes")
+    parser.add_argument("--limit", type=int, default=0, help="Numero maximo de imagens (0 = todas)")
+    parser.add_argument("--output", type=Path, help="Salvar relatorio JSON neste caminho")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Edge Extraction Benchmark")
+    print("=" * 50)
+    report = benchmark(args.limit)
+
+    print(f"\nImagens:   {report['images']}")
+    print(f"Precision: {report['precision']:.3f}")
+    print(f"Recall:    {report['recall']:.3f}")
+    print(f"F1:        {report['f1']:.3f}")
+    print(f"Direcao:   {report['direction_accuracy']:.3f} (entre conexoes direcionadas corretas)")
+    print(f"Tempo:     p50={report['time_ms']['p50']}ms p95={report['time_ms']['p95']}ms")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nRelatorio salvo em: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Soak test de memoria do yolo-service.
+
+Envia os diagramas de dataset/images para /predict em sequencia,
+amostrando o RSS do servico (via /admin/memory, com gc.collect() antes)
+a cada N requisicoes e ao fim do aquecimento. Depois do aquecimento,
+ajusta uma reta as amostras: se o RSS segue crescendo (inclinacao acima
+do limite com a reta explicando a variacao, R^2 >= --min-r2) ou cresce
+mais que --max-growth-mb, o teste falha com exit code 1. Um vazamento
+lento e pego pela inclinacao mesmo somando poucos MB no total.
+
+Com --tracemalloc, liga o tracemalloc no servico, tira um snapshot ao
+fim do aquecimento e outro ao final, e imprime o diff (onde a memoria
+retida foi alocada).
+
+Uso:
+    YOLO_ADMIN_TOKEN=... uvicorn main:app --port 8000
+    YOLO_ADMIN_TOKEN=... python scripts/soak_test.py --requests 3000
+    python scripts/soak_test.py --token ... --tracemalloc --output soak.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import requests
+
+SERVICE_DIR = Path(__file__).parent.parent
+IMAGES_DIR = SERVICE_DIR.parent / "dataset" / "images"
+
+
+class ServiceClient:
+    def __init__(self, url: str, token: str, timeout: float = 60.0):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["X-Admin-Token"] = token
+        self.timeout = timeout
+
+    def _call(self, method: str, path: str, **kwargs):
+        response = self.session.request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def predict(self, image_path: Path, params: dict):
+        with open(image_path, "rb") as f:
+            return self._call("POST", "/predict", params=params, files={"file": (image_path.name, f)})
+
+    def rss_after_gc(self) -> int:
+        return self._call("POST", "/admin/memory/gc")["rss_after_bytes"]
+
+    def admin(self, method: str, path: str, **kwargs):
+        return self._call(method, f"/admin{path}", **kwargs)
+
+
+def growth_fit(requests_done: np.ndarray, rss: np.ndarray) -> Tuple[float, float]:
+    """Inclinacao (bytes por requisicao) e R^2 da reta de minimos quadrados."""
+    slope, intercept = np.polyfit(requests_done, rss, 1)
+    residual = rss - (slope * requests_done + intercept)
+    total = float(((rss - rss.mean()) ** 2).sum())
+    r2 = 1.0 - float((residual ** 2).sum()) / total if total > 0 else 0.0
+    return float(slope), r2
+
+
+def post_warmup_samples(total: int, warmup: int, every: int) -> int:
+    """Quantas amostras de RSS entram no ajuste (mesmos pontos que soak() amostra)."""
+    points = set(range(every, total + 1, every)) | {warmup, total}
+    return sum(1 for n in points if n >= warmup)
+
+
+def soak(client: ServiceClient, images: list, args) -> dict:
+    params = {"connections": "true"} if args.connections else {}
+    tracing = args.tracemalloc
+    if tracing and not client.admin("GET", "/memory")["tracing"]:
+        client.admin("POST", "/memory/tracemalloc/start", params={"frames": args.frames})
+
+    samples = [(0, client.rss_after_gc())]
+    base_snapshot = None
+    latencies = []
+    start = time.time()
+
+    for i, image_path in enumerate(itertools.islice(itertools.cycle(images), args.requests), start=1):
+        t0 = time.perf_counter()
+        client.predict(image_path, params)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        if i == args.warmup and tracing:
+            base_snapshot = client.admin("POST", "/memory/snapshots", params={"label": "warmup"})["id"]
+        if i % args.sample_every == 0 or i == args.requests or i == args.warmup:
+            rss = client.rss_after_gc()
+            samples.append((i, rss))
+            print(f"  {i:>6} requisicoes  RSS={rss / 2**20:8.1f} MB  p50={np.median(latencies[-args.sample_every:]):.0f}ms")
+
+    done = np.array([n for n, _ in samples if n >= args.warmup], dtype=np.float64)
+    rss = np.array([r for n, r in samples if n >= args.warmup], dtype=np.float64)
+    slope, r2 = growth_fit(done, rss)
+    growth = float(rss[-1] - rss[0])
+    leaking = (slope > args.max_slope_kb * 1024 and r2 >= args.min_r2) or growth > args.max_growth_mb * 2**20
+
+    report = {
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "images": len(images),
+        "elapsed_s": round(time.time() - start, 1),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 1),
+            "p95": round(float(np.percentile(latencies, 95)), 1),
+        },
+        "rss_start_mb": round(samples[0][1] / 2**20, 1),
+        "rss_end_mb": round(samples[-1][1] / 2**20, 1),
+        "growth_after_warmup_mb": round(growth / 2**20, 2),
+        "slope_kb_per_request": round(slope / 1024, 3),
+        "fit_r2": round(r2, 3),
+        "leaking": bool(leaking),
+        "samples": [{"requests": n, "rss_bytes": r} for n, r in samples],
+        "live_objects": client.admin("GET", "/memory/objects"),
+        "requests_memory": client.admin("GET", "/memory")["requests"]["recent"],
+    }
+
+    if base_snapshot is not None:
+        final = client.admin("POST", "/memory/snapshots", params={"label": "final"})["id"]
+        report["tracemalloc_diff"] = client.admin(
+            "GET", f"/memory/snapshots/{final}/diff", params={"base": base_snapshot, "limit": args.top}
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test de memoria do /predict")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL do yolo-service")
+    parser.add_argument("--token", default=os.environ.get("YOLO_ADMIN_TOKEN", ""), help="X-Admin-Token")
+    parser.add_argument("--images", type=Path, default=IMAGES_DIR, help="Diretorio com diagramas")
+    parser.add_argument("--requests", type=int, default=2000, help="Total de requisicoes")
+    parser.add_argument("--warmup", type=int, default=200, help="Requisicoes ignoradas no ajuste")
+    parser.add_argument("--sample-every", type=int, default=100, help="Amostrar RSS a cada N requisicoes")
+    parser.add_argument("--max-slope-kb", type=float, default=2.0, help="Crescimento maximo por requisicao (KB)")
+    parser.add_argument("--min-r2", type=float, default=0.5,
+                        help="R^2 minimo da reta para a inclinacao contar como vazamento (e nao ruido)")
+    parser.add_argument("--max-growth-mb", type=float, default=50.0,
+                        help="Crescimento maximo apos aquecimento (MB), qualquer que seja a inclinacao")
+    parser.add_argument("--connections", action="store_true", help="Incluir extracao de conexoes")
+    parser.add_argument("--tracemalloc", action="store_true", help="Diff de tracemalloc aquecimento -> final")
+    parser.add_argument("--frames", type=int, default=5, help="Frames por alocacao no tracemalloc")
+    parser.add_argument("--top", type=int, default=15, help="Linhas do diff de tracemalloc")
+    parser.add_argument("--output", type=Path, help="Salvar relatorio JSON neste caminho")
+    args = parser.parse_args()
+
+    if not args.token:
+        print("Erro: defina YOLO_ADMIN_TOKEN (ou --token); o RSS vem de /admin/memory")
+        sys.exit(2)
+    if args.warmup >= args.requests:
+        print("Erro: --warmup deve ser menor que --requests")
+        sys.exit(2)
+    n_samples = post_warmup_samples(args.requests, args.warmup, args.sample_every)
+    if n_samples < 3:
+        print(f"Erro: so {n_samples} amostras de RSS apos o aquecimento; o ajuste precisa de 3 "
+              "(aumente --requests ou diminua --sample-every)")
+        sys.exit(2)
+
+    images = sorted(p for p in args.images.rglob("*") if p.suffix.lower() in {".png", ".jpg", ".jpeg"})
+    if not images:
+        print(f"Erro: nenhuma imagem em {args.images}")
+        sys.exit(2)
+
+    print("=" * 50)
+    print("YOLO Service Memory Soak Test")
+    print("=" * 50)
+    print(f"{args.requests} requisicoes sobre {len(images)} imagens ({args.url})\n")
+
+    report = soak(ServiceClient(args.url, args.token), images, args)
+
+    print(f"\nRSS:         {report['rss_start_mb']} MB -> {report['rss_end_mb']} MB")
+    print(f"Crescimento: {report['growth_after_warmup_mb']} MB apos aquecimento")
+    print(f"Inclinacao:  {report['slope_kb_per_request']} KB/requisicao (limite {args.max_slope_kb}), "
+          f"R^2={report['fit_r2']}")
+    print(f"Objetos:     {report['live_objects']}")
+    for entry in report.get("tracemalloc_diff", {}).get("top", []):
+        print(f"  {entry['size_diff_bytes'] / 1024:+10.1f} KB  {entry['location']}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nRelatorio salvo em: {args.output}")
+
+    if report["leaking"]:
+        print("\nFALHOU: RSS continua crescendo apos o aquecimento")
+        sys.exit(1)
+    print("\nOK: memoria estavel")
+
+
+if __name__ == "__main__":
+    main()
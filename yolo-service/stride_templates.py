@@ -0,0 +1,106 @@
+"""
+Cache de templates de ameacas STRIDE por tipo de componente do backend.
+
+A analise STRIDE via Claude custa ~2-5s por componente, mas quase todos
+os componentes caem em um dos ~15 backend_type de YOLO_TO_BACKEND_TYPE.
+Os templates (stride_templates.json, semeados a partir de
+docs/stride-methodology.md) sao carregados uma vez e indexados em
+memoria por (backend_type, tipos vizinhos):
+
+- templates: 6 ameacas base por backend_type, uma por categoria STRIDE
+- neighbor_rules: ameacas extras quando o componente se conecta (ou nao)
+  a certos tipos, ex: banco de dados acessado direto pelo usuario
+
+Tipos sem template retornam None: o backend so chama o LLM para eles.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+TEMPLATES_PATH = Path(__file__).parent / "stride_templates.json"
+
+STRIDE_CATEGORIES = (
+    "Spoofing",
+    "Tampering",
+    "Repudiation",
+    "Information Disclosure",
+    "Denial of Service",
+    "Elevation of Privilege",
+)
+
+SEVERITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+
+class StrideTemplateStore:
+    """Indice em memoria dos templates STRIDE."""
+
+    def __init__(self, data: Dict):
+        self.version = data.get("version", "unknown")
+        defaults = data.get("default_countermeasures", {})
+
+        self._base: Dict[str, Tuple[Dict, ...]] = {}
+        for backend_type, threats in data.get("templates", {}).items():
+            self._base[backend_type] = tuple(
+                {**t, "countermeasure": t.get("countermeasure") or defaults.get(t["category"], "")}
+                for t in threats
+            )
+
+        self._rules: Dict[str, List[Dict]] = {}
+        for rule in data.get("neighbor_rules", []):
+            self._rules.setdefault(rule["type"], []).append(rule)
+
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    @classmethod
+    def from_file(cls, path: Path = TEMPLATES_PATH) -> "StrideTemplateStore":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def backend_types(self) -> List[str]:
+        return sorted(self._base)
+
+    def covers(self, backend_type: str) -> bool:
+        return backend_type in self._base
+
+    def _lookup(self, backend_type: str, neighbors: FrozenSet[str] = frozenset()) -> Optional[Tuple[Dict, ...]]:
+        base = self._base.get(backend_type)
+        if base is None:
+            return None
+
+        extra = [
+            {key: rule[key] for key in ("category", "threat", "severity", "countermeasure")}
+            for rule in self._rules.get(backend_type, []) + self._rules.get("*", [])
+            if neighbors.issuperset(rule.get("requires", []))
+            and neighbors.isdisjoint(rule.get("absent", []))
+        ]
+        threats = list(base) + extra
+        threats.sort(key=lambda t: (SEVERITY_ORDER.get(t["severity"], 99), STRIDE_CATEGORIES.index(t["category"])))
+        return tuple(threats)
+
+    def threats_for(self, backend_type: str, neighbors: Iterable[str] = ()) -> Optional[List[Dict]]:
+        """Ameacas do componente, ordenadas por severidade; None se sem template."""
+        threats = self.lookup(backend_type, frozenset(neighbors))
+        return None if threats is None else [dict(t) for t in threats]
+
+
+_store: Optional[StrideTemplateStore] = None
+
+
+def get_store() -> StrideTemplateStore:
+    """Store global, carregado na primeira chamada."""
+    global _store
+    if _store is None:
+        _store = StrideTemplateStore.from_file()
+    return _store
+
+
+def neighbor_types(n_components: int, edges: Iterable[Tuple[int, int]], types: List[str]) -> List[FrozenSet[str]]:
+    """Tipos vizinhos (grafo nao-direcionado) de cada componente."""
+    neighbors: List[set] = [set() for _ in range(n_components)]
+    for a, b in edges:
+        neighbors[a].add(types[b])
+        neighbors[b].add(types[a])
+    return [frozenset(n) for n in neighbors]